@@ -0,0 +1 @@
+# Пустой файл для обозначения пакета
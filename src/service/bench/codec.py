@@ -0,0 +1,147 @@
+"""
+Бенчмарк сериализации: стоимость encode/decode типичных кадров сервиса
+для stdlib json, orjson и MessagePack (доступные в окружении).
+
+    python -m src.service.bench.codec --sentences 200 --iterations 2000
+"""
+import json
+import time
+import random
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+
+from ..core import codec
+
+Encoder = Callable[[Any], Any]
+Decoder = Callable[[Any], Any]
+
+
+def metrics_payload(sentences: int = 50, seed: int = 0) -> Dict[str, Any]:
+    """Кадр метрик Neo API: общие оценки и разбор по предложениям"""
+    rng = random.Random(seed)
+    return {
+        "type": "metrics",
+        "message_id": "5f0c8a9e-7d1b-4c2e-9a3f-2b6d8e1f4a70",
+        "data": {
+            "status": "success",
+            "text": " ".join(f"Предложение номер {i} с несколькими словами." for i in range(sentences)),
+            "is_ai_generated": True,
+            "human_likeness_score": round(rng.random() * 100, 2),
+            "metrics": {
+                "perplexity": rng.random() * 50,
+                "burstiness": rng.random(),
+                "readability": {"flesch": rng.random() * 100, "grade": rng.randint(1, 16)},
+                "sentences": [
+                    {
+                        "index": i,
+                        "ai_probability": rng.random(),
+                        "tokens": rng.randint(5, 40),
+                        "flags": ["repetition", "generic"][: rng.randint(0, 2)],
+                    }
+                    for i in range(sentences)
+                ],
+            },
+        },
+    }
+
+
+def chat_payload() -> Dict[str, Any]:
+    """Ответ /chat без метрик"""
+    return {
+        "id": "5f0c8a9e-7d1b-4c2e-9a3f-2b6d8e1f4a70",
+        "message": "Ответ модели " * 40,
+        "status": "success",
+        "cached": False,
+        "attempts": 1,
+        "prompt": {"messages": 6, "tokens": 812, "trimmed": 0, "summarized": False},
+        "metrics": {"status": "pending"},
+    }
+
+
+def token_payload() -> Dict[str, Any]:
+    """Кадр стриминга токена"""
+    return {"type": "token", "message_id": "5f0c8a9e-7d1b-4c2e-9a3f-2b6d8e1f4a70", "token": " слово"}
+
+
+def available_codecs() -> Dict[str, Tuple[Encoder, Decoder]]:
+    """Пары (encode, decode) для всех форматов, установленных в окружении"""
+    stdlib = codec.JsonCodec()
+    codecs: Dict[str, Tuple[Encoder, Decoder]] = {
+        'json': (stdlib.dumpb, stdlib.loads),
+    }
+    if codec.orjson is not None:
+        fast = codec.OrjsonCodec()
+        codecs['orjson'] = (fast.dumpb, fast.loads)
+    if codec.msgpack is not None:
+        codecs['msgpack'] = (
+            lambda obj: codec.msgpack.packb(obj, use_bin_type=True),
+            lambda data: codec.msgpack.unpackb(data, raw=False),
+        )
+    return codecs
+
+
+def _timeit(func: Callable[[Any], Any], arg: Any, iterations: int) -> float:
+    """Среднее время одного вызова, мкс (лучший из трех прогонов)"""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e6
+
+
+def run(sentences: int = 50, iterations: int = 1000) -> Dict[str, Any]:
+    """
+    Отчет: для каждого кадра и формата - размер, время encode и decode
+    (мкс) и ускорение относительно stdlib json.
+    """
+    payloads = {
+        'token': token_payload(),
+        'chat': chat_payload(),
+        'metrics': metrics_payload(sentences),
+    }
+    codecs = available_codecs()
+    report: Dict[str, Any] = {"iterations": iterations, "sentences": sentences, "payloads": {}}
+    for name, payload in payloads.items():
+        rows: Dict[str, Dict[str, float]] = {}
+        for codec_name, (encode, decode) in codecs.items():
+            encoded = encode(payload)
+            assert decode(encoded) == json.loads(json.dumps(payload))
+            rows[codec_name] = {
+                "bytes": len(encoded),
+                "encode_us": round(_timeit(encode, payload, iterations), 3),
+                "decode_us": round(_timeit(decode, encoded, iterations), 3),
+            }
+        base = rows['json']
+        for row in rows.values():
+            row["encode_speedup"] = round(base["encode_us"] / row["encode_us"], 2) if row["encode_us"] else 0.0
+            row["decode_speedup"] = round(base["decode_us"] / row["decode_us"], 2) if row["decode_us"] else 0.0
+        report["payloads"][name] = rows
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines: List[str] = [f"iterations: {report['iterations']}, metrics sentences: {report['sentences']}"]
+    for name, rows in report['payloads'].items():
+        for codec_name, row in rows.items():
+            lines.append(
+                f"{name:<8} {codec_name:<8} {row['bytes']:>8} B  "
+                f"encode {row['encode_us']:>9.2f} us (x{row['encode_speedup']:<5})  "
+                f"decode {row['decode_us']:>9.2f} us (x{row['decode_speedup']:<5})"
+            )
+    return '\n'.join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк кодеков JSON/MessagePack")
+    parser.add_argument('--sentences', type=int, default=50, help="предложений в кадре метрик")
+    parser.add_argument('--iterations', type=int, default=1000, help="вызовов на замер")
+    parser.add_argument('--json', action='store_true', help="вывод отчета в JSON")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    report = run(args.sentences, args.iterations)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
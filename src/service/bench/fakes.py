@@ -0,0 +1,321 @@
+import re
+import json
+import math
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from typing import Any, Dict, Optional
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Метка в тексте сообщения, по которой стенд сопоставляет ответ бота с запросом драйвера
+BENCH_MARKER = re.compile(r'\[bench:(\d+)\]')
+
+
+class LatencyModel:
+    """
+    Распределение задержки ответа.
+
+    Формат строки: "kind:mean_ms[:spread]", где kind - fixed, uniform
+    (mean ± spread*mean), exponential или lognormal (spread - sigma).
+    """
+
+    KINDS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+    def __init__(self, kind: str = 'fixed', mean_ms: float = 0.0, spread: float = 0.5) -> None:
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind = kind
+        self.mean = mean_ms / 1000
+        self.spread = spread
+
+    @classmethod
+    def parse(cls, spec: str) -> 'LatencyModel':
+        parts = spec.split(':')
+        kind = parts[0]
+        mean_ms = float(parts[1]) if len(parts) > 1 else 0.0
+        spread = float(parts[2]) if len(parts) > 2 else 0.5
+        return cls(kind, mean_ms, spread)
+
+    def sample(self) -> float:
+        """Задержка в секундах"""
+        if self.mean <= 0:
+            return 0.0
+        if self.kind == 'uniform':
+            return max(0.0, random.uniform(self.mean * (1 - self.spread), self.mean * (1 + self.spread)))
+        if self.kind == 'exponential':
+            return random.expovariate(1 / self.mean)
+        if self.kind == 'lognormal':
+            # mu подобрано так, чтобы среднее распределения равнялось mean
+            mu = math.log(self.mean) - self.spread ** 2 / 2
+            return random.lognormvariate(mu, self.spread)
+        return self.mean
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{self.mean * 1000:g}:{self.spread:g}"
+
+
+class UpstreamProfile:
+    """Поведение фейкового API: задержка и доли ошибок 500, 429 и 503"""
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        unavailable_rate: float = 0.0,
+        retry_after: float = 1.0,
+    ) -> None:
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.unavailable_rate = unavailable_rate
+        self.retry_after = retry_after
+
+    def inject(self) -> Optional[web.Response]:
+        """Случайная ошибка согласно профилю или None"""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                status=429,
+                headers={'Retry-After': f"{self.retry_after:g}"}
+            )
+        roll -= self.rate_limit_rate
+        if roll < self.unavailable_rate:
+            return web.json_response(
+                {"error": {"message": "Service unavailable"}},
+                status=503,
+                headers={'Retry-After': f"{self.retry_after:g}"}
+            )
+        roll -= self.unavailable_rate
+        if roll < self.error_rate:
+            return web.json_response({"error": {"message": "Internal error"}}, status=500)
+        return None
+
+
+class FakeUpstreams:
+    """
+    Локальный стенд Groq, Neo и Telegram Bot API.
+
+    Все три API обслуживаются одним aiohttp-приложением:
+    /openai/v1/chat/completions, /analyze и /bot<token>/<method>.
+    Сервис направляется на стенд переменными GROQ_API_BASE,
+    NEO_API_BASE и TELEGRAM_API_BASE (см. env()).
+    """
+
+    def __init__(
+        self,
+        groq: Optional[UpstreamProfile] = None,
+        neo: Optional[UpstreamProfile] = None,
+        telegram: Optional[UpstreamProfile] = None,
+        reply_words: int = 40,
+    ) -> None:
+        self.profiles = {
+            'groq': groq or UpstreamProfile(),
+            'neo': neo or UpstreamProfile(),
+            'telegram': telegram or UpstreamProfile(),
+        }
+        self.reply_words = reply_words
+        self.requests: Counter = Counter()
+        self.statuses: Dict[str, Counter] = {name: Counter() for name in self.profiles}
+        # Время доставки ответа бота по номеру из метки [bench:N]
+        self.deliveries: Dict[int, float] = {}
+        self.webhook_url = ''
+        self.base_url = ''
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/openai/v1/chat/completions', self.handle_groq)
+        app.router.add_post('/analyze', self.handle_neo)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_telegram)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запуск стенда; возвращает базовый URL"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        # Порт, выбранный ОС при port=0
+        bound_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{bound_port}"
+        logger.info(f"Fake upstreams listening on {self.base_url}")
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def env(self, base_url: Optional[str] = None) -> Dict[str, str]:
+        """Переменные окружения, направляющие сервис на стенд"""
+        base = base_url or self.base_url
+        return {
+            'GROQ_API_BASE': f"{base}/openai/v1",
+            'NEO_API_BASE': base,
+            'TELEGRAM_API_BASE': base,
+            # Результаты фейкового анализа не попадают в журнал аналитики
+            'ANALYTICS_DB': ':memory:',
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {"requests": self.requests[name], "statuses": dict(self.statuses[name])}
+            for name in self.profiles
+        }
+
+    async def _simulate(self, name: str) -> Optional[web.Response]:
+        """Задержка и инъекция ошибок для очередного запроса"""
+        self.requests[name] += 1
+        profile = self.profiles[name]
+        delay = profile.latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        failure = profile.inject()
+        if failure is not None:
+            self.statuses[name][failure.status] += 1
+        return failure
+
+    def _reply_text(self, messages: list) -> str:
+        """Ответ модели: последнее сообщение пользователя и слова-заполнители"""
+        last = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        filler = ' '.join(f"word{i}" for i in range(self.reply_words))
+        return f"{last} {filler}".strip()
+
+    async def handle_groq(self, request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        stream = bool(data.get('stream'))
+        if not stream:
+            failure = await self._simulate('groq')
+            if failure is not None:
+                return failure
+        content = self._reply_text(data.get('messages') or [])
+
+        if not stream:
+            self.statuses['groq'][200] += 1
+            prompt_tokens = sum(len(m.get('content', '')) // 4 for m in data.get('messages') or [])
+            completion_tokens = len(content) // 4
+            return web.json_response({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "model": data.get('model'),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+
+        # Стриминг: задержка профиля делится между первым токеном и остальными
+        self.requests['groq'] += 1
+        profile = self.profiles['groq']
+        failure = profile.inject()
+        if failure is not None:
+            self.statuses['groq'][failure.status] += 1
+            return failure
+        self.statuses['groq'][200] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        tokens = [t + ' ' for t in content.split(' ')]
+        total = profile.latency.sample()
+        await asyncio.sleep(total / 2)
+        for token in tokens:
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            await asyncio.sleep(total / 2 / len(tokens))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_neo(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        failure = await self._simulate('neo')
+        if failure is not None:
+            return failure
+        self.statuses['neo'][200] += 1
+        text = data.get('text', '')
+        score = random.random()
+        return web.json_response({
+            "is_ai_generated": score < 0.5,
+            "human_likeness_score": round(score * 100, 2),
+            "metrics": {"length": len(text), "words": len(text.split())}
+        })
+
+    async def handle_telegram(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+            data.update(request.query)
+
+        failure = await self._simulate('telegram')
+        if failure is not None:
+            return failure
+        self.statuses['telegram'][200] += 1
+
+        if method == 'getWebhookInfo':
+            return web.json_response({"ok": True, "result": {"url": self.webhook_url, "pending_update_count": 0}})
+        if method == 'setWebhook':
+            self.webhook_url = data.get('url', '')
+            return web.json_response({"ok": True, "result": True, "description": "Webhook was set"})
+        if method == 'sendMessage':
+            match = BENCH_MARKER.search(str(data.get('text', '')))
+            if match:
+                self.deliveries[int(match.group(1))] = asyncio.get_running_loop().time()
+            return web.json_response({"ok": True, "result": {"message_id": self.requests['telegram'], "chat": {"id": data.get('chat_id')}}})
+        return web.json_response({"ok": True, "result": True})
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры профилей стенда для командной строки"""
+    defaults = {'groq': 'lognormal:300:0.4', 'neo': 'lognormal:150:0.4', 'telegram': 'fixed:20'}
+    for name, latency in defaults.items():
+        parser.add_argument(f'--{name}-latency', default=latency, help="kind:mean_ms[:spread]")
+        parser.add_argument(f'--{name}-error-rate', type=float, default=0.0, help="доля ответов 500")
+        parser.add_argument(f'--{name}-429-rate', type=float, default=0.0, help="доля ответов 429")
+        parser.add_argument(f'--{name}-503-rate', type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After для 429/503, сек")
+    parser.add_argument('--reply-words', type=int, default=40)
+
+
+def fakes_from_args(args: argparse.Namespace) -> FakeUpstreams:
+    profiles = {}
+    for name in ('groq', 'neo', 'telegram'):
+        profiles[name] = UpstreamProfile(
+            latency=LatencyModel.parse(getattr(args, f'{name}_latency')),
+            error_rate=getattr(args, f'{name}_error_rate'),
+            rate_limit_rate=getattr(args, f'{name}_429_rate'),
+            unavailable_rate=getattr(args, f'{name}_503_rate'),
+            retry_after=args.retry_after,
+        )
+    return FakeUpstreams(reply_words=args.reply_words, **profiles)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    fakes = fakes_from_args(args)
+    await fakes.start(args.host, args.port)
+    for key, value in fakes.env().items():
+        print(f"{key}={value}")
+    try:
+        await asyncio.Future()
+    finally:
+        await fakes.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный стенд Groq/Neo/Telegram API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_profile_arguments(parser)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
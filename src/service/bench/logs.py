@@ -0,0 +1,132 @@
+"""
+Бенчмарк логирования: сколько времени event loop тратит на строки лога
+горячего пути (ответ Neo API, апдейт Telegram, рассылка метрик) при
+разных настройках. Записи пишутся во временный файл.
+
+    python -m src.service.bench.logs --iterations 2000 --sentences 50
+"""
+import json
+import time
+import queue
+import asyncio
+import logging
+import argparse
+import tempfile
+import logging.handlers
+from typing import Any, Callable, Dict, List
+
+from ..core.logs import TEXT_FORMAT, DeferredQueueHandler, Payload, SamplingFilter, TruncatingFormatter, sample
+from .codec import metrics_payload
+
+LogCall = Callable[[logging.Logger, int, Dict[str, Any]], None]
+
+
+def eager_calls(log: logging.Logger, i: int, data: Dict[str, Any]) -> None:
+    """Прежний вариант: f-строки и json.dumps с отступами на каждый вызов"""
+    log.info(f"Starting analysis of text: {data['data']['text'][:50]}...")
+    log.info(f"Got API response: {json.dumps(data, indent=2)}")
+    log.info(f"Broadcasting metrics for message {i}")
+
+
+def lazy_calls(log: logging.Logger, i: int, data: Dict[str, Any]) -> None:
+    """Текущий вариант: аргументы %-формата, Payload и ключи семплирования"""
+    log.info("Starting analysis of text: %.50s...", data['data']['text'], extra=sample('neo.request'))
+    log.info("Got API response: %s", Payload(data), extra=sample('neo.response'))
+    log.info("Broadcasting metrics for message %s", i, extra=sample('broadcast'))
+
+
+def _scenario(name: str, path: str, max_length: int, rate: float):
+    """Обработчик логгера для сценария и функция остановки (дожидается записи)"""
+    stream = logging.FileHandler(path)
+    if name == 'sync':
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+        return stream, stream.close
+    stream.setFormatter(TruncatingFormatter(max_length=max_length))
+    if name == 'sync_lazy':
+        return stream, stream.close
+
+    log_queue: queue.Queue = queue.Queue()
+    handler = DeferredQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    if name == 'queue_sampled':
+        handler.addFilter(SamplingFilter(rate=rate))
+
+    def stop() -> None:
+        listener.stop()
+        stream.close()
+    return handler, stop
+
+
+SCENARIOS: Dict[str, LogCall] = {
+    'sync': eager_calls,
+    'sync_lazy': lazy_calls,
+    'queue': lazy_calls,
+    'queue_sampled': lazy_calls,
+}
+
+
+async def _measure(log: logging.Logger, calls: LogCall, iterations: int, data: Dict[str, Any]) -> float:
+    """Время event loop на итерацию (три строки лога), мкс"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        calls(log, i, data)
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run(iterations: int = 1000, sentences: int = 50, max_length: int = 2000, rate: float = 10.0) -> Dict[str, Any]:
+    """Отчет: время loop на итерацию, полное время с дозаписью и объем файла"""
+    data = metrics_payload(sentences)
+    log = logging.getLogger('bench.logs')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    report: Dict[str, Any] = {"iterations": iterations, "sentences": sentences, "scenarios": {}}
+    for name, calls in SCENARIOS.items():
+        with tempfile.NamedTemporaryFile(suffix='.log') as target:
+            handler, stop = _scenario(name, target.name, max_length, rate)
+            log.addHandler(handler)
+            started = time.perf_counter()
+            try:
+                loop_us = asyncio.run(_measure(log, calls, iterations, data))
+            finally:
+                log.removeHandler(handler)
+                stop()
+            total_us = (time.perf_counter() - started) / iterations * 1e6
+            target.seek(0, 2)
+            report["scenarios"][name] = {
+                "loop_us_per_iter": round(loop_us, 2),
+                "total_us_per_iter": round(total_us, 2),
+                "bytes_written": target.tell(),
+            }
+    base = report["scenarios"]['sync']["loop_us_per_iter"]
+    for row in report["scenarios"].values():
+        row["loop_speedup"] = round(base / row["loop_us_per_iter"], 1) if row["loop_us_per_iter"] else 0.0
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines: List[str] = [f"iterations: {report['iterations']}, metrics sentences: {report['sentences']}"]
+    for name, row in report['scenarios'].items():
+        lines.append(
+            f"{name:<14} loop {row['loop_us_per_iter']:>9.2f} us/iter (x{row['loop_speedup']:<6})  "
+            f"total {row['total_us_per_iter']:>9.2f} us/iter  written {row['bytes_written']:>10} B"
+        )
+    return '\n'.join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк стоимости логирования на event loop")
+    parser.add_argument('--iterations', type=int, default=1000, help="итераций (по три строки лога)")
+    parser.add_argument('--sentences', type=int, default=50, help="предложений в ответе Neo API")
+    parser.add_argument('--max-length', type=int, default=2000, help="LOG_MAX_LENGTH")
+    parser.add_argument('--sample-rate', type=float, default=10.0, help="LOG_SAMPLE_RATE")
+    parser.add_argument('--json', action='store_true', help="вывод отчета в JSON")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    report = run(args.iterations, args.sentences, args.max_length, args.sample_rate)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -0,0 +1,354 @@
+"""
+Нагрузочный драйвер сервиса.
+
+Запускает /chat, вебхук Telegram и WebSocket-подписчиков с заданной
+параллельностью и печатает пропускную способность, перцентили задержек
+и задержку event loop (драйвера и сервиса).
+
+    # стенд + сервис в отдельном процессе, без обращения к платным API
+    python -m src.service.bench.main --spawn --duration 30 --concurrency 50
+
+    # уже запущенный сервис
+    python -m src.service.bench.main --target http://127.0.0.1:8000 --ws-url ws://127.0.0.1:8001
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import websockets
+
+from ..core.loop import LoopLagMonitor, summarize
+from .fakes import FakeUpstreams, add_profile_arguments, fakes_from_args
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+
+class Recorder:
+    """Задержки и статусы одного типа запросов"""
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors = 0
+
+    def record(self, status: Any, elapsed: float, ok: bool) -> None:
+        self.statuses[str(status)] += 1
+        if ok:
+            self.latencies.append(elapsed * 1000)
+        else:
+            self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        total = sum(self.statuses.values())
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "throughput_rps": round(total / duration, 2) if duration > 0 else 0.0,
+            "latency_ms": summarize(self.latencies),
+            "statuses": dict(self.statuses),
+        }
+
+
+class LoadConfig:
+    """Параметры прогона"""
+
+    def __init__(
+        self,
+        target: str,
+        ws_url: Optional[str] = None,
+        duration: float = 10.0,
+        requests: int = 0,
+        concurrency: int = 10,
+        webhook_concurrency: int = 0,
+        ws_subscribers: int = 0,
+        webhook_path: str = '/getmemore',
+    ) -> None:
+        self.target = target.rstrip('/')
+        self.ws_url = ws_url
+        self.duration = duration
+        # requests > 0 - фиксированное число запросов на каждый сценарий вместо duration
+        self.requests = requests
+        self.concurrency = concurrency
+        self.webhook_concurrency = webhook_concurrency
+        self.ws_subscribers = ws_subscribers
+        self.webhook_path = webhook_path
+
+
+class LoadDriver:
+    def __init__(self, config: LoadConfig, fakes: Optional[FakeUpstreams] = None) -> None:
+        self.config = config
+        # Стенд в том же процессе позволяет замерить доставку ответов бота
+        self.fakes = fakes
+        self.chat = Recorder()
+        self.webhook = Recorder()
+        self.ws_frames: Counter = Counter()
+        self.ws_connected = 0
+        self.loop_lag = LoopLagMonitor(interval=0.01)
+        self._webhook_sent: Dict[int, float] = {}
+
+    def _next(self, counter: 'itertools.count[int]', deadline: float) -> Optional[int]:
+        """Номер следующего запроса или None, если прогон закончен"""
+        n = next(counter)
+        if self.config.requests > 0:
+            return n if n < self.config.requests else None
+        return n if time.monotonic() < deadline else None
+
+    def _session_id(self, n: int) -> str:
+        subscribers = self.config.ws_subscribers
+        return f"bench-{n % subscribers}" if subscribers else f"bench-{n}"
+
+    async def _chat_worker(self, session: aiohttp.ClientSession, counter: 'itertools.count[int]', deadline: float) -> None:
+        url = f"{self.config.target}/chat"
+        while (n := self._next(counter, deadline)) is not None:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json={"message": f"bench message {n}", "session_id": self._session_id(n)}) as response:
+                    await response.read()
+                    self.chat.record(response.status, time.perf_counter() - started, response.status == 200)
+            except Exception as e:
+                self.chat.record(type(e).__name__, time.perf_counter() - started, False)
+
+    async def _webhook_worker(self, session: aiohttp.ClientSession, counter: 'itertools.count[int]', deadline: float) -> None:
+        url = f"{self.config.target}{self.config.webhook_path}"
+        loop = asyncio.get_running_loop()
+        while (n := self._next(counter, deadline)) is not None:
+            update = {
+                "update_id": 10_000_000 + n,
+                "message": {"message_id": n, "chat": {"id": n % 100}, "text": f"bench update [bench:{n}]"}
+            }
+            started = time.perf_counter()
+            self._webhook_sent[n] = loop.time()
+            try:
+                async with session.post(url, json=update) as response:
+                    await response.read()
+                    self.webhook.record(response.status, time.perf_counter() - started, response.status == 200)
+            except Exception as e:
+                self.webhook.record(type(e).__name__, time.perf_counter() - started, False)
+
+    async def _subscriber(self, ws_url: str, k: int, ready: asyncio.Event, connected: List[int]) -> None:
+        try:
+            async with websockets.connect(ws_url) as ws:
+                await ws.send(json.dumps({"type": "subscribe", "session_id": f"bench-{k}"}))
+                connected.append(k)
+                if len(connected) >= self.config.ws_subscribers:
+                    ready.set()
+                while True:
+                    frame = json.loads(await ws.recv())
+                    kind = frame.get('type', 'unknown')
+                    # Локальная оценка до ответа Neo API считается отдельно от окончательных метрик
+                    if kind == 'metrics' and (frame.get('data') or {}).get('provisional'):
+                        kind = 'metrics_provisional'
+                    self.ws_frames[kind] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"WebSocket subscriber {k} failed: {e}")
+            self.ws_frames['disconnect'] += 1
+
+    async def _fetch_health(self, session: aiohttp.ClientSession) -> Dict[str, Any]:
+        try:
+            async with session.get(f"{self.config.target}/health") as response:
+                health: Dict[str, Any] = await response.json()
+                return health
+        except Exception as e:
+            logger.warning(f"Health check failed: {e}")
+            return {}
+
+    def _delivery_summary(self) -> Optional[Dict[str, Any]]:
+        """Задержка от отправки апдейта до sendMessage на стенде"""
+        if self.fakes is None or not self._webhook_sent:
+            return None
+        latencies = [
+            (self.fakes.deliveries[n] - sent) * 1000
+            for n, sent in self._webhook_sent.items() if n in self.fakes.deliveries
+        ]
+        return {"delivered": len(latencies), "latency_ms": summarize(latencies)}
+
+    async def run(self) -> Dict[str, Any]:
+        config = self.config
+        connector = aiohttp.TCPConnector(limit=0)
+        subscribers: List[asyncio.Task] = []
+        async with aiohttp.ClientSession(connector=connector) as session:
+            ws_url = config.ws_url
+            if config.ws_subscribers and ws_url:
+                ready = asyncio.Event()
+                connected: List[int] = []
+                subscribers = [
+                    asyncio.create_task(self._subscriber(ws_url, k, ready, connected))
+                    for k in range(config.ws_subscribers)
+                ]
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Only {len(connected)} WebSocket subscribers connected")
+                self.ws_connected = len(connected)
+
+            self.loop_lag.start()
+            started = time.monotonic()
+            deadline = started + config.duration
+            chat_counter = itertools.count()
+            webhook_counter = itertools.count()
+            workers = [self._chat_worker(session, chat_counter, deadline) for _ in range(config.concurrency)]
+            workers += [self._webhook_worker(session, webhook_counter, deadline) for _ in range(config.webhook_concurrency)]
+            await asyncio.gather(*workers)
+            elapsed = time.monotonic() - started
+            await self.loop_lag.stop()
+
+            # Даем фоновой обработке (анализ, апдейты бота) закончиться
+            await asyncio.sleep(0.5)
+            for task in subscribers:
+                task.cancel()
+            await asyncio.gather(*subscribers, return_exceptions=True)
+
+            health = await self._fetch_health(session)
+
+        stats = health.get('stats', {})
+        report: Dict[str, Any] = {
+            "duration_s": round(elapsed, 3),
+            "chat": self.chat.summary(elapsed),
+            "driver_loop_lag_ms": self.loop_lag.stats(),
+            "service_loop_lag_ms": stats.get('event_loop_lag_ms'),
+        }
+        if config.webhook_concurrency:
+            report["webhook"] = self.webhook.summary(elapsed)
+            report["webhook"]["delivery"] = self._delivery_summary()
+        if config.ws_subscribers:
+            report["websocket"] = {"subscribers": self.ws_connected, "frames": dict(self.ws_frames)}
+        if self.fakes is not None:
+            report["upstreams"] = self.fakes.stats()
+        return report
+
+
+async def spawn_service(env: Dict[str, str], port: int, ws_port: int, timeout: float = 30.0, show_logs: bool = False) -> asyncio.subprocess.Process:
+    """Запуск сервиса в отдельном процессе и ожидание /health"""
+    output = None if show_logs else asyncio.subprocess.DEVNULL
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'src.service.main',
+        cwd=str(PROJECT_ROOT),
+        env={**os.environ, **env, 'SERVICE_PORT': str(port), 'WS_PORT': str(ws_port)},
+        stdout=output,
+        stderr=output,
+    )
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                raise RuntimeError(f"Service exited with code {process.returncode}")
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                    if response.status == 200:
+                        return process
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Service did not become healthy in time")
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"duration: {report['duration_s']}s"]
+
+    def latency_line(name: str, section: Dict[str, Any]) -> None:
+        lat = section['latency_ms']
+        lines.append(
+            f"{name:<10} {section['requests']:>7} req  {section['errors']:>5} err  "
+            f"{section['throughput_rps']:>8.1f} rps  "
+            f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f}  max {lat['max']:>8.1f} ms"
+        )
+
+    latency_line('chat', report['chat'])
+    if 'webhook' in report:
+        latency_line('webhook', report['webhook'])
+        delivery = report['webhook'].get('delivery')
+        if delivery:
+            lat = delivery['latency_ms']
+            lines.append(
+                f"{'delivery':<10} {delivery['delivered']:>7} msg  "
+                f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f} ms"
+            )
+    if 'websocket' in report:
+        ws = report['websocket']
+        lines.append(f"websocket  {ws['subscribers']} subscribers, frames: {ws['frames']}")
+    for name in ('driver_loop_lag_ms', 'service_loop_lag_ms'):
+        lag = report.get(name)
+        if lag:
+            lines.append(f"{name}: p50 {lag['p50']} p99 {lag['p99']} max {lag['max']}")
+    if 'upstreams' in report:
+        for name, stats in report['upstreams'].items():
+            lines.append(f"upstream {name}: {stats['requests']} requests, statuses {stats['statuses']}")
+    return '\n'.join(lines)
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    fakes: Optional[FakeUpstreams] = None
+    process: Optional[asyncio.subprocess.Process] = None
+    target, ws_url = args.target, args.ws_url
+    try:
+        if args.spawn:
+            fakes = fakes_from_args(args)
+            await fakes.start(port=args.fakes_port)
+            env = {
+                **fakes.env(),
+                'GROQ_API_KEY': 'bench',
+                'NEO_API_KEY': 'bench',
+                'TELEGRAM_BOT_TOKEN': 'bench',
+            }
+            process = await spawn_service(env, args.service_port, args.ws_port, show_logs=args.service_logs)
+            target = f"http://127.0.0.1:{args.service_port}"
+            ws_url = f"ws://127.0.0.1:{args.ws_port}"
+
+        config = LoadConfig(
+            target=target,
+            ws_url=ws_url,
+            duration=args.duration,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            webhook_concurrency=args.webhook_concurrency,
+            ws_subscribers=args.ws_subscribers,
+        )
+        return await LoadDriver(config, fakes).run()
+    finally:
+        if process is not None and process.returncode is None:
+            process.terminate()
+            await process.wait()
+        if fakes is not None:
+            await fakes.stop()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса NeonChat")
+    parser.add_argument('--target', default='http://127.0.0.1:8000', help="HTTP URL сервиса")
+    parser.add_argument('--ws-url', default='ws://127.0.0.1:8001', help="WebSocket URL сервиса")
+    parser.add_argument('--spawn', action='store_true', help="запустить стенд и сервис локально")
+    parser.add_argument('--service-port', type=int, default=18000)
+    parser.add_argument('--ws-port', type=int, default=18001)
+    parser.add_argument('--fakes-port', type=int, default=18100)
+    parser.add_argument('--service-logs', action='store_true', help="не скрывать логи запущенного сервиса")
+    parser.add_argument('--duration', type=float, default=10.0, help="длительность прогона, сек")
+    parser.add_argument('--requests', type=int, default=0, help="число запросов на сценарий (вместо --duration)")
+    parser.add_argument('--concurrency', type=int, default=10, help="параллельные клиенты /chat")
+    parser.add_argument('--webhook-concurrency', type=int, default=0, help="параллельные отправители апдейтов Telegram")
+    parser.add_argument('--ws-subscribers', type=int, default=0, help="число WebSocket-подписчиков")
+    parser.add_argument('--json', action='store_true', help="вывод отчета в JSON")
+    add_profile_arguments(parser)
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Обрыв запросов к стенду при остановке сервиса - ожидаемый шум
+    logging.getLogger('aiohttp.server').setLevel(logging.CRITICAL)
+    report = asyncio.run(main(args))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
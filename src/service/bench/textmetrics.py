@@ -0,0 +1,74 @@
+"""
+Бенчмарк локальных метрик текста: время на текст при разном размере
+пакета и длине текста.
+
+    python -m src.service.bench.textmetrics --batch 1,16,128 --sentences 8
+"""
+import json
+import time
+import random
+import argparse
+from typing import Any, Dict, List, Sequence
+
+from ..neoapi.local import LocalAnalyzer
+
+_WORDS = (
+    "модель ответ текст данные запрос анализ результат метрика сервис пользователь "
+    "the a model answer request analysis result service user quickly carefully extraordinary"
+).split()
+
+
+def sample_texts(count: int, sentences: int = 8, seed: int = 7) -> List[str]:
+    """Тексты, похожие на ответы модели: предложения разной длины"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        parts = [' '.join(rng.choice(_WORDS) for _ in range(rng.randint(4, 24))).capitalize() for _ in range(sentences)]
+        texts.append('. '.join(parts) + '.')
+    return texts
+
+
+def _measure(analyzer: LocalAnalyzer, texts: Sequence[str], batch: int, repeat: int) -> float:
+    """Время на текст, мкс (лучший из repeat прогонов)"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for i in range(0, len(texts), batch):
+            analyzer.analyze_batch(texts[i:i + batch])
+        best = min(best, time.perf_counter() - started)
+    return best / len(texts) * 1e6
+
+
+def run(texts: int = 256, sentences: int = 8, batches: Sequence[int] = (1, 16, 128), repeat: int = 3) -> Dict[str, Any]:
+    """Отчет: мкс на текст по размерам пакета"""
+    corpus = sample_texts(texts, sentences)
+    analyzer = LocalAnalyzer()
+    return {
+        "texts": texts,
+        "sentences": sentences,
+        "batches": {
+            str(batch): {"us_per_text": round(_measure(analyzer, corpus, batch, repeat), 2)} for batch in batches
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines: List[str] = [f"texts: {report['texts']}, sentences per text: {report['sentences']}"]
+    for batch, row in report['batches'].items():
+        lines.append(f"batch {batch:>5}  {row['us_per_text']:>10.2f} us/text")
+    return '\n'.join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк локальных метрик текста")
+    parser.add_argument('--texts', type=int, default=256, help="текстов в корпусе")
+    parser.add_argument('--sentences', type=int, default=8, help="предложений в тексте")
+    parser.add_argument('--batch', default='1,16,128', help="размеры пакета через запятую")
+    parser.add_argument('--json', action='store_true', help="вывод отчета в JSON")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    report = run(args.texts, args.sentences, [int(b) for b in args.batch.split(',')])
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
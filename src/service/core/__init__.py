@@ -0,0 +1,37 @@
+from .config import env_bool, env_float, env_int
+from .http import create_session, close_session
+from .cache import LRUCache, TieredCache, create_redis, make_key
+from .conversation import ConversationStore, estimate_tokens, message_tokens, trim_to_budget
+from .coalesce import MicroBatcher, SingleFlight
+from .pipeline import AnalysisPipeline
+from .keyed_queue import KeyedWorkQueue
+from .fanout import Broadcaster
+from .routing import SubscriptionIndex
+from .tracing import add_span_hook, annotate, span, start_trace
+from .loop import LoopLagMonitor, summarize
+from .bus import LocalBus, RedisBus, create_bus
+from .admission import AdmissionLimiter, AdmissionRejected, create_limiters
+from .codec import create_codec, decode_frame, encode_frame, negotiate_format
+from .resilience import CircuitBreaker, CircuitOpenError, RateLimited, RetryPolicy, UpstreamError, call_with_retries
+from .ratelimit import RateLimitGovernor
+from .analytics import AnalyticsStore
+
+__all__ = [
+    'env_bool', 'env_float', 'env_int',
+    'create_session', 'close_session',
+    'LRUCache', 'TieredCache', 'create_redis', 'make_key',
+    'ConversationStore', 'estimate_tokens', 'message_tokens', 'trim_to_budget',
+    'MicroBatcher', 'SingleFlight',
+    'AnalysisPipeline',
+    'KeyedWorkQueue',
+    'Broadcaster',
+    'SubscriptionIndex',
+    'add_span_hook', 'annotate', 'span', 'start_trace',
+    'LoopLagMonitor', 'summarize',
+    'LocalBus', 'RedisBus', 'create_bus',
+    'AdmissionLimiter', 'AdmissionRejected', 'create_limiters',
+    'create_codec', 'decode_frame', 'encode_frame', 'negotiate_format',
+    'CircuitBreaker', 'CircuitOpenError', 'RateLimited', 'RetryPolicy', 'UpstreamError', 'call_with_retries',
+    'RateLimitGovernor',
+    'AnalyticsStore',
+]
@@ -0,0 +1,175 @@
+import math
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Sequence
+
+from .config import env_float, env_int
+from .metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен ограничителем: очередь полна или ожидание слишком долгое"""
+
+    def __init__(self, upstream: str, priority: str, reason: str, retry_after: float) -> None:
+        super().__init__(f"{upstream} is overloaded ({reason}), retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    """Класс трафика со своей очередью ожидания"""
+
+    def __init__(self, name: str, max_queue: int, max_wait: float) -> None:
+        self.name = name
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls, name: str, max_queue: int, max_wait: float) -> 'PriorityClass':
+        prefix = f'ADMISSION_{name.upper()}'
+        return cls(
+            name,
+            max_queue=env_int(f'{prefix}_QUEUE', max_queue),
+            max_wait=env_float(f'{prefix}_MAX_WAIT', max_wait),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionLimiter:
+    """
+    Ограничение параллельных вызовов одного внешнего API.
+
+    Не более limit вызовов выполняются одновременно, остальные ждут в
+    очереди своего класса (не дольше max_wait). Освободившийся слот
+    получает первый ожидающий из самого приоритетного класса. Если
+    очередь класса полна или ожидание истекло - AdmissionRejected с
+    оценкой Retry-After. limit <= 0 отключает ограничение.
+    """
+
+    def __init__(self, upstream: str, limit: int, classes: Sequence[PriorityClass]) -> None:
+        self.upstream = upstream
+        self.limit = limit
+        # Порядок classes - порядок приоритета
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in classes}
+        self.active = 0
+        # Скользящее среднее времени удержания слота - для оценки Retry-After
+        self._avg_hold = 1.0
+
+    def _waiting(self) -> int:
+        return sum(len(c.waiters) for c in self.classes.values())
+
+    def retry_after(self) -> float:
+        """Оценка времени, через которое освободится место в очереди"""
+        if self.limit <= 0:
+            return 1.0
+        return max(1.0, math.ceil((self._waiting() + 1) * self._avg_hold / self.limit))
+
+    def _reject(self, cls: PriorityClass, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(upstream=self.upstream, priority=cls.name, reason=reason)
+        return AdmissionRejected(self.upstream, cls.name, reason, self.retry_after())
+
+    async def acquire(self, priority: str) -> float:
+        """Ожидание слота; возвращает время выдачи (loop.time()) для release()"""
+        cls = self.classes[priority]
+        loop = asyncio.get_running_loop()
+        if self.limit <= 0 or (self.active < self.limit and self._waiting() == 0):
+            self.active += 1
+            cls.admitted += 1
+            ADMISSION_WAIT.observe(0, upstream=self.upstream, priority=cls.name)
+            return loop.time()
+
+        if len(cls.waiters) >= cls.max_queue:
+            cls.rejected += 1
+            raise self._reject(cls, 'queue_full')
+
+        waiter = loop.create_future()
+        cls.waiters.append(waiter)
+        started = loop.time()
+        try:
+            await asyncio.wait_for(waiter, cls.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот выдан одновременно с таймаутом/отменой - возвращаем его
+                self.release()
+            elif waiter in cls.waiters:
+                cls.waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            cls.timed_out += 1
+            raise self._reject(cls, 'timeout') from None
+        cls.admitted += 1
+        admitted_at = loop.time()
+        ADMISSION_WAIT.observe(admitted_at - started, upstream=self.upstream, priority=cls.name)
+        return admitted_at
+
+    def release(self, admitted_at: Optional[float] = None) -> None:
+        """Освобождение слота; admitted_at уточняет оценку Retry-After"""
+        if admitted_at is not None:
+            held = asyncio.get_running_loop().time() - admitted_at
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        self.active -= 1
+        for cls in self.classes.values():
+            while cls.waiters:
+                waiter = cls.waiters.popleft()
+                if not waiter.done():
+                    self.active += 1
+                    waiter.set_result(None)
+                    return
+
+    @asynccontextmanager
+    async def slot(self, priority: str) -> AsyncIterator[None]:
+        with span('admission', upstream=self.upstream):
+            admitted_at = await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "classes": {name: c.stats() for name, c in self.classes.items()},
+        }
+
+
+def create_limiters(upstreams: Dict[str, int], priority: Optional[str] = None) -> Dict[str, AdmissionLimiter]:
+    """
+    Ограничители для внешних API из окружения.
+
+    upstreams - лимиты по умолчанию ({"groq": 32}); переопределяются
+    ADMISSION_{UPSTREAM}_LIMIT. Классы web и telegram настраиваются
+    ADMISSION_{CLASS}_QUEUE и ADMISSION_{CLASS}_MAX_WAIT, порядок
+    приоритета - ADMISSION_PRIORITY (по умолчанию "web,telegram").
+    """
+    defaults = {'web': (100, 5.0), 'telegram': (500, 30.0)}
+    order = [p.strip() for p in (priority or 'web,telegram').split(',') if p.strip() in defaults]
+    order += [p for p in defaults if p not in order]
+
+    limiters = {}
+    for upstream, limit in upstreams.items():
+        classes = [PriorityClass.from_env(name, *defaults[name]) for name in order]
+        limiters[upstream] = AdmissionLimiter(
+            upstream,
+            limit=env_int(f'ADMISSION_{upstream.upper()}_LIMIT', limit),
+            classes=classes,
+        )
+    return limiters
@@ -0,0 +1,471 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import sqlite3
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from . import codec
+from .config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Размер корзины агрегатов, сек
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Ширина корзин гистограммы для метрик с известной шкалой; остальные - степени двойки
+DEFAULT_BIN_WIDTHS = {'human_likeness_score': 10.0, 'is_ai_generated': 1.0}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS analyses (
+        id INTEGER PRIMARY KEY,
+        message_id TEXT,
+        ts REAL NOT NULL,
+        source TEXT NOT NULL,
+        status TEXT,
+        is_ai_generated INTEGER,
+        human_likeness_score REAL,
+        metrics TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS analyses_ts ON analyses (ts)",
+    """
+    CREATE TABLE IF NOT EXISTS rollups (
+        resolution TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        min REAL NOT NULL,
+        max REAL NOT NULL,
+        PRIMARY KEY (resolution, bucket, source, metric)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_bins (
+        resolution TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        bin REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (resolution, bucket, source, metric, bin)
+    ) WITHOUT ROWID
+    """,
+)
+
+_UPSERT_ROLLUP = """
+    INSERT INTO rollups (resolution, bucket, source, metric, count, sum, min, max)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (resolution, bucket, source, metric) DO UPDATE SET
+        count = count + excluded.count,
+        sum = sum + excluded.sum,
+        min = min(min, excluded.min),
+        max = max(max, excluded.max)
+"""
+
+_UPSERT_BIN = """
+    INSERT INTO rollup_bins (resolution, bucket, source, metric, bin, count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (resolution, bucket, source, metric, bin) DO UPDATE SET
+        count = count + excluded.count
+"""
+
+Record = Tuple[str, float, str, Dict[str, Any]]
+
+
+def extract_metrics(result: Dict[str, Any], max_metrics: int = 32) -> Dict[str, float]:
+    """
+    Числовые метрики результата анализа: human_likeness_score,
+    is_ai_generated (0/1) и скаляры из result['metrics'] (вложенные
+    словари - через точку, например readability.flesch). Списки
+    пропускаются; не больше max_metrics имен на результат.
+    """
+    values: Dict[str, float] = {}
+    score = result.get('human_likeness_score')
+    if isinstance(score, (int, float)) and not isinstance(score, bool):
+        values['human_likeness_score'] = float(score)
+    if isinstance(result.get('is_ai_generated'), bool):
+        values['is_ai_generated'] = float(result['is_ai_generated'])
+
+    def walk(data: Dict[str, Any], prefix: str, depth: int) -> None:
+        for key, value in data.items():
+            if len(values) >= max_metrics:
+                return
+            name = f'{prefix}{key}'
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, (int, float)):
+                if math.isfinite(value):
+                    values[name] = float(value)
+            elif isinstance(value, dict) and depth > 0:
+                walk(value, f'{name}.', depth - 1)
+
+    metrics = result.get('metrics')
+    if isinstance(metrics, dict):
+        walk(metrics, '', 1)
+    return values
+
+
+def rolls_up(result: Dict[str, Any]) -> bool:
+    """
+    Входит ли результат в агрегаты: только успешные ответы Neo API.
+    Ошибки и локальные оценки (status "degraded") сохраняются сырыми
+    строками со своим status, но не смешиваются с метриками API.
+    """
+    return result.get('status') == 'success' and 'error' not in result
+
+
+def histogram_bin(value: float, width: Optional[float] = None) -> float:
+    """Нижняя граница корзины: кратная width или степень двойки со знаком"""
+    if width:
+        return math.floor(value / width) * width
+    if value == 0:
+        return 0.0
+    return math.copysign(2.0 ** math.floor(math.log2(abs(value))), value)
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Момент времени из параметра запроса: unix-время или ISO 8601 (без зоны - UTC)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+class AnalyticsStore:
+    """
+    Журнал результатов анализа Neo API в SQLite с агрегатами по времени.
+
+    record() только кладет результат в буфер: запись идет пачками из
+    фоновой задачи в отдельном потоке и не блокирует event loop. В той
+    же транзакции, что и сырые строки, инкрементально обновляются
+    агрегаты по корзинам resolutions (count, sum, min, max и гистограмма
+    на метрику и источник). aggregate() читает только агрегаты, сырые
+    строки не сканируются. Обновления аддитивны, поэтому несколько
+    воркеров могут писать в один файл (WAL).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        resolutions: Iterable[str] = ('hour', 'day'),
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        buffer_size: int = 10000,
+        bin_widths: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.path = path
+        self.resolutions = [r for r in resolutions if r in RESOLUTIONS]
+        if not self.resolutions:
+            raise ValueError(f"At least one resolution of {sorted(RESOLUTIONS)} is required")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.bin_widths = {**DEFAULT_BIN_WIDTHS, **(bin_widths or {})}
+        self._buffer: Deque[Record] = deque()
+        self.buffer_size = buffer_size
+        # Все обращения к соединению - в одном потоке
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analytics')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.recorded = 0
+        # Записаны без агрегатов: ошибки и локальные оценки
+        self.excluded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional['AnalyticsStore']:
+        """
+        Хранилище по ANALYTICS_DB; журнал включается только явно: без
+        переменной запись не ведется. Относительный путь отсчитывается
+        от ANALYTICS_DATA_DIR (по умолчанию - рабочий каталог), каталог
+        создается при запуске. Корзины - ANALYTICS_RESOLUTIONS,
+        пачки - ANALYTICS_FLUSH_INTERVAL и ANALYTICS_BATCH_SIZE, буфер -
+        ANALYTICS_BUFFER_SIZE, ширина корзин гистограмм -
+        ANALYTICS_BIN_WIDTHS ("metric=width,...").
+        """
+        path = os.getenv('ANALYTICS_DB', '')
+        if not path:
+            return None
+        if path != ':memory:':
+            path = os.path.abspath(os.path.join(os.getenv('ANALYTICS_DATA_DIR', ''), path))
+        widths = {}
+        for item in os.getenv('ANALYTICS_BIN_WIDTHS', '').split(','):
+            name, _, width = item.partition('=')
+            try:
+                widths[name.strip()] = float(width)
+            except ValueError:
+                continue
+        return cls(
+            path,
+            resolutions=[r.strip() for r in os.getenv('ANALYTICS_RESOLUTIONS', 'hour,day').split(',')],
+            flush_interval=env_float('ANALYTICS_FLUSH_INTERVAL', 1.0),
+            batch_size=env_int('ANALYTICS_BATCH_SIZE', 500),
+            buffer_size=env_int('ANALYTICS_BUFFER_SIZE', 10000),
+            bin_widths=widths,
+        )
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        if self.path != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        self._conn = conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self) -> None:
+        """Открытие базы и запуск фоновой записи"""
+        if self._task is not None and not self._task.done():
+            return
+        await self._run_db(self._open)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._flusher())
+        logger.info(f"Analytics store opened: {self.path} (rollups: {', '.join(self.resolutions)})")
+
+    async def stop(self) -> None:
+        """Запись остатка буфера и закрытие базы"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._buffer:
+            await self.flush()
+        await self._run_db(self._close)
+
+    def record(self, message_id: str, result: Dict[str, Any], source: str = 'web', ts: Optional[float] = None) -> bool:
+        """
+        Результат анализа в буфер записи. Возвращает False, если буфер
+        заполнен (база не успевает) и результат отброшен.
+        """
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            return False
+        self._buffer.append((message_id, time.time() if ts is None else ts, source, result))
+        self.recorded += 1
+        if not rolls_up(result):
+            self.excluded += 1
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def _flusher(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Analytics flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Запись буфера пачками; возвращает число записанных результатов"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            if self._conn is None:
+                await self._run_db(self._open)
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                started = time.perf_counter()
+                try:
+                    await self._run_db(self._write, batch)
+                except Exception:
+                    self.failed += len(batch)
+                    raise
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+                self.flushes += 1
+                self.written += len(batch)
+                written += len(batch)
+        return written
+
+    def _write(self, batch: List[Record]) -> None:
+        """Сырые строки и приращения агрегатов пачки в одной транзакции"""
+        assert self._conn is not None
+        rows = []
+        # Пачка сначала сворачивается в памяти: одна строка upsert на корзину
+        rollups: Dict[Tuple[str, int, str, str], List[float]] = {}
+        bins: Dict[Tuple[str, int, str, str, float], int] = {}
+        for message_id, ts, source, result in batch:
+            status = result.get('status')
+            rows.append((
+                message_id, ts, source, status,
+                int(bool(result.get('is_ai_generated'))),
+                result.get('human_likeness_score'),
+                codec.dumps(result.get('metrics') or {}),
+            ))
+            if not rolls_up(result):
+                continue
+            for metric, value in extract_metrics(result).items():
+                bin_start = histogram_bin(value, self.bin_widths.get(metric))
+                for resolution in self.resolutions:
+                    bucket = int(ts // RESOLUTIONS[resolution]) * RESOLUTIONS[resolution]
+                    key = (resolution, bucket, source, metric)
+                    agg = rollups.get(key)
+                    if agg is None:
+                        rollups[key] = [1, value, value, value]
+                    else:
+                        agg[0] += 1
+                        agg[1] += value
+                        agg[2] = min(agg[2], value)
+                        agg[3] = max(agg[3], value)
+                    bins[key + (bin_start,)] = bins.get(key + (bin_start,), 0) + 1
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO analyses (message_id, ts, source, status, is_ai_generated, human_likeness_score, metrics) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.executemany(_UPSERT_ROLLUP, [key + tuple(agg) for key, agg in rollups.items()])
+            self._conn.executemany(_UPSERT_BIN, [key + (count,) for key, count in bins.items()])
+
+    async def aggregate(
+        self,
+        resolution: str = 'hour',
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        metric: Optional[str] = None,
+        source: Optional[str] = None,
+        max_buckets: int = 1000,
+    ) -> Dict[str, Any]:
+        """
+        Агрегаты по корзинам [since, until] из таблиц агрегатов. По
+        умолчанию - последние 24 корзины. total - сводка за весь интервал
+        (среднее и гистограмма без повторного прохода по данным).
+
+        Raises:
+            ValueError: неизвестная resolution или слишком много корзин
+        """
+        if resolution not in self.resolutions:
+            raise ValueError(f"Unknown resolution {resolution!r}, available: {', '.join(self.resolutions)}")
+        size = RESOLUTIONS[resolution]
+        until = time.time() if until is None else until
+        since = until - 24 * size if since is None else since
+        first, last = int(since // size) * size, int(until // size) * size
+        if last < first:
+            raise ValueError("since must not be later than until")
+        if (last - first) // size + 1 > max_buckets:
+            raise ValueError(f"Too many buckets (max {max_buckets}), use a coarser resolution")
+        # Только что записанные результаты тоже попадают в ответ
+        await self.flush()
+        rows, bin_rows = await self._run_db(self._query, resolution, first, last, metric, source)
+
+        metrics: Dict[str, Dict[str, Any]] = {}
+        for bucket, name, count, total, low, high in rows:
+            entry = metrics.setdefault(name, {"buckets": {}, "total": {"count": 0, "sum": 0.0, "min": low, "max": high, "histogram": {}}})
+            entry["buckets"][bucket] = {
+                "start": _iso(bucket),
+                "count": count,
+                "mean": round(total / count, 6) if count else None,
+                "min": low,
+                "max": high,
+                "histogram": {},
+            }
+            summary = entry["total"]
+            summary["count"] += count
+            summary["sum"] += total
+            summary["min"] = min(summary["min"], low)
+            summary["max"] = max(summary["max"], high)
+        for bucket, name, bin_start, count in bin_rows:
+            entry = metrics[name]
+            entry["buckets"][bucket]["histogram"][bin_start] = count
+            histogram = entry["total"]["histogram"]
+            histogram[bin_start] = histogram.get(bin_start, 0) + count
+
+        for entry in metrics.values():
+            entry["buckets"] = list(entry["buckets"].values())
+            summary = entry["total"]
+            summary["mean"] = round(summary.pop("sum") / summary["count"], 6) if summary["count"] else None
+            for item in entry["buckets"] + [summary]:
+                # Гистограмма: пары [нижняя граница корзины, число значений]
+                item["histogram"] = [[start, count] for start, count in sorted(item["histogram"].items())]
+        return {
+            "resolution": resolution,
+            "since": _iso(first),
+            "until": _iso(last + size),
+            "source": source,
+            "metrics": metrics,
+        }
+
+    def _query(self, resolution: str, first: int, last: int, metric: Optional[str], source: Optional[str]):
+        if self._conn is None:
+            self._open()
+        assert self._conn is not None
+        where = "resolution = ? AND bucket BETWEEN ? AND ?"
+        params: List[Any] = [resolution, first, last]
+        if metric:
+            where += " AND metric = ?"
+            params.append(metric)
+        if source:
+            where += " AND source = ?"
+            params.append(source)
+        rows = self._conn.execute(
+            f"SELECT bucket, metric, SUM(count), SUM(sum), MIN(min), MAX(max) FROM rollups "
+            f"WHERE {where} GROUP BY bucket, metric ORDER BY metric, bucket",
+            params
+        ).fetchall()
+        bin_rows = self._conn.execute(
+            f"SELECT bucket, metric, bin, SUM(count) FROM rollup_bins "
+            f"WHERE {where} GROUP BY bucket, metric, bin",
+            params
+        ).fetchall()
+        return rows, bin_rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "resolutions": self.resolutions,
+            "pending": len(self._buffer),
+            "recorded": self.recorded,
+            "excluded": self.excluded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,147 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import codec
+
+logger = logging.getLogger(__name__)
+
+BusHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LocalBus:
+    """
+    Шина рассылки в пределах одного процесса.
+
+    publish() сразу передает сообщение обработчику: поведение совпадает
+    с рассылкой без шины. Подходит для одного воркера.
+    """
+
+    distributed = False
+
+    def __init__(self, handler: BusHandler) -> None:
+        self._handler = handler
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, envelope: Dict[str, Any]) -> None:
+        self.published += 1
+        await self._deliver(envelope)
+
+    async def _deliver(self, envelope: Dict[str, Any]) -> None:
+        self.received += 1
+        try:
+            await self._handler(envelope)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Bus handler failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": "redis" if self.distributed else "local",
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+class RedisBus(LocalBus):
+    """
+    Шина рассылки через Redis pub/sub.
+
+    Каждый воркер подписан на общий канал и доставляет сообщения своим
+    WebSocket-клиентам, поэтому метрики, посчитанные в одном процессе,
+    доходят до сокетов в любом другом. Публикующий воркер получает свое
+    сообщение тоже через Redis. Если публикация в Redis не удалась,
+    сообщение доставляется хотя бы локальным клиентам.
+    """
+
+    distributed = True
+
+    def __init__(self, handler: BusHandler, redis: Any, channel: str = 'neonchat:broadcast', poll_timeout: float = 0.5) -> None:
+        super().__init__(handler)
+        self.redis = redis
+        self.channel = channel
+        # Меньше socket_timeout клиента, чтобы ожидание не считалось ошибкой соединения
+        self.poll_timeout = poll_timeout
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._ready.clear()
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                logger.warning(f"Bus subscription to {self.channel} is not ready yet")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, envelope: Dict[str, Any]) -> None:
+        self.published += 1
+        try:
+            await self.redis.publish(self.channel, codec.dumpb(envelope))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Bus publish failed, delivering locally: {e}")
+            await self._deliver(envelope)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._ready.set()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_timeout)
+                    if message is None or message.get('type') != 'message':
+                        continue
+                    try:
+                        envelope = codec.loads(message['data'])
+                    except (TypeError, ValueError) as e:
+                        self.errors += 1
+                        logger.warning(f"Invalid bus message: {e}")
+                        continue
+                    await self._deliver(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Bus subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+def create_bus(handler: BusHandler, redis: Optional[Any] = None, kind: Optional[str] = None) -> LocalBus:
+    """
+    Шина рассылки по METRICS_BUS: local, redis или auto (по умолчанию) -
+    Redis, если клиент настроен (REDIS_URL), иначе local. handler
+    получает каждое доставленное сообщение.
+    """
+    kind = kind or os.getenv('METRICS_BUS', 'auto')
+    if kind == 'redis' or (kind == 'auto' and redis is not None):
+        if redis is None:
+            logger.warning("METRICS_BUS=redis but REDIS_URL is not set, using local bus")
+            return LocalBus(handler)
+        return RedisBus(handler, redis, channel=os.getenv('METRICS_BUS_CHANNEL', 'neonchat:broadcast'))
+    return LocalBus(handler)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from types import ModuleType
+from typing import Any, Dict, Optional, Tuple
+
+from . import codec
+
+aioredis: Optional[ModuleType]
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis опционален
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts: Any) -> str:
+    """Content-addressed ключ: sha256 от канонического JSON всех частей"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def redis_configured(url: Optional[str] = None) -> bool:
+    """Задан ли REDIS_URL и установлен ли пакет redis"""
+    return bool(url or os.getenv('REDIS_URL')) and aioredis is not None
+
+
+def create_redis(url: Optional[str] = None) -> Optional[Any]:
+    """
+    Создает асинхронный клиент Redis по REDIS_URL.
+
+    Returns:
+        Клиент redis.asyncio.Redis или None, если Redis не настроен
+    """
+    url = url or os.getenv('REDIS_URL')
+    if not url:
+        return None
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but redis package is not installed")
+        return None
+    return aioredis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+
+class LRUCache:
+    """In-process LRU-кэш с ограничением размера и TTL"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class TieredCache:
+    """
+    Двухуровневый кэш: in-process LRU поверх Redis.
+
+    Попадание в Redis прогревает локальный уровень. Ошибки Redis
+    не прерывают запрос: кэш работает как промах.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_size: int = 1024,
+        ttl: float = 3600,
+        redis: Optional[Any] = None,
+    ) -> None:
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.redis = redis
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.decode_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.local.max_size > 0 or self.redis is not None
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+
+        redis_key = self._redis_key(key)
+        try:
+            raw = await self.redis.get(redis_key)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Redis get failed for {self.namespace}: {e}")
+            return None
+
+        if raw is None:
+            self.redis_misses += 1
+            return None
+        try:
+            value = codec.loads(raw)
+        except Exception as e:
+            # Поврежденное или записанное другим форматом значение - промах;
+            # ключ удаляется, чтобы следующий set записал его заново
+            self.redis_misses += 1
+            self.decode_errors += 1
+            logger.warning(f"Redis value for {self.namespace} could not be decoded: {e}")
+            try:
+                await self.redis.delete(redis_key)
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Redis delete failed for {self.namespace}: {e}")
+            return None
+        self.redis_hits += 1
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self._redis_key(key), codec.dumpb(value), ex=int(self.ttl))
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Redis set failed for {self.namespace}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local": self.local.stats(),
+            "redis": {
+                "enabled": self.redis is not None,
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "errors": self.redis_errors,
+                "decode_errors": self.decode_errors,
+            },
+        }
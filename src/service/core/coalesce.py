@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Объединение одновременных запросов с одинаковым ключом.
+
+    Первый вызов для ключа выполняет запрос, остальные ждут тот же
+    future. Отмена одного из ожидающих не отменяет общий запрос.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.followers += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        self.leaders += 1
+
+        def _forget(done: asyncio.Future) -> None:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+            if not done.cancelled():
+                done.exception()  # помечаем исключение как полученное
+
+        future.add_done_callback(_forget)
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.followers,
+        }
+
+
+class MicroBatcher:
+    """
+    Микро-батчинг задач.
+
+    Задачи собираются в течение окна window (или до max_batch штук),
+    затем пачка отправляется обработчику с ограничением concurrency
+    одновременных вызовов.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        window: float = 0.005,
+        max_batch: int = 32,
+        concurrency: int = 8,
+    ) -> None:
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Добавляет задачу в текущее окно и ждет ее результат"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        async def run_one(item: Any, future: asyncio.Future) -> None:
+            if future.done():  # вызывающий уже отменил ожидание
+                return
+            async with self._semaphore:
+                try:
+                    result = await self.handler(item)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+
+        await asyncio.gather(*(run_one(item, future) for item, future in batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "concurrency": self.concurrency,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+        }
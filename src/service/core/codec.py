@@ -0,0 +1,162 @@
+import os
+import json
+import logging
+from typing import Any, Dict, Optional, Union
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson опционален
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack опционален
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Форматы кадров WebSocket
+FORMAT_JSON = 'json'
+FORMAT_MSGPACK = 'msgpack'
+
+
+class JsonCodec:
+    """Сериализация JSON стандартной библиотекой"""
+
+    name = 'json'
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def dumpb(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data: Union[str, bytes, bytearray]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Сериализация через orjson: в несколько раз быстрее stdlib и сразу
+    дает UTF-8 байты. Ключи-не строки приводятся к строкам, как в stdlib.
+    """
+
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any) -> str:
+        return orjson.dumps(obj, option=self._option).decode('utf-8')
+
+    def dumpb(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, option=self._option)
+
+    def loads(self, data: Union[str, bytes, bytearray]) -> Any:
+        return orjson.loads(data)
+
+
+CODECS = {'json': JsonCodec}
+if orjson is not None:
+    CODECS['orjson'] = OrjsonCodec
+
+
+def create_codec(name: Optional[str] = None) -> JsonCodec:
+    """
+    Кодек по JSON_CODEC: auto (по умолчанию) - orjson, если установлен,
+    иначе stdlib; json или orjson - явный выбор.
+    """
+    name = name or os.getenv('JSON_CODEC', 'auto')
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in CODECS else 'json'
+    if name not in CODECS:
+        logger.warning(f"JSON codec {name!r} is not available, using stdlib json")
+        name = 'json'
+    return CODECS[name]()
+
+
+_codec = create_codec()
+
+
+def get_codec() -> JsonCodec:
+    return _codec
+
+
+def set_codec(name: Optional[str] = None) -> JsonCodec:
+    """Замена кодека процесса (для тестов и бенчмарков)"""
+    global _codec
+    _codec = create_codec(name)
+    return _codec
+
+
+def dumps(obj: Any) -> str:
+    return _codec.dumps(obj)
+
+
+def dumpb(obj: Any) -> bytes:
+    return _codec.dumpb(obj)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    return _codec.loads(data)
+
+
+def json_response(
+    data: Any,
+    status: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> web.Response:
+    """Аналог web.json_response: тело сериализуется текущим кодеком сразу в байты"""
+    return web.Response(
+        body=_codec.dumpb(data),
+        status=status,
+        headers=headers,
+        content_type='application/json',
+    )
+
+
+async def read_json(request: web.Request) -> Any:
+    """Тело запроса как JSON (аналог request.json() с текущим кодеком)"""
+    return _codec.loads(await request.read())
+
+
+def frame_formats() -> tuple:
+    """Форматы кадров WebSocket, доступные в этой сборке"""
+    return (FORMAT_JSON, FORMAT_MSGPACK) if msgpack is not None else (FORMAT_JSON,)
+
+
+def negotiate_format(path: Optional[str]) -> str:
+    """
+    Формат кадров по пути подключения WebSocket (?format=msgpack).
+
+    Неизвестный или недоступный формат - JSON, чтобы старые клиенты
+    продолжали работать.
+    """
+    if not path or 'format=' not in path:
+        return FORMAT_JSON
+    query = path.split('?', 1)[-1]
+    for part in query.split('&'):
+        key, _, value = part.partition('=')
+        if key == 'format' and value in frame_formats():
+            return value
+    return FORMAT_JSON
+
+
+def encode_frame(payload: Any, fmt: str = FORMAT_JSON) -> Union[str, bytes]:
+    """
+    Кадр WebSocket: JSON - текстовый кадр (str), MessagePack - бинарный
+    (bytes).
+    """
+    if fmt == FORMAT_MSGPACK:
+        frame: bytes = msgpack.packb(payload, use_bin_type=True)
+        return frame
+    return _codec.dumps(payload)
+
+
+def decode_frame(data: Union[str, bytes]) -> Any:
+    """Разбор кадра клиента: бинарные кадры - MessagePack, текстовые - JSON"""
+    if isinstance(data, (bytes, bytearray)) and msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    return _codec.loads(data)
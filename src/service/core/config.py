@@ -0,0 +1,36 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def env_int(name: str, default: int) -> int:
+    """Читает целое число из окружения, при ошибке возвращает значение по умолчанию"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid value for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Читает число с плавающей точкой из окружения"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid value for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Читает флаг из окружения (1/true/yes/on)"""
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
@@ -0,0 +1,278 @@
+import math
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+from . import codec
+from .cache import TieredCache
+
+WatchError: Type[Exception]
+try:
+    from redis.exceptions import WatchError
+except ImportError:  # pragma: no cover - redis опционален
+    class _NoWatchError(Exception):
+        """Без пакета redis транзакции с WATCH не используются"""
+
+    WatchError = _NoWatchError
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, str]
+Summarizer = Callable[[Optional[str], List[Message]], Awaitable[str]]
+
+# Служебные токены на одно сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительная оценка числа токенов: ~4 символа на токен"""
+    return math.ceil(len(text) / 4)
+
+
+def message_tokens(message: Message) -> int:
+    return estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+
+def trim_to_budget(
+    history: List[Message],
+    budget: int,
+    pinned: Optional[List[Message]] = None,
+) -> Tuple[List[Message], int, int]:
+    """
+    Скользящее окно: оставляет самые свежие сообщения в пределах бюджета.
+
+    Закрепленные сообщения (системный промпт, краткое содержание)
+    входят в бюджет всегда. Последнее сообщение истории (текущий
+    вопрос пользователя) сохраняется даже при превышении бюджета.
+
+    Returns:
+        (сообщения для промпта, оценка токенов, число отброшенных сообщений)
+    """
+    pinned = pinned or []
+    used = sum(message_tokens(m) for m in pinned)
+    kept: List[Message] = []
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return pinned + kept, used, len(history) - len(kept)
+
+
+class ConversationStore:
+    """
+    Серверное хранилище диалогов.
+
+    История хранится по session_id; клиент отправляет только session_id
+    и новое сообщение. Промпт собирается в пределах бюджета токенов,
+    вытесненные из окна сообщения при наличии summarizer сворачиваются в
+    краткое содержание.
+
+    Без Redis состояние живет в in-process LRU. С Redis оно читается
+    только из Redis, без локальной копии, которая у другого воркера
+    устарела бы: реплики лежат в списке и дописываются атомарно
+    (RPUSH + LTRIM в одной транзакции), а свертка в краткое содержание
+    применяется через WATCH/MULTI, поэтому параллельные записи разных
+    воркеров не теряются.
+    """
+
+    # Попыток применить свертку, если список изменился во время WATCH
+    SUMMARY_RETRIES = 3
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        max_messages: int = 200,
+        max_sessions: int = 1000,
+        ttl: float = 86400,
+        redis: Optional[Any] = None,
+        system_prompt: Optional[str] = None,
+        summarizer: Optional[Summarizer] = None,
+    ) -> None:
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.redis = redis
+        self.system_prompt = system_prompt
+        self.summarizer = summarizer
+        self.cache = TieredCache('conversation', max_size=max_sessions, ttl=ttl)
+        self.summaries = 0
+        self.redis_errors = 0
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        return f"conversation:{session_id}:messages", f"conversation:{session_id}:summary"
+
+    @staticmethod
+    def _decode_messages(raw: List[bytes]) -> List[Message]:
+        messages = []
+        for item in raw:
+            try:
+                messages.append(codec.loads(item))
+            except Exception as e:
+                logger.warning(f"Skipping undecodable conversation message: {e}")
+        return messages
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        self.redis_errors += 1
+        logger.warning(f"Redis {action} failed for conversation store: {error}")
+
+    async def load(self, session_id: str) -> Dict[str, Any]:
+        """Состояние диалога: {"messages": [...], "summary": str | None}"""
+        if self.redis is None:
+            state = await self.cache.get(session_id)
+            if state is None:
+                return {"messages": [], "summary": None}
+            return {"messages": list(state.get("messages", [])), "summary": state.get("summary")}
+
+        messages_key, summary_key = self._keys(session_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(messages_key, 0, -1)
+                pipe.get(summary_key)
+                raw_messages, raw_summary = await pipe.execute()
+        except Exception as e:
+            self._redis_failed('load', e)
+            return {"messages": [], "summary": None}
+        summary = raw_summary.decode('utf-8') if isinstance(raw_summary, bytes) else raw_summary
+        return {"messages": self._decode_messages(raw_messages), "summary": summary}
+
+    def _queue_state(self, pipe: Any, session_id: str, messages: List[Message], summary: Optional[str]) -> None:
+        """Команды полной перезаписи состояния в транзакции pipe"""
+        messages_key, summary_key = self._keys(session_id)
+        pipe.delete(messages_key)
+        if messages:
+            pipe.rpush(messages_key, *(codec.dumpb(m) for m in messages))
+            pipe.expire(messages_key, int(self.ttl))
+        if summary:
+            pipe.set(summary_key, summary.encode('utf-8'), ex=int(self.ttl))
+        else:
+            pipe.delete(summary_key)
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Полная перезапись состояния (для дописывания реплик - append)"""
+        state["messages"] = state["messages"][-self.max_messages:]
+        if self.redis is None:
+            await self.cache.set(session_id, state)
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_state(pipe, session_id, state["messages"], state.get("summary"))
+                await pipe.execute()
+        except Exception as e:
+            self._redis_failed('save', e)
+
+    async def append(self, session_id: str, messages: List[Message]) -> None:
+        """Добавление реплик в историю сессии"""
+        if self.redis is None:
+            state = await self.load(session_id)
+            state["messages"].extend(messages)
+            await self.save(session_id, state)
+            return
+        if not messages:
+            return
+
+        messages_key, summary_key = self._keys(session_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(messages_key, *(codec.dumpb(m) for m in messages))
+                pipe.ltrim(messages_key, -self.max_messages, -1)
+                pipe.expire(messages_key, int(self.ttl))
+                pipe.expire(summary_key, int(self.ttl))
+                await pipe.execute()
+        except Exception as e:
+            self._redis_failed('append', e)
+
+    def pinned(self, summary: Optional[str] = None) -> List[Message]:
+        """Системный промпт и краткое содержание ранних реплик"""
+        pinned: List[Message] = []
+        if self.system_prompt:
+            pinned.append({'role': 'system', 'content': self.system_prompt})
+        if summary:
+            pinned.append({'role': 'system', 'content': f"Summary of the earlier conversation: {summary}"})
+        return pinned
+
+    async def build_prompt(self, session_id: str, message: str) -> Tuple[List[Message], Dict[str, int]]:
+        """
+        Собирает промпт из истории сессии и нового сообщения.
+
+        Returns:
+            (сообщения для Groq API, сведения о размере промпта)
+        """
+        state = await self.load(session_id)
+        history = state["messages"] + [{'role': 'user', 'content': message}]
+        messages, tokens, trimmed = trim_to_budget(
+            history, self.token_budget, self.pinned(state["summary"])
+        )
+        return messages, {"tokens": tokens, "messages": len(messages), "trimmed": trimmed}
+
+    async def summarize(self, session_id: str) -> bool:
+        """
+        Сворачивает вытесненные из окна сообщения в краткое содержание.
+
+        Вызывается вне пути ответа. Возвращает True, если история сжата.
+        """
+        if self.summarizer is None:
+            return False
+        state = await self.load(session_id)
+        history = state["messages"]
+        _, _, trimmed = trim_to_budget(history, self.token_budget, self.pinned(state["summary"]))
+        if trimmed == 0:
+            return False
+
+        dropped = history[:trimmed]
+        try:
+            summary = await self.summarizer(state["summary"], dropped)
+        except Exception as e:
+            logger.warning(f"Conversation summary failed for {session_id}: {e}")
+            return False
+
+        # История могла пополниться, пока строилось краткое содержание
+        if self.redis is None:
+            current = await self.load(session_id)
+            if current["messages"][:trimmed] != dropped:
+                return False
+            current["messages"] = current["messages"][trimmed:]
+            current["summary"] = summary
+            await self.save(session_id, current)
+        elif not await self._apply_summary(session_id, dropped, summary):
+            return False
+        self.summaries += 1
+        return True
+
+    async def _apply_summary(self, session_id: str, dropped: List[Message], summary: str) -> bool:
+        """
+        Удаляет свернутые реплики из начала списка и сохраняет краткое
+        содержание, если начало списка не изменилось. WATCH прерывает
+        транзакцию при параллельной записи: тогда проверка повторяется.
+        """
+        if self.redis is None:
+            return False
+        messages_key, summary_key = self._keys(session_id)
+        for _ in range(self.SUMMARY_RETRIES):
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    await pipe.watch(messages_key)
+                    head = self._decode_messages(await pipe.lrange(messages_key, 0, len(dropped) - 1))
+                    if head != dropped:
+                        await pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.ltrim(messages_key, len(dropped), -1)
+                    pipe.set(summary_key, summary.encode('utf-8'), ex=int(self.ttl))
+                    await pipe.execute()
+                    return True
+            except WatchError:
+                continue
+            except Exception as e:
+                self._redis_failed('summary', e)
+                return False
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "summaries": self.summaries,
+            "backend": "redis" if self.redis is not None else "local",
+            "redis_errors": self.redis_errors,
+            "cache": self.cache.stats(),
+        }
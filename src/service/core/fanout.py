@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from .metrics import BROADCAST_FANOUT, BROADCAST_SEND
+from .logs import sample
+
+logger = logging.getLogger(__name__)
+
+# Политики для медленных клиентов при заполненной очереди
+POLICY_DROP_OLDEST = 'drop_oldest'  # выбрасываем самый старый кадр (коалесцирование)
+POLICY_DISCONNECT = 'disconnect'    # отключаем клиента
+
+
+class ClientChannel:
+    """
+    Исходящий канал одного WebSocket-клиента.
+
+    У каждого соединения своя ограниченная очередь и задача-писатель,
+    поэтому медленный клиент не блокирует рассылку остальным.
+    """
+
+    def __init__(self, ws: Any, broadcaster: 'Broadcaster') -> None:
+        self.ws = ws
+        self.broadcaster = broadcaster
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=broadcaster.queue_size)
+        self.closed = False
+        self.task = asyncio.create_task(self._writer())
+
+    def offer(self, message: Any) -> bool:
+        """Неблокирующая постановка кадра в очередь клиента"""
+        if self.closed:
+            return False
+        item = (message, time.perf_counter())
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.broadcaster.policy == POLICY_DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(item)
+            self.broadcaster.frames_dropped += 1
+            return True
+
+        logger.warning("WebSocket client is too slow, disconnecting", extra=sample('ws.slow_client'))
+        self.broadcaster.clients_dropped += 1
+        self._shutdown()
+        return False
+
+    async def _writer(self) -> None:
+        while not self.closed:
+            message, enqueued_at = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.ws.send(message), self.broadcaster.send_timeout)
+                self.broadcaster._record_send(time.perf_counter() - enqueued_at)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                logger.warning("WebSocket send timed out, disconnecting client", extra=sample('ws.send_timeout'))
+                self.broadcaster.send_timeouts += 1
+                self.broadcaster.clients_dropped += 1
+                self._shutdown()
+            except Exception as e:
+                logger.warning("WebSocket send failed: %s", e, extra=sample('ws.send_failed'))
+                self.broadcaster.send_errors += 1
+                self._shutdown()
+            finally:
+                self.queue.task_done()
+
+    def stop(self) -> None:
+        """Останавливает писателя и очищает очередь"""
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+        # Из самого писателя выходим по флагу closed после текущей итерации
+        if asyncio.current_task() is not self.task:
+            self.task.cancel()
+
+    def _shutdown(self) -> None:
+        """Закрывает канал и соединение, снимает клиента с рассылки"""
+        if self.closed:
+            return
+        self.stop()
+        close = getattr(self.ws, 'close', None)
+        if close is not None:
+            asyncio.ensure_future(self._close_ws(close))
+        self.broadcaster._remove(self.ws)
+
+    async def _close_ws(self, close: Callable) -> None:
+        try:
+            await asyncio.wait_for(close(), self.broadcaster.send_timeout)
+        except Exception:
+            pass
+
+
+class Broadcaster:
+    """
+    Конкурентная рассылка сообщений WebSocket-клиентам.
+
+    Сообщение сериализуется один раз вызывающей стороной, затем
+    раскладывается по очередям клиентов без ожидания отправки.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 32,
+        send_timeout: float = 5.0,
+        policy: str = POLICY_DROP_OLDEST,
+        on_disconnect: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        if policy not in (POLICY_DROP_OLDEST, POLICY_DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self.on_disconnect = on_disconnect
+        self.channels: Dict[Any, ClientChannel] = {}
+        self.broadcasts = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.clients_dropped = 0
+        self.send_timeouts = 0
+        self.send_errors = 0
+        self.last_fanout_ms = 0.0
+        self.max_send_latency_ms = 0.0
+        self._send_latency_total = 0.0
+
+    def publish(self, message: Any, connections: Iterable[Any]) -> int:
+        """
+        Раскладывает сообщение по очередям клиентов.
+
+        Returns:
+            int: Количество клиентов, которым кадр поставлен в очередь
+        """
+        started = time.perf_counter()
+        queued = 0
+        for ws in list(connections):
+            channel = self.channels.get(ws)
+            if channel is None:
+                channel = self.channels[ws] = ClientChannel(ws, self)
+            if channel.offer(message):
+                queued += 1
+        self.broadcasts += 1
+        elapsed = time.perf_counter() - started
+        self.last_fanout_ms = elapsed * 1000
+        BROADCAST_FANOUT.observe(elapsed)
+        return queued
+
+    def discard(self, ws: Any) -> None:
+        """Убирает клиента из рассылки (при закрытии соединения)"""
+        channel = self.channels.pop(ws, None)
+        if channel is not None:
+            channel.stop()
+
+    async def flush(self) -> None:
+        """Ожидание доставки всех поставленных в очередь кадров"""
+        await asyncio.gather(*(c.queue.join() for c in list(self.channels.values())))
+
+    async def close(self) -> None:
+        """Остановка всех задач-писателей"""
+        channels = list(self.channels.values())
+        for ws in list(self.channels):
+            self.discard(ws)
+        await asyncio.gather(*(c.task for c in channels), return_exceptions=True)
+
+    def _record_send(self, latency: float) -> None:
+        self.frames_sent += 1
+        self._send_latency_total += latency
+        BROADCAST_SEND.observe(latency)
+        self.max_send_latency_ms = max(self.max_send_latency_ms, latency * 1000)
+
+    def _remove(self, ws: Any) -> None:
+        self.channels.pop(ws, None)
+        if self.on_disconnect is not None:
+            self.on_disconnect(ws)
+
+    def stats(self) -> Dict[str, Any]:
+        """Задержки рассылки и глубина очередей"""
+        depths = [c.queue.qsize() for c in self.channels.values()]
+        return {
+            "clients": len(self.channels),
+            "policy": self.policy,
+            "broadcasts": self.broadcasts,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "clients_dropped": self.clients_dropped,
+            "send_timeouts": self.send_timeouts,
+            "send_errors": self.send_errors,
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "last_fanout_ms": round(self.last_fanout_ms, 3),
+            "avg_send_latency_ms": round(
+                self._send_latency_total / self.frames_sent * 1000, 3
+            ) if self.frames_sent else 0.0,
+            "max_send_latency_ms": round(self.max_send_latency_ms, 3),
+        }
@@ -0,0 +1,63 @@
+import ssl
+import logging
+from typing import Optional
+import aiohttp
+from . import codec
+from .config import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(
+    prefix: str,
+    limit: int = 100,
+    limit_per_host: int = 20,
+    keepalive_timeout: int = 30,
+    ttl_dns_cache: int = 300,
+    timeout: float = 30,
+    tls_reuse: bool = True,
+) -> aiohttp.ClientSession:
+    """
+    Создает долгоживущую ClientSession с пулом соединений.
+
+    Параметры пула можно переопределить через окружение:
+    {PREFIX}_POOL_LIMIT, {PREFIX}_POOL_LIMIT_PER_HOST,
+    {PREFIX}_KEEPALIVE_TIMEOUT, {PREFIX}_DNS_CACHE_TTL, {PREFIX}_TIMEOUT,
+    {PREFIX}_TLS_REUSE.
+
+    Args:
+        prefix: Префикс переменных окружения (например, GROQ)
+        limit: Общий лимит соединений
+        limit_per_host: Лимит соединений на один хост
+        keepalive_timeout: Время жизни keep-alive соединения, сек
+        ttl_dns_cache: Время кэширования DNS, сек
+        timeout: Общий таймаут запроса, сек
+        tls_reuse: Использовать один SSL-контекст на все соединения сессии
+            (сертификаты загружаются один раз, кэш TLS-сессий общий)
+
+    Тела запросов json=... сериализуются текущим кодеком (core.codec).
+
+    Returns:
+        aiohttp.ClientSession: Сессия, которую нужно закрыть через close()
+    """
+    ssl_context = None
+    if env_bool(f"{prefix}_TLS_REUSE", tls_reuse):
+        ssl_context = ssl.create_default_context()
+
+    connector = aiohttp.TCPConnector(
+        limit=env_int(f"{prefix}_POOL_LIMIT", limit),
+        limit_per_host=env_int(f"{prefix}_POOL_LIMIT_PER_HOST", limit_per_host),
+        keepalive_timeout=env_int(f"{prefix}_KEEPALIVE_TIMEOUT", keepalive_timeout),
+        ttl_dns_cache=env_int(f"{prefix}_DNS_CACHE_TTL", ttl_dns_cache),
+        use_dns_cache=True,
+        ssl=ssl_context if ssl_context is not None else True,
+    )
+    client_timeout = aiohttp.ClientTimeout(total=env_int(f"{prefix}_TIMEOUT", int(timeout)))
+    logger.info(f"Created pooled HTTP session for {prefix}")
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout, json_serialize=codec.dumps)
+
+
+async def close_session(session: Optional[aiohttp.ClientSession]) -> None:
+    """Закрывает сессию, если она была открыта"""
+    if session is not None and not session.closed:
+        await session.close()
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Set
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkQueue:
+    """
+    Очередь задач с упорядочиванием по ключу.
+
+    Задачи с одним ключом (например, chat_id) выполняются строго по
+    порядку поступления, задачи разных ключей - параллельно, но не
+    более concurrency одновременно. Общее число ожидающих задач
+    ограничено max_pending.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        concurrency: int = 8,
+        max_pending: int = 1000,
+    ) -> None:
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chains: Dict[Hashable, Deque[Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        """
+        Ставит задачу в очередь ключа.
+
+        Returns:
+            bool: False, если очередь переполнена
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        self._idle.clear()
+        chain = self._chains.get(key)
+        if chain is not None:
+            chain.append(item)
+            return True
+        self._chains[key] = deque([item])
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _drain(self, key: Hashable) -> None:
+        chain = self._chains[key]
+        try:
+            while chain:
+                item = chain[0]
+                async with self._semaphore:
+                    try:
+                        await self.handler(item)
+                        self.processed += 1
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"Work item for key {key} failed: {e}")
+                chain.popleft()
+                self.pending -= 1
+        finally:
+            del self._chains[key]
+            if not self._chains:
+                self._idle.set()
+
+    async def join(self) -> None:
+        """Ожидание выполнения всех поставленных задач"""
+        await self._idle.wait()
+
+    async def stop(self) -> None:
+        """Отмена выполняющихся задач"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.pending = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "active_keys": len(self._chains),
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,232 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from . import codec
+from .config import env_bool, env_float, env_int
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def truncate(text: str, limit: int) -> str:
+    """Обрезка строки до limit символов с пометкой об исходной длине"""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text)} chars]"
+
+
+class Payload:
+    """
+    Отложенная сериализация данных для лога.
+
+    JSON строится только при выводе записи (в потоке обработчика) и
+    обрезается до limit символов: logger.info("Neo response: %s", Payload(data)).
+    Объект не должен изменяться после передачи в лог.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value: Any, limit: Optional[int] = None) -> None:
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            try:
+                text = codec.dumps(self.value)
+            except (TypeError, ValueError):
+                text = repr(self.value)
+        return truncate(text, self.limit if self.limit is not None else _max_length)
+
+
+def sample(key: str) -> Dict[str, str]:
+    """extra для частых строк лога: logger.info(..., extra=sample('ws_send'))"""
+    return {'sample_key': key}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничение частоты строк с sample_key (см. sample()).
+
+    Для каждого ключа выводится не больше rate записей в секунду (и
+    burst подряд); к первой записи после паузы добавляется число
+    пропущенных. Записи без ключа проходят всегда.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: Optional[int] = None) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = float(burst if burst is not None else max(1, int(rate)))
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample_key', None)
+        if key is None or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # [токены, время последнего пополнения, пропущено]
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: bucket[2] for key, bucket in self._buckets.items()}
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Текстовый формат; сообщение обрезается до max_length символов"""
+
+    def __init__(self, fmt: str = TEXT_FORMAT, max_length: int = 2000) -> None:
+        super().__init__(fmt)
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = truncate(record.getMessage(), self.max_length)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message += f" (+{suppressed} suppressed)"
+        record.message = message
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        text = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class JsonFormatter(TruncatingFormatter):
+    """Структурированный формат: одна JSON-строка на запись"""
+
+    _RESERVED = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime', 'sample_key', 'suppressed'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.max_length),
+            "process": record.process,
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        # Поля из extra= попадают в запись как есть
+        for key, value in record.__dict__.items():
+            if key not in self._RESERVED:
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return codec.dumps(entry)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение до постановки в очередь,
+    то есть на event loop. Здесь запись уходит в очередь как есть
+    (msg и args), а форматирование и запись в поток выполняет
+    QueueListener в отдельном потоке. Трассировка исключения
+    сериализуется сразу: кадры стека к моменту вывода уже изменятся.
+    При переполнении очереди запись отбрасывается, а не блокирует loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_max_length = 2000
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(force: bool = False) -> Optional[logging.handlers.QueueListener]:
+    """
+    Настройка логирования процесса (замена logging.basicConfig).
+
+    LOG_LEVEL - уровень (INFO); LOG_FORMAT - text или json; LOG_MAX_LENGTH -
+    предел длины сообщения (2000, 0 - без обрезки); LOG_SAMPLE_RATE - записей
+    в секунду на ключ sample() (10, 0 - без ограничения); LOG_QUEUE -
+    запись через очередь и фоновый поток (по умолчанию включена),
+    LOG_QUEUE_SIZE - размер очереди. Как и basicConfig, ничего не делает,
+    если у корневого логгера уже есть обработчики (force=True - заменить их).
+
+    Returns:
+        QueueListener фонового потока или None
+    """
+    global _listener, _max_length
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return None
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    _max_length = env_int('LOG_MAX_LENGTH', 2000)
+    formatter_cls = JsonFormatter if os.getenv('LOG_FORMAT', 'text') == 'json' else TruncatingFormatter
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(formatter_cls(max_length=_max_length))
+    sampling = SamplingFilter(rate=env_float('LOG_SAMPLE_RATE', 10.0))
+
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    if env_bool('LOG_QUEUE', True):
+        log_queue: queue.Queue = queue.Queue(maxsize=env_int('LOG_QUEUE_SIZE', 10000))
+        handler: logging.Handler = DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler = stream
+    # Фильтр на обработчике вызывающей стороны: отброшенные записи не попадают в очередь
+    handler.addFilter(sampling)
+    root.addHandler(handler)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Вывод оставшихся в очереди записей и остановка фонового потока"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Sequence
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Перцентиль q (0..100) по методу ближайшего ранга; values должны быть отсортированы"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(values: Iterable[float], quantiles: Sequence[float] = (50, 95, 99)) -> Dict[str, float]:
+    """Среднее, максимум и перцентили выборки (в тех же единицах, что и values)"""
+    ordered = sorted(values)
+    result: Dict[str, float] = {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "max": round(ordered[-1], 3) if ordered else 0.0,
+    }
+    for q in quantiles:
+        result[f"p{q:g}"] = round(percentile(ordered, q), 3)
+    return result
+
+
+class LoopLagMonitor:
+    """
+    Замер задержки event loop.
+
+    Фоновая задача засыпает на interval и измеряет, насколько позже
+    она проснулась: задержка - время, которое loop был занят
+    синхронной работой. Последние window замеров доступны в stats().
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 1024, histogram: Optional[Histogram] = None) -> None:
+        self.interval = interval
+        self.histogram = histogram
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self) -> None:
+        self.samples.clear()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(lag)
+            if self.histogram is not None:
+                self.histogram.observe(lag)
+
+    def stats(self) -> Dict[str, Any]:
+        """Задержка loop в миллисекундах по последним замерам"""
+        return summarize(lag * 1000 for lag in self.samples)
@@ -0,0 +1,276 @@
+import abc
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы бакетов гистограмм задержек, сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional['Registry'] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def collect(self) -> List[str]:
+        """Строки экспозиции Prometheus для всех меток метрики"""
+
+
+class Counter(_Metric):
+    """Монотонный счетчик"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора"""
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение без меток, вычисляемое при каждом сборе"""
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        self.inc(amount=1, **labels)
+        try:
+            yield
+        finally:
+            self.dec(amount=1, **labels)
+
+    def collect(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с кумулятивными бакетами"""
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def collect(self) -> List[str]:
+        lines = []
+        for key in sorted(self._counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts[key]):
+                cumulative += count
+                le = _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Набор метрик, отдаваемых в текстовом формате Prometheus"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+HTTP_REQUEST_DURATION = Histogram(
+    'neonchat_http_request_duration_seconds',
+    'End-to-end HTTP request latency',
+    ['route', 'method', 'status'],
+)
+HTTP_INFLIGHT = Gauge(
+    'neonchat_http_requests_in_flight',
+    'HTTP requests currently being handled',
+    ['route'],
+)
+UPSTREAM_DURATION = Histogram(
+    'neonchat_upstream_request_duration_seconds',
+    'Upstream API call latency',
+    ['upstream', 'operation'],
+)
+UPSTREAM_INFLIGHT = Gauge(
+    'neonchat_upstream_requests_in_flight',
+    'Upstream API calls currently in progress',
+    ['upstream'],
+)
+UPSTREAM_ERRORS = Counter(
+    'neonchat_upstream_errors_total',
+    'Failed upstream API calls by status code',
+    ['upstream', 'status'],
+)
+UPSTREAM_RETRIES = Counter(
+    'neonchat_upstream_retries_total',
+    'Upstream API retries by status code of the failed attempt',
+    ['upstream', 'status'],
+)
+ADMISSION_WAIT = Histogram(
+    'neonchat_admission_wait_seconds',
+    'Time spent waiting for an upstream concurrency slot',
+    ['upstream', 'priority'],
+)
+ADMISSION_REJECTED = Counter(
+    'neonchat_admission_rejected_total',
+    'Requests shed by admission control',
+    ['upstream', 'priority', 'reason'],
+)
+CIRCUIT_STATE = Gauge(
+    'neonchat_circuit_state',
+    'Upstream circuit breaker state (0 closed, 1 half-open, 2 open)',
+    ['upstream'],
+)
+ROUTE_TARGET_DURATION = Histogram(
+    'neonchat_route_target_duration_seconds',
+    'Completion latency per routed model/endpoint target',
+    ['upstream', 'target'],
+)
+ROUTE_TARGET_FIRST_TOKEN = Histogram(
+    'neonchat_route_target_first_token_seconds',
+    'Time to first streamed token per routed model/endpoint target',
+    ['upstream', 'target'],
+)
+HEDGED_REQUESTS = Counter(
+    'neonchat_hedged_requests_total',
+    'Hedged upstream requests by the attempt that answered first',
+    ['upstream', 'winner'],
+)
+WS_CONNECTIONS = Gauge(
+    'neonchat_websocket_connections',
+    'Active WebSocket connections',
+)
+BROADCAST_FANOUT = Histogram(
+    'neonchat_broadcast_fanout_seconds',
+    'Time to hand a frame to all target WebSocket queues',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+BROADCAST_SEND = Histogram(
+    'neonchat_broadcast_send_seconds',
+    'Time from enqueue to WebSocket send completion',
+)
+EVENT_LOOP_LAG = Histogram(
+    'neonchat_event_loop_lag_seconds',
+    'Delay between scheduled and actual wake-up of the loop lag probe',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str) -> Iterator[None]:
+    """Замер задержки и счетчик in-flight для вызова внешнего API"""
+    with UPSTREAM_INFLIGHT.track_inprogress(upstream=upstream), \
+            UPSTREAM_DURATION.time(upstream=upstream, operation=operation):
+        yield
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .tracing import end_trace, start_trace
+
+logger = logging.getLogger(__name__)
+
+AnalyzeFunc = Callable[[str], Awaitable[Dict[str, Any]]]
+ResultCallback = Callable[..., Awaitable[None]]
+
+
+class AnalysisPipeline:
+    """
+    Фоновый конвейер анализа текста.
+
+    Задачи (message_id, text) кладутся в ограниченную очередь и
+    обрабатываются пулом воркеров. Результат передается в on_result
+    с тем же message_id и дополнительными параметрами задачи
+    (например, session_id для адресной доставки). Если очередь заполнена, задача отбрасывается
+    и учитывается в счетчике dropped.
+    """
+
+    def __init__(
+        self,
+        analyze: AnalyzeFunc,
+        on_result: ResultCallback,
+        workers: int = 2,
+        queue_size: int = 100,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.analyze = analyze
+        self.on_result = on_result
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Запуск воркеров"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"analysis-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Analysis pipeline started: {self.workers} workers, queue size {self.queue_size}")
+
+    async def stop(self) -> None:
+        """Остановка воркеров; необработанные задачи отбрасываются"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Analysis pipeline stopped")
+
+    async def submit(self, message_id: str, text: str, **extra: Any) -> bool:
+        """
+        Ставит текст в очередь на анализ.
+
+        Args:
+            message_id: Идентификатор сообщения
+            text: Текст для анализа
+            **extra: Параметры, передаваемые в on_result вместе с результатом
+
+        Returns:
+            bool: False, если очередь заполнена и задача отброшена
+        """
+        if not self.running:
+            await self.start()
+        assert self.queue is not None
+        try:
+            self.queue.put_nowait((message_id, text, extra))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Analysis queue is full, dropping message {message_id}")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def join(self) -> None:
+        """Ожидание обработки всех задач в очереди"""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def _worker(self, index: int) -> None:
+        assert self.queue is not None
+        while True:
+            message_id, text, extra = await self.queue.get()
+            # Своя трасса на задачу: контекст воркера скопирован при запуске
+            # и иначе копил бы спаны всех задач в трассе запуска
+            start_trace('analysis')
+            try:
+                metrics = await self.analyze(text)
+                await self.on_result(message_id, metrics, **extra)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Analysis worker {index} failed for message {message_id}: {e}")
+            finally:
+                end_trace()
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора количества воркеров"""
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,245 @@
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .config import env_float
+from .logs import sample
+from .resilience import RateLimited
+
+logger = logging.getLogger(__name__)
+
+_DURATION = re.compile(r'^(?:(?P<h>\d+(?:\.\d+)?)h)?(?:(?P<m>\d+(?:\.\d+)?)m(?!s))?(?:(?P<s>\d+(?:\.\d+)?)s)?(?:(?P<ms>\d+(?:\.\d+)?)ms)?$')
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Длительность из заголовка x-ratelimit-reset-* ("2m59.56s", "7.66s", "120ms") в секундах"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    match = _DURATION.match(value)
+    if match is None or not any(match.groupdict().values()):
+        return None
+    parts = {k: float(v) for k, v in match.groupdict().items() if v}
+    return parts.get('h', 0) * 3600 + parts.get('m', 0) * 60 + parts.get('s', 0) + parts.get('ms', 0) / 1000
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+class RateBudget:
+    """
+    Один лимит API (запросы или токены) по данным последнего ответа.
+
+    remaining и reset_at берутся из заголовков x-ratelimit-*; запросы в
+    работе резервируют свою стоимость до прихода ответа. Пока остаток
+    выше pace_below от лимита, вызовы не задерживаются; ниже - остаток
+    распределяется равномерно до сброса окна, чтобы не упереться в 429.
+    """
+
+    def __init__(self, name: str, pace_below: float = 0.1) -> None:
+        self.name = name
+        self.pace_below = pace_below
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.reserved = 0
+        self.last_granted = 0.0
+
+    def _refresh(self, now: float) -> None:
+        if self.remaining is not None and now >= self.reset_at:
+            # Окно сброшено: до нового ответа считаем лимит полным
+            self.remaining = self.limit
+
+    def delay(self, cost: int, now: float) -> float:
+        """Сколько ждать до вызова стоимостью cost (0 - можно сразу)"""
+        self._refresh(now)
+        if self.remaining is None:
+            return 0.0
+        available = self.remaining - self.reserved
+        if available < cost:
+            return max(0.0, self.reset_at - now)
+        if self.limit and self.remaining < self.pace_below * self.limit:
+            interval = max(0.0, self.reset_at - now) / max(1, available // max(1, cost))
+            return max(0.0, self.last_granted + interval - now)
+        return 0.0
+
+    def reserve(self, cost: int, now: float) -> None:
+        self.reserved += cost
+        self.last_granted = now
+
+    def release(self, cost: int) -> None:
+        self.reserved = max(0, self.reserved - cost)
+
+    def update(self, limit: Optional[int], remaining: Optional[int], reset: Optional[float], now: float) -> None:
+        if limit is not None:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+        if reset is not None:
+            self.reset_at = now + reset
+
+    def exhaust(self, retry_after: float, now: float) -> None:
+        """Ответ 429: бюджет исчерпан до истечения Retry-After"""
+        self.remaining = 0
+        self.reset_at = max(self.reset_at, now + retry_after)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        self._refresh(now)
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reserved": self.reserved,
+            "reset_in": round(max(0.0, self.reset_at - now), 3) if self.remaining is not None else None,
+        }
+
+
+class KeyBudget:
+    """Лимиты одного API-ключа: запросы и токены"""
+
+    def __init__(self, key: str, pace_below: float = 0.1, index: int = 0) -> None:
+        self.key = key
+        # Ключ в логах и статистике без раскрытия секрета
+        self.label = f"key{index}:...{key[-4:]}" if len(key) > 8 else f"key{index}"
+        self.requests = RateBudget('requests', pace_below)
+        self.tokens = RateBudget('tokens', pace_below)
+        self.granted = 0
+        self.throttled = 0
+
+    def delay(self, tokens: int, now: float) -> float:
+        return max(self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+
+class Ticket:
+    """Резерв бюджета одного вызова; освобождается в update() или release()"""
+
+    __slots__ = ('budget', 'tokens', 'done')
+
+    def __init__(self, budget: KeyBudget, tokens: int) -> None:
+        self.budget = budget
+        self.tokens = tokens
+        self.done = False
+
+    @property
+    def key(self) -> str:
+        return self.budget.key
+
+
+class RateLimitGovernor:
+    """
+    Клиентский ограничитель по лимитам внешнего API.
+
+    Перед вызовом acquire() выбирает ключ, у которого бюджет запросов и
+    токенов позволяет отправить запрос раньше всех, и при необходимости
+    ждет (не дольше max_wait). Если ждать дольше - RateLimited с
+    Retry-After, без обращения к API. Заголовки каждого ответа
+    (update()) уточняют остатки; ответ 429 исчерпывает бюджет ключа до
+    Retry-After. Пока API не сообщил лимиты, вызовы не ограничиваются.
+    """
+
+    def __init__(self, keys: Sequence[str], upstream: str = 'groq', max_wait: float = 5.0, pace_below: float = 0.1) -> None:
+        if not keys:
+            raise ValueError("At least one API key is required")
+        self.upstream = upstream
+        self.max_wait = max_wait
+        self.budgets: List[KeyBudget] = [KeyBudget(key, pace_below, i) for i, key in enumerate(dict.fromkeys(keys))]
+        self.waited = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, keys: Sequence[str], upstream: str = 'groq') -> 'RateLimitGovernor':
+        """Параметры из {PREFIX}_RATE_MAX_WAIT и {PREFIX}_RATE_PACE_BELOW"""
+        return cls(
+            keys,
+            upstream=upstream,
+            max_wait=env_float(f'{prefix}_RATE_MAX_WAIT', 5.0),
+            pace_below=env_float(f'{prefix}_RATE_PACE_BELOW', 0.1),
+        )
+
+    def _best(self, tokens: int, now: float) -> Tuple[KeyBudget, float]:
+        best = min(self.budgets, key=lambda b: b.delay(tokens, now))
+        return best, best.delay(tokens, now)
+
+    def retry_after(self, tokens: int = 0) -> float:
+        """Через сколько появится бюджет (0 - сейчас)"""
+        return self._best(tokens, time.monotonic())[1]
+
+    async def acquire(self, tokens: int = 0) -> Ticket:
+        """
+        Резерв бюджета под вызов с оценкой tokens токенов.
+
+        Raises:
+            RateLimited: бюджет появится позже, чем через max_wait
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while True:
+            now = time.monotonic()
+            budget, delay = self._best(tokens, now)
+            if delay <= 0:
+                budget.requests.reserve(1, now)
+                budget.tokens.reserve(tokens, now)
+                budget.granted += 1
+                return Ticket(budget, tokens)
+            if loop.time() + delay > deadline:
+                self.rejected += 1
+                budget.throttled += 1
+                logger.warning(
+                    "%s rate budget exhausted, rejecting call (retry in %.1fs)", self.upstream, delay,
+                    extra=sample('ratelimit.reject')
+                )
+                raise RateLimited(self.upstream, delay)
+            self.waited += 1
+            await asyncio.sleep(delay)
+
+    def release(self, ticket: Ticket) -> None:
+        """Вызов завершился без ответа API (ошибка соединения, отмена)"""
+        if not ticket.done:
+            ticket.done = True
+            ticket.budget.requests.release(1)
+            ticket.budget.tokens.release(ticket.tokens)
+
+    def update(self, ticket: Ticket, headers: Mapping[str, str], status: int = 200, retry_after: Optional[float] = None) -> None:
+        """Остатки лимитов из заголовков ответа x-ratelimit-*"""
+        self.release(ticket)
+        now = time.monotonic()
+        budget = ticket.budget
+        for item in (budget.requests, budget.tokens):
+            item.update(
+                _header_int(headers, f'x-ratelimit-limit-{item.name}'),
+                _header_int(headers, f'x-ratelimit-remaining-{item.name}'),
+                parse_duration(headers.get(f'x-ratelimit-reset-{item.name}')),
+                now,
+            )
+        if status == 429:
+            wait = retry_after if retry_after is not None else parse_duration(headers.get('x-ratelimit-reset-tokens')) or 1.0
+            budget.requests.exhaust(wait, now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "max_wait": self.max_wait,
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "keys": {
+                b.label: {
+                    "granted": b.granted,
+                    "throttled": b.throttled,
+                    "requests": b.requests.stats(now),
+                    "tokens": b.tokens.stats(now),
+                }
+                for b in self.budgets
+            },
+        }
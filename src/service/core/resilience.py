@@ -0,0 +1,274 @@
+import time
+import random
+import asyncio
+import logging
+import email.utils
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .config import env_float, env_int
+from .metrics import CIRCUIT_STATE, UPSTREAM_ERRORS, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Статусы, после которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class UpstreamError(Exception):
+    """Ошибочный ответ внешнего API"""
+
+    def __init__(self, message: str, status: int, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRYABLE_STATUSES
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен без обращения к API: предохранитель разомкнут"""
+
+    def __init__(self, upstream: str, retry_in: float) -> None:
+        super().__init__(f"Circuit for {upstream} is open, retry in {retry_in:.1f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class RateLimited(Exception):
+    """Запрос не отправлен: клиентский бюджет лимитов API исчерпан"""
+
+    # Повтор внутри того же вызова только сожжет время: бюджет появится через retry_after
+    retryable = False
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f"{upstream} rate limit reached, retry in {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Значение заголовка Retry-After в секундах (число секунд или HTTP-дата)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    Параметры повторов.
+
+    Пауза перед попыткой n - случайная величина от 0 до
+    min(max_delay, base_delay * multiplier ** n) (full jitter), но не
+    меньше Retry-After из ответа. attempt_timeout ограничивает одну
+    попытку, total_timeout - весь вызов вместе с паузами.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        multiplier: float = 2.0,
+        attempt_timeout: Optional[float] = 30.0,
+        total_timeout: Optional[float] = 60.0,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults: Any) -> 'RetryPolicy':
+        """Политика из переменных {PREFIX}_RETRY_* (значения по умолчанию - из defaults)"""
+        policy = cls(**defaults)
+        return cls(
+            max_attempts=env_int(f'{prefix}_RETRY_ATTEMPTS', policy.max_attempts),
+            base_delay=env_float(f'{prefix}_RETRY_BASE_DELAY', policy.base_delay),
+            max_delay=env_float(f'{prefix}_RETRY_MAX_DELAY', policy.max_delay),
+            multiplier=policy.multiplier,
+            attempt_timeout=env_float(f'{prefix}_ATTEMPT_TIMEOUT', policy.attempt_timeout or 0) or None,
+            total_timeout=env_float(f'{prefix}_TOTAL_TIMEOUT', policy.total_timeout or 0) or None,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза после неудачной попытки attempt (с нуля)"""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для одного внешнего API.
+
+    После failure_threshold подряд неудачных вызовов размыкается на
+    recovery_timeout: вызовы сразу получают CircuitOpenError. Затем
+    пропускается одна пробная попытка (half_open): успех замыкает
+    предохранитель, неудача снова размыкает его.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.set(0, upstream=name)
+
+    @classmethod
+    def from_env(cls, prefix: str, name: str) -> 'CircuitBreaker':
+        return cls(
+            name,
+            failure_threshold=env_int(f'{prefix}_CIRCUIT_THRESHOLD', 5),
+            recovery_timeout=env_float(f'{prefix}_CIRCUIT_RECOVERY', 30.0),
+        )
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(self._STATE_VALUES[state], upstream=self.name)
+
+    def before_call(self) -> None:
+        """Проверка перед попыткой; при разомкнутом предохранителе - CircuitOpenError"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """Попытка завершилась без вердикта о здоровье API (например, 4xx)"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+        if self.state == self.OPEN:
+            result["retry_in"] = round(max(0.0, self.opened_at + self.recovery_timeout - time.monotonic()), 3)
+        return result
+
+
+def _status_label(error: BaseException) -> str:
+    if isinstance(error, UpstreamError):
+        return str(error.status)
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, RateLimited):
+        return 'throttled'
+    return 'exception'
+
+
+async def call_with_retries(
+    operation: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    upstream: str = '',
+) -> Tuple[T, int]:
+    """
+    Вызов operation с повторами; возвращает результат и число попыток.
+
+    operation сообщает об ошибочном ответе через UpstreamError. Повторяются
+    статусы из RETRYABLE_STATUSES, таймауты и ошибки соединения; остальные
+    ошибки пробрасываются сразу. Если пауза не укладывается в total_timeout,
+    пробрасывается последняя ошибка.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.total_timeout if policy.total_timeout else None
+
+    for attempt in range(policy.max_attempts):
+        if breaker is not None:
+            breaker.before_call()
+
+        timeout = policy.attempt_timeout
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            timeout = min(timeout, remaining) if timeout else remaining
+
+        try:
+            if timeout is not None:
+                result = await asyncio.wait_for(operation(), timeout)
+            else:
+                result = await operation()
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            status = _status_label(e)
+            UPSTREAM_ERRORS.inc(upstream=upstream, status=status)
+            retryable = e.retryable if isinstance(e, (UpstreamError, RateLimited)) else True
+            if breaker is not None:
+                # 429 и 4xx - не признак неисправности API
+                if retryable and not (isinstance(e, UpstreamError) and e.status == 429):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+            if not retryable or attempt == policy.max_attempts - 1:
+                raise
+
+            delay = policy.backoff(attempt)
+            if isinstance(e, UpstreamError) and e.retry_after is not None:
+                delay = max(delay, e.retry_after)
+            if deadline is not None and loop.time() + delay >= deadline:
+                logger.warning(f"{upstream}: retry in {delay:.2f}s exceeds deadline, giving up")
+                raise
+
+            UPSTREAM_RETRIES.inc(upstream=upstream, status=status)
+            logger.warning(f"{upstream}: attempt {attempt + 1}/{policy.max_attempts} failed ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        return result, attempt + 1
+
+    raise RuntimeError("unreachable")  # pragma: no cover
@@ -0,0 +1,91 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionIndex:
+    """
+    Индекс подписок WebSocket-клиентов.
+
+    Клиент подписывается на session_id и/или конкретные message_id;
+    рассылка идет только заинтересованным соединениям. Количество
+    подписок на message_id для одного соединения ограничено, самые
+    старые вытесняются.
+    """
+
+    def __init__(self, max_message_ids: int = 256) -> None:
+        self.max_message_ids = max_message_ids
+        self.by_session: Dict[str, Set[Any]] = {}
+        self.by_message: Dict[str, Set[Any]] = {}
+        self._sessions: Dict[Any, Set[str]] = {}
+        self._messages: Dict[Any, 'OrderedDict[str, None]'] = {}
+
+    def subscribe(
+        self,
+        ws: Any,
+        session_id: Optional[str] = None,
+        message_ids: Iterable[str] = (),
+    ) -> None:
+        """Подписка соединения на сессию и/или сообщения"""
+        if session_id:
+            self.by_session.setdefault(session_id, set()).add(ws)
+            self._sessions.setdefault(ws, set()).add(session_id)
+
+        own = self._messages.setdefault(ws, OrderedDict())
+        for message_id in message_ids:
+            self.by_message.setdefault(message_id, set()).add(ws)
+            own[message_id] = None
+            own.move_to_end(message_id)
+            while len(own) > self.max_message_ids:
+                oldest, _ = own.popitem(last=False)
+                self._discard(self.by_message, oldest, ws)
+
+    def unsubscribe(
+        self,
+        ws: Any,
+        session_id: Optional[str] = None,
+        message_ids: Iterable[str] = (),
+    ) -> None:
+        """Отписка соединения от сессии и/или сообщений"""
+        if session_id:
+            self._discard(self.by_session, session_id, ws)
+            self._sessions.get(ws, set()).discard(session_id)
+
+        own = self._messages.get(ws)
+        for message_id in message_ids:
+            self._discard(self.by_message, message_id, ws)
+            if own is not None:
+                own.pop(message_id, None)
+
+    def remove(self, ws: Any) -> None:
+        """Удаление всех подписок соединения (при отключении)"""
+        for session_id in self._sessions.pop(ws, set()):
+            self._discard(self.by_session, session_id, ws)
+        for message_id in self._messages.pop(ws, OrderedDict()):
+            self._discard(self.by_message, message_id, ws)
+
+    def targets(self, message_id: Optional[str] = None, session_id: Optional[str] = None) -> Set[Any]:
+        """Соединения, подписанные на сообщение или сессию"""
+        result: Set[Any] = set()
+        if message_id:
+            result |= self.by_message.get(message_id, set())
+        if session_id:
+            result |= self.by_session.get(session_id, set())
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.by_session),
+            "message_ids": len(self.by_message),
+        }
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[Any]], key: str, ws: Any) -> None:
+        subscribers = index.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(ws)
+        if not subscribers:
+            del index[key]
@@ -0,0 +1,148 @@
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """Отрезок работы внутри трассы запроса"""
+
+    def __init__(self, name: str, trace_id: Optional[str], parent: Optional['Span'], attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Набор спанов одного запроса"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.finished = False
+
+    def timings(self) -> Dict[str, Dict[str, Any]]:
+        """Суммарная длительность по именам спанов в порядке их начала"""
+        result: Dict[str, Dict[str, Any]] = {}
+        for span in sorted(self.spans, key=lambda s: s.start):
+            entry = result.setdefault(span.name, {"dur": 0.0})
+            entry["dur"] = round(entry["dur"] + span.duration_ms, 3)
+            for key, value in span.attrs.items():
+                entry[key] = value
+        return result
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        parts = []
+        for name, entry in self.timings().items():
+            part = f"{name};dur={entry['dur']}"
+            desc = ' '.join(f"{k}={v}" for k, v in entry.items() if k != 'dur')
+            if desc:
+                part += f';desc="{desc}"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+SpanHook = Callable[[Span], None]
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('span', default=None)
+_hooks: List[SpanHook] = []
+
+
+def add_span_hook(hook: SpanHook) -> None:
+    """Регистрация обработчика завершенных спанов (экспорт трасс)"""
+    _hooks.append(hook)
+
+
+def remove_span_hook(hook: SpanHook) -> None:
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def log_span_hook(span: Span) -> None:
+    """Простой экспорт: каждый спан пишется в лог"""
+    logger.info("span %s %.1fms trace=%s attrs=%s", span.name, span.duration_ms, span.trace_id, span.attrs)
+
+
+def start_trace(name: str) -> Trace:
+    """Начало трассы в текущем контексте (обработчик запроса, задача воркера)"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def end_trace() -> Optional[Trace]:
+    """
+    Завершение трассы: последующие задачи этого контекста ее не наследуют,
+    а задачи, уже скопировавшие контекст, больше не добавляют в нее спаны.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.finished = True
+    _current_trace.set(None)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """Замер участка кода; спан попадает в текущую трассу и в хуки"""
+    trace = _current_trace.get()
+    if trace is not None and trace.finished:
+        trace = None
+    current = Span(name, trace.trace_id if trace is not None else None, _current_span.get(), attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        if trace is not None:
+            trace.spans.append(current)
+        for hook in list(_hooks):
+            try:
+                hook(current)
+            except Exception as e:
+                logger.warning(f"Span hook failed: {e}")
+
+
+def annotate(**attrs: Any) -> None:
+    """Добавляет атрибуты к текущему спану (например, число попыток)"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
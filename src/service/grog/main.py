@@ -1,30 +1,107 @@
 # mypy: ignore-errors
 import os
-import json
-import logging
-from typing import Dict, Optional, List, Any
-import requests
 import asyncio
+import logging
+from typing import AsyncIterator, Dict, Optional, List, Any, Tuple
+import aiohttp
 import time
+from ..core import codec
+from ..core.http import create_session, close_session
+from ..core.logs import sample
+from ..core.cache import TieredCache, make_key
+from ..core.config import env_bool, env_float, env_int
+from ..core.metrics import track_upstream
+from ..core.conversation import message_tokens
+from ..core.ratelimit import RateLimitGovernor, Ticket
+from ..core.resilience import CircuitBreaker, RetryPolicy, UpstreamError, call_with_retries, parse_retry_after
+from ..core.tracing import annotate
+from .router import ModelRouter, RouteTarget
 
 logger = logging.getLogger(__name__)
 
 class GroqAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, redis: Optional[Any] = None):
         if not api_key:
             raise ValueError("GROQ_API_KEY is required")
         self.api_key = api_key
-        self.base_url = 'https://api.groq.com/openai/v1/chat/completions'
-        self.model = 'mixtral-8x7b-32768'
+        # Дополнительные ключи (GROQ_API_KEYS через запятую) расширяют общий бюджет лимитов
+        extra_keys = [k.strip() for k in os.getenv('GROQ_API_KEYS', '').split(',') if k.strip()]
+        # Темп запросов по заголовкам x-ratelimit-* (GROQ_RATE_MAX_WAIT, GROQ_RATE_PACE_BELOW)
+        self.governor = RateLimitGovernor.from_env('GROQ', [api_key] + extra_keys)
+        # GROQ_API_BASE позволяет направить клиент на совместимый сервер (например, стенд нагрузочных тестов)
+        api_base = os.getenv('GROQ_API_BASE', 'https://api.groq.com/openai/v1').rstrip('/')
+        # Пул моделей/endpoint-ов с выбором по задержке и хеджированием (GROQ_MODELS, GROQ_HEDGE*)
+        self.router = ModelRouter.from_env('GROQ', os.getenv('GROQ_MODEL', 'mixtral-8x7b-32768'), api_base)
+        self.base_url = self._completions_url(self.router.primary)
+        # Основная модель: подпись спана
+        self.model = self.router.primary.model
+        self.temperature = 0.7
+        self.max_tokens = 1000
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Повторы с экспоненциальной паузой и предохранитель (GROQ_RETRY_*, GROQ_CIRCUIT_*)
+        self.retry_policy = RetryPolicy.from_env('GROQ')
+        self.breaker = CircuitBreaker.from_env('GROQ', 'groq')
+        # Кэш точных совпадений (модели пула, messages, temperature, max_tokens), включается GROQ_CACHE_ENABLED
+        self.cache: Optional[TieredCache] = None
+        if env_bool('GROQ_CACHE_ENABLED', False):
+            self.cache = TieredCache(
+                'groq:completion',
+                max_size=env_int('GROQ_CACHE_SIZE', 512),
+                ttl=env_float('GROQ_CACHE_TTL', 600),
+                redis=redis,
+            )
+
+    async def start(self) -> None:
+        """Создает общую сессию с пулом соединений (вызывается при старте приложения)"""
+        await self._session()
+
+    async def close(self) -> None:
+        """Закрывает сессию (вызывается при остановке приложения)"""
+        await close_session(self.session)
+        self.session = None
+
+    async def _session(self) -> aiohttp.ClientSession:
+        """Открытая общая сессия: создается при первом обращении и после закрытия"""
+        if self.session is None or self.session.closed:
+            self.session = create_session('GROQ')
+        return self.session
+
+    @staticmethod
+    def _completions_url(target: RouteTarget) -> str:
+        return f'{target.base_url}/chat/completions'
 
-    async def get_response(self, message: str, context: Optional[List[Dict[str, str]]] = None, max_retries: int = 3) -> str:
+    def _token_estimate(self, messages: List[Dict[str, str]]) -> int:
+        """Верхняя оценка токенов запроса для бюджета: промпт + max_tokens"""
+        return sum(message_tokens(m) for m in messages) + self.max_tokens
+
+    async def _check_response(self, response: aiohttp.ClientResponse, ticket: Ticket, target: RouteTarget) -> None:
+        """Обновление бюджета по заголовкам ответа; ошибочный статус - UpstreamError"""
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        self.governor.update(ticket, response.headers, response.status, retry_after)
+        if response.status != 200:
+            error_msg = f"Groq API Error: {response.status} - {await response.text()} (target {target.name})"
+            logger.error(error_msg)
+            raise UpstreamError(error_msg, response.status, retry_after)
+
+    def _build_messages(self, message: str, context: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """Собирает список сообщений для запроса к Groq API"""
+        if context:
+            last = context[-1]
+            if last.get('role') == 'user' and last.get('content') == message:
+                return context
+            # Новое сообщение еще не в контексте - добавляем его в конец
+            return context + [{'role': 'user', 'content': message}]
+        return [{'role': 'user', 'content': message}]
+
+    async def get_response(self, message: str, context: Optional[List[Dict[str, str]]] = None, max_retries: Optional[int] = None, use_cache: bool = True) -> str:
         """
         Асинхронно получает ответ от Groq API с учетом контекста диалога.
 
         Args:
             message: Текст сообщения
             context: Список предыдущих сообщений в формате [{role: str, content: str}]
-            max_retries: Максимальное количество попыток
+            max_retries: Максимальное количество попыток (по умолчанию GROQ_RETRY_ATTEMPTS)
+            use_cache: Разрешить ответ из кэша (если кэш включен)
 
         Returns:
             str: Ответ от API
@@ -32,59 +109,202 @@ class GroqAPI:
         Raises:
             Exception: При ошибке запроса к API
         """
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Attempt {attempt + 1}/{max_retries} - Sending request to Groq API: {message[:50]}...")
+        result = await self.complete(message, context, max_retries, use_cache)
+        return result['content']
+
+    def cache_key(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Канонический ключ запроса для кэша ответов.
+
+        Ключ общий для всего пула моделей (GROQ_MODELS): модели пула
+        взаимозаменяемы, ответ любой из них, в том числе хеджированный,
+        отдается на тот же запрос. Смена состава пула меняет ключ.
+        """
+        models = [target.model for target in self.router.targets]
+        return make_key(models, messages, self.temperature, self.max_tokens)
+
+    async def complete(self, message: str, context: Optional[List[Dict[str, str]]] = None, max_retries: Optional[int] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Получает ответ Groq API вместе со служебной информацией о запросе.
+
+        При use_cache=False кэш не читается, но свежий ответ в него записывается.
+
+        Returns:
+            Dict: {"content": str, "cached": bool, "attempts": int}
+        """
+        messages = self._build_messages(message, context)
+
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(messages)
+            if use_cache:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    logger.info("Groq API response served from cache")
+                    return {"content": cached, "cached": True, "attempts": 0}
+
+        content, attempts = await self._request_completion(messages, message, max_retries)
+        if key is not None:
+            await self.cache.set(key, content)
+        return {"content": content, "cached": False, "attempts": attempts}
+
+    async def _request_completion(self, messages: List[Dict[str, str]], message: str, max_retries: Optional[int]) -> Tuple[str, int]:
+        """Запрос к Groq API с повторными попытками; возвращает ответ и число попыток"""
+        policy = self.retry_policy
+        if max_retries is not None:
+            policy = RetryPolicy(
+                max_attempts=max_retries,
+                base_delay=policy.base_delay,
+                max_delay=policy.max_delay,
+                multiplier=policy.multiplier,
+                attempt_timeout=policy.attempt_timeout,
+                total_timeout=policy.total_timeout,
+            )
+
+        tokens = self._token_estimate(messages)
 
-                messages = context if context else []
-                if not context:
-                    messages = [{'role': 'user', 'content': message}]
+        async def attempt() -> Dict[str, Any]:
+            logger.info("Sending request to Groq API: %.50s...", message, extra=sample('groq.request'))
+            session = await self._session()
 
-                start_time = time.time()
-                response = requests.post(
-                    self.base_url,
+            async def send(target: RouteTarget) -> Dict[str, Any]:
+                # Бюджет лимитов на каждый запрос, включая хеджированный;
+                # без бюджета - RateLimited без обращения к API
+                ticket = await self.governor.acquire(tokens)
+                try:
+                    with track_upstream('groq', 'completion'):
+                        async with session.post(
+                            self._completions_url(target),
+                            headers={
+                                'Authorization': f'Bearer {ticket.key}',
+                                'Content-Type': 'application/json'
+                            },
+                            json={
+                                'model': target.model,
+                                'messages': messages,
+                                'temperature': self.temperature,
+                                'max_tokens': self.max_tokens
+                            }
+                        ) as response:
+                            await self._check_response(response, ticket, target)
+                            return await response.json(loads=codec.loads)
+                finally:
+                    self.governor.release(ticket)
+
+            # Повтор выбирает цель заново: после ошибки запрос уходит другой модели.
+            # Дублирующий запрос отправляется, только если бюджет есть сразу
+            return await self.router.execute(send, can_hedge=lambda: self.governor.retry_after(tokens) <= 0)
+
+        start_time = time.time()
+        try:
+            result, attempts = await call_with_retries(attempt, policy, self.breaker, upstream='groq')
+        except Exception as e:
+            logger.error(f"Error in Groq API request: {str(e)}")
+            raise
+        elapsed = time.time() - start_time
+
+        content: str = result['choices'][0]['message']['content']
+        usage = result.get('usage') or {}
+        logger.info(
+            "Received response from Groq API in %.2fs (attempts: %d, tokens: %s, prompt: %s, completion: %s): %.50s...",
+            elapsed, attempts, usage.get('total_tokens'), usage.get('prompt_tokens'), usage.get('completion_tokens'), content,
+            extra=sample('groq.response')
+        )
+
+        return content, attempts
+
+    async def stream_response(self, message: str, context: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """
+        Получает ответ от Groq API в режиме стриминга (stream: true).
+
+        Args:
+            message: Текст сообщения
+            context: Список предыдущих сообщений в формате [{role: str, content: str}]
+
+        Yields:
+            str: Очередной фрагмент (токен) ответа
+
+        Raises:
+            Exception: При ошибке запроса к API
+        """
+        logger.info("Streaming request to Groq API: %.50s...", message, extra=sample('groq.request'))
+        start_time = time.time()
+
+        with track_upstream('groq', 'stream'):
+            async for token in self._stream_tokens(message, context, start_time):
+                yield token
+
+        logger.info("Stream completed in %.2fs", time.time() - start_time, extra=sample('groq.response'))
+
+    async def _stream_tokens(self, message: str, context: Optional[List[Dict[str, str]]], start_time: float) -> AsyncIterator[str]:
+        """Чтение SSE-потока Groq API; повторяется только открытие потока, до первого токена"""
+        first_token_time: Optional[float] = None
+        messages = self._build_messages(message, context)
+
+        async def open_stream() -> Tuple[aiohttp.ClientResponse, RouteTarget, float]:
+            # Стрим не хеджируется: цель выбирается на каждую попытку открытия
+            session = await self._session()
+            target = self.router.choose()
+            ticket = await self.governor.acquire(self._token_estimate(messages))
+            started = self.router.begin(target)
+            try:
+                response = await session.post(
+                    self._completions_url(target),
                     headers={
-                        'Authorization': f'Bearer {self.api_key}',
-                        'Content-Type': 'application/json'
+                        'Authorization': f'Bearer {ticket.key}',
+                        'Content-Type': 'application/json',
+                        'Accept': 'text/event-stream'
                     },
                     json={
-                        'model': self.model,
+                        'model': target.model,
                         'messages': messages,
-                        'temperature': 0.7,
-                        'max_tokens': 1000
-                    },
-                    timeout=30
+                        'temperature': self.temperature,
+                        'max_tokens': self.max_tokens,
+                        'stream': True
+                    }
                 )
-                elapsed = time.time() - start_time
+                try:
+                    await self._check_response(response, ticket, target)
+                except Exception:
+                    response.release()
+                    raise
+            except BaseException as e:
+                if not isinstance(e, asyncio.CancelledError):
+                    target.record_failure(e)
+                self.router.end(target)
+                raise
+            finally:
+                self.governor.release(ticket)
+            return response, target, started
 
-                if response.status_code == 503:
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(1)  # Пауза перед повторной попыткой
+        (response, target, started), _ = await call_with_retries(
+            open_stream, self.retry_policy, self.breaker, upstream='groq'
+        )
+        annotate(target=target.name)
+        try:
+            async with response:
+                # Ответ приходит как Server-Sent Events: строки вида "data: {...}"
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
                         continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
 
-                if response.status_code != 200:
-                    error_msg = f"Groq API Error: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-
-                result = response.json()
-                content: str = result['choices'][0]['message']['content']
-                logger.info(f"Received response from Groq API: {content[:50]}...")
-                logger.info(f"Response time: {elapsed:.2f}s")
-
-                if hasattr(response, 'usage'):
-                    logger.info(f"Tokens used: {response.usage.total_tokens} "
-                               f"(prompt: {response.usage.prompt_tokens}, "
-                               f"completion: {response.usage.completion_tokens})")
-
-                return content
-
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                    await asyncio.sleep(1)
-                    continue
-                logger.error(f"Error in Groq API request: {str(e)}")
-                raise
-
-        return "Failed to get response after all retries"  # Добавлен возвращаемый результат по умолчанию
+                    chunk = codec.loads(data)
+                    choices = chunk.get('choices') or [{}]
+                    token = choices[0].get('delta', {}).get('content')
+                    if token:
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                            # Здоровье и задержка цели для маршрутизатора
+                            self.router.record_first_token(target, started)
+                            logger.info("Time to first token: %.2fs", first_token_time, extra=sample('groq.first_token'))
+                        yield token
+        except Exception as e:
+            if first_token_time is None:
+                target.record_failure(e)
+            raise
+        finally:
+            self.router.end(target)
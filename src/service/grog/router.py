@@ -0,0 +1,296 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, TypeVar
+
+from ..core.config import env_bool, env_float, env_int
+from ..core.loop import percentile
+from ..core.logs import sample
+from ..core.metrics import HEDGED_REQUESTS, ROUTE_TARGET_DURATION, ROUTE_TARGET_FIRST_TOKEN
+from ..core.resilience import UpstreamError
+from ..core.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Статусы, после которых цель временно исключается из маршрутизации
+COOLDOWN_STATUSES = frozenset({429, 503})
+
+
+class RouteTarget:
+    """
+    Модель на конкретном endpoint-е и ее недавняя статистика: окно
+    задержек успешных ответов, окно времени до первого токена стримов,
+    скользящая доля ошибок и число запросов в работе.
+    """
+
+    def __init__(self, model: str, base_url: str, window: int = 200, name: Optional[str] = None) -> None:
+        self.model = model
+        self.base_url = base_url
+        self.name = name or model
+        self.latencies: Deque[float] = deque(maxlen=window)
+        # Отдельное окно: время до первого токена не сравнимо с временем полного ответа
+        self.first_token: Deque[float] = deque(maxlen=window)
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Перцентиль q (0..100) задержки по окну, None без замеров"""
+        if not self.latencies:
+            return None
+        return percentile(sorted(self.latencies), q)
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.error_rate *= 0.9
+
+    def record_first_token(self, latency: float) -> None:
+        self.first_token.append(latency)
+        self.error_rate *= 0.9
+
+    def record_failure(self, error: BaseException) -> None:
+        self.errors += 1
+        self.error_rate = 0.9 * self.error_rate + 0.1
+        if isinstance(error, UpstreamError) and error.status in COOLDOWN_STATUSES:
+            # Перегруженная модель не получает запросов, пока не пройдет Retry-After
+            self.cooldown_until = time.monotonic() + (error.retry_after or 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(50), self.quantile(95)
+        ttft = percentile(sorted(self.first_token), 50) if self.first_token else None
+        return {
+            "model": self.model,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "inflight": self.inflight,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "first_token_p50_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+        }
+
+
+class ModelRouter:
+    """
+    Выбор модели/endpoint-а для запроса и хеджирование.
+
+    Запрос уходит цели с наименьшей оценкой: медиана задержки с поправкой
+    на долю ошибок и число запросов в работе; при равенстве - первая в
+    списке. Цели без замеров и давно не использованные (probe_interval)
+    получают запрос вне очереди, чтобы статистика не устаревала. Цели
+    после 429/503 пропускаются до истечения Retry-After.
+
+    С hedge=True, если основная цель не ответила за свой p{hedge_quantile},
+    тот же запрос отправляется второй цели; используется первый успешный
+    ответ, второй запрос отменяется. Хеджирование включается после
+    min_samples замеров цели и ограничено бюджетом: не больше
+    hedge_budget от всех запросов.
+    """
+
+    def __init__(
+        self,
+        targets: Iterable[RouteTarget],
+        upstream: str = 'groq',
+        hedge: bool = False,
+        hedge_quantile: float = 95.0,
+        hedge_min_delay: float = 0.05,
+        hedge_budget: float = 0.1,
+        min_samples: int = 20,
+        probe_interval: float = 30.0,
+    ) -> None:
+        self.targets: List[RouteTarget] = list(targets)
+        if not self.targets:
+            raise ValueError("At least one routing target is required")
+        names = [t.name for t in self.targets]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Routing target names must be unique: {names}")
+        self.upstream = upstream
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, default_model: str, default_base: str, upstream: str = 'groq') -> 'ModelRouter':
+        """
+        Пул целей из {PREFIX}_MODELS: "model[@base_url],..." (по умолчанию -
+        одна default_model на default_base). Хеджирование: {PREFIX}_HEDGE,
+        {PREFIX}_HEDGE_QUANTILE, {PREFIX}_HEDGE_MIN_DELAY, {PREFIX}_HEDGE_BUDGET,
+        {PREFIX}_HEDGE_MIN_SAMPLES; окно статистики - {PREFIX}_ROUTER_WINDOW.
+        """
+        window = env_int(f'{prefix}_ROUTER_WINDOW', 200)
+        targets = []
+        specs = [s.strip() for s in (os.getenv(f'{prefix}_MODELS') or default_model).split(',') if s.strip()]
+        models = [spec.partition('@')[0] for spec in specs]
+        for spec, model in zip(specs, models):
+            base = (spec.partition('@')[2] or default_base).rstrip('/')
+            # Одна модель на нескольких endpoint-ах различается по адресу
+            name = f'{model}@{base}' if models.count(model) > 1 else model
+            targets.append(RouteTarget(model, base, window, name=name))
+        return cls(
+            targets,
+            upstream=upstream,
+            hedge=env_bool(f'{prefix}_HEDGE', False),
+            hedge_quantile=env_float(f'{prefix}_HEDGE_QUANTILE', 95.0),
+            hedge_min_delay=env_float(f'{prefix}_HEDGE_MIN_DELAY', 0.05),
+            hedge_budget=env_float(f'{prefix}_HEDGE_BUDGET', 0.1),
+            min_samples=env_int(f'{prefix}_HEDGE_MIN_SAMPLES', 20),
+            probe_interval=env_float(f'{prefix}_ROUTER_PROBE_INTERVAL', 30.0),
+        )
+
+    @property
+    def primary(self) -> RouteTarget:
+        return self.targets[0]
+
+    def _score(self, target: RouteTarget, now: float) -> float:
+        p50 = target.quantile(50)
+        if p50 is None or now - target.last_used > self.probe_interval:
+            return 0.0
+        return p50 * (1 + 4 * target.error_rate) * (1 + 0.1 * target.inflight)
+
+    def choose(self, exclude: Iterable[RouteTarget] = ()) -> RouteTarget:
+        """
+        Лучшая доступная цель. Если все цели после 429/503 еще на паузе,
+        выбирается та, чья пауза закончится раньше: ожидание Retry-After
+        уже учтено политикой повторов.
+        """
+        now = time.monotonic()
+        excluded = set(map(id, exclude))
+        allowed = [t for t in self.targets if id(t) not in excluded] or self.targets
+        candidates = [t for t in allowed if t.cooldown_until <= now]
+        if not candidates:
+            return min(allowed, key=lambda t: t.cooldown_until)
+        return min(candidates, key=lambda t: self._score(t, now))
+
+    def hedge_delay(self, target: RouteTarget) -> Optional[float]:
+        """Через сколько отправлять дублирующий запрос; None - не хеджировать"""
+        if not self.hedge or len(target.latencies) < self.min_samples:
+            return None
+        if self.hedged >= self.hedge_budget * self.requests:
+            return None
+        return max(self.hedge_min_delay, target.quantile(self.hedge_quantile) or 0.0)
+
+    def begin(self, target: RouteTarget) -> float:
+        """
+        Учет запроса к цели; для вызовов вне execute (стрим) парой к end().
+        Возвращает момент начала для замера задержки.
+        """
+        target.requests += 1
+        target.inflight += 1
+        target.last_used = time.monotonic()
+        return time.perf_counter()
+
+    def end(self, target: RouteTarget) -> None:
+        target.inflight -= 1
+
+    def record_first_token(self, target: RouteTarget, started: float) -> None:
+        """Успешный стрим: время до первого токена от begin()"""
+        elapsed = time.perf_counter() - started
+        target.record_first_token(elapsed)
+        ROUTE_TARGET_FIRST_TOKEN.observe(elapsed, upstream=self.upstream, target=target.name)
+
+    async def _call(self, target: RouteTarget, send: Callable[[RouteTarget], Awaitable[T]]) -> T:
+        started = self.begin(target)
+        try:
+            result = await send(target)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            target.record_failure(e)
+            raise
+        finally:
+            self.end(target)
+        elapsed = time.perf_counter() - started
+        target.record_success(elapsed)
+        ROUTE_TARGET_DURATION.observe(elapsed, upstream=self.upstream, target=target.name)
+        return result
+
+    async def execute(
+        self,
+        send: Callable[[RouteTarget], Awaitable[T]],
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Один вызов через маршрутизатор: send(target) выполняет запрос к
+        выбранной цели. Ошибка пробрасывается, если не ответила ни одна
+        из задействованных целей (для хеджированного запроса - ошибка
+        основной). can_hedge() проверяется перед дублирующим запросом:
+        False (например, нет бюджета лимитов API) - ждем только основную.
+        """
+        self.requests += 1
+        primary = self.choose()
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            annotate(target=primary.name)
+            return await self._call(primary, send)
+
+        first = asyncio.ensure_future(self._call(primary, send))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                annotate(target=primary.name)
+                return first.result()
+
+            if can_hedge is not None and not can_hedge():
+                self.hedges_skipped += 1
+                annotate(target=primary.name)
+                return await first
+
+            secondary = self.choose(exclude=[primary]) if len(self.targets) > 1 else primary
+            self.hedged += 1
+            logger.info(
+                "Hedging %s request: %s did not answer in %.0fms, sending to %s",
+                self.upstream, primary.name, delay * 1000, secondary.name, extra=sample('router.hedge')
+            )
+            second = asyncio.ensure_future(self._call(secondary, send))
+            pending.add(second)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exception = task.exception()
+                    if exception is None:
+                        winner = 'hedge' if task is second else 'primary'
+                        if task is second:
+                            self.hedge_wins += 1
+                        HEDGED_REQUESTS.inc(upstream=self.upstream, winner=winner)
+                        annotate(target=(secondary if task is second else primary).name, hedged=winner)
+                        return task.result()
+                    if task is first or error is None:
+                        error = exception
+            HEDGED_REQUESTS.inc(upstream=self.upstream, winner='none')
+            # Обе задачи завершились с ошибкой - error заполнен в цикле
+            if error is None:
+                raise RuntimeError(f"{self.upstream} hedged request finished without result")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,
+            "targets": {t.name: t.stats() for t in self.targets},
+        }
@@ -1,179 +1,899 @@
 import os
-import json
 import asyncio
+import contextvars
 import logging
 import datetime
+import functools
+import multiprocessing
+import signal
+import time
+import math
+import uuid
 from aiohttp import web
 import websockets
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from .grog.main import GroqAPI
 from .neoapi.main import NeoAPI
 from .telegram.main import Neon_Nexus_AI_bot_webhook
+from .core import (
+    AdmissionRejected, AnalysisPipeline, Broadcaster, CircuitOpenError, ConversationStore, LoopLagMonitor, RateLimited, SubscriptionIndex,
+    create_bus, create_limiters, create_redis, env_bool, env_float, env_int, message_tokens, trim_to_budget
+)
+from .core import codec
+from .core.cache import redis_configured
+from .core.analytics import AnalyticsStore, parse_time
+from .core.logs import configure_logging, sample
+from .core import metrics as prom
+from .core.tracing import add_span_hook, annotate, current_trace, end_trace, log_span_hook, span, start_trace
 
 # Загружаем переменные окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Настройка логирования: запись через очередь и фоновый поток (см. core.logs)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 class ServiceHandler:
     def __init__(self):
         self.ws_connections: Set[websockets.WebSocketServerProtocol] = set()
-        self.groq_api = GroqAPI(os.getenv('GROQ_API_KEY'))
-        self.neo_api = NeoAPI(os.getenv('NEO_API_KEY'))
-        logger.info("ServiceHandler initialized")
+        # Формат кадров клиентов, выбравших не JSON (?format=msgpack при подключении)
+        self.ws_formats: Dict[websockets.WebSocketServerProtocol, str] = {}
+        self.broadcaster = Broadcaster(
+            queue_size=env_int('WS_QUEUE_SIZE', 32),
+            send_timeout=env_float('WS_SEND_TIMEOUT', 5.0),
+            policy=os.getenv('WS_SLOW_POLICY', 'drop_oldest'),
+            on_disconnect=self._forget_websocket,
+        )
+        self.subscriptions = SubscriptionIndex(
+            max_message_ids=env_int('WS_MAX_MESSAGE_SUBSCRIPTIONS', 256)
+        )
+        # Старый режим: все кадры уходят всем подключенным клиентам
+        self.broadcast_all = env_bool('WS_BROADCAST_ALL', False)
+        # Общий клиент Redis (None, если REDIS_URL не задан)
+        self.redis = create_redis()
+        # Шина рассылки: с Redis кадры доходят до клиентов любого воркера
+        self.bus = create_bus(self._on_bus_message, self.redis)
+        self.groq_api = GroqAPI(os.getenv('GROQ_API_KEY'), redis=self.redis)
+        self.neo_api = NeoAPI(os.getenv('NEO_API_KEY'), redis=self.redis)
+
+        # История диалогов на сервере: клиент может присылать только session_id
+        self.conversations = ConversationStore(
+            token_budget=env_int('CONVERSATION_TOKEN_BUDGET', 4000),
+            max_messages=env_int('CONVERSATION_MAX_MESSAGES', 200),
+            max_sessions=env_int('CONVERSATION_MAX_SESSIONS', 1000),
+            ttl=env_float('CONVERSATION_TTL', 86400),
+            redis=self.redis,
+            system_prompt=os.getenv('CONVERSATION_SYSTEM_PROMPT'),
+            summarizer=self._summarize_conversation if env_bool('CONVERSATION_SUMMARY', False) else None,
+        )
+        self._background: Set[asyncio.Task] = set()
+        prom.WS_CONNECTIONS.set_function(lambda: len(self.ws_connections))
+
+        # inline - анализ в пути ответа, background - через очередь воркеров
+        self.analysis_mode = os.getenv('ANALYSIS_MODE', 'inline')
+        # Локальные метрики рассылаются сразу и заменяются ответом Neo API
+        self.provisional_metrics = env_bool('ANALYSIS_PROVISIONAL', True)
+        self.analysis_pipeline = AnalysisPipeline(
+            analyze=lambda text: self.neo_api.analyze_text(text),
+            on_result=self._on_analysis_result,
+            workers=env_int('ANALYSIS_WORKERS', 2),
+            queue_size=env_int('ANALYSIS_QUEUE_SIZE', 100),
+        )
+        # Журнал результатов анализа с агрегатами по времени (ANALYTICS_DB)
+        self.analytics = AnalyticsStore.from_env()
+        # Ограничение параллельных вызовов внешних API с очередями web/telegram
+        self.admission = create_limiters(
+            {'groq': env_int('ADMISSION_GROQ_LIMIT', 32), 'neo': env_int('ADMISSION_NEO_LIMIT', 64)},
+            priority=os.getenv('ADMISSION_PRIORITY'),
+        )
+        # Задержка event loop: гистограмма в /metrics и сводка в /health
+        self.loop_lag = LoopLagMonitor(
+            interval=env_float('LOOP_LAG_INTERVAL', 0.1),
+            histogram=prom.EVENT_LOOP_LAG,
+        )
+        logger.info(f"ServiceHandler initialized (analysis mode: {self.analysis_mode})")
+
+    async def on_startup(self, app: web.Application) -> None:
+        """Открытие долгоживущих HTTP-сессий к внешним API"""
+        await self.groq_api.start()
+        await self.neo_api.start()
+        await self.bus.start()
+        self.loop_lag.start()
+        if self.analytics is not None:
+            await self.analytics.start()
+        if self.analysis_mode == 'background':
+            await self.analysis_pipeline.start()
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        """Закрытие HTTP-сессий при остановке приложения"""
+        for task in list(self._background):
+            task.cancel()
+        await self.loop_lag.stop()
+        await self.analysis_pipeline.stop()
+        if self.analytics is not None:
+            await self.analytics.stop()
+        await self.bus.stop()
+        await self.broadcaster.close()
+        await self.groq_api.close()
+        await self.neo_api.close()
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def circuits(self) -> Dict:
+        """Состояние предохранителей внешних API"""
+        return {
+            "groq": self.groq_api.breaker.stats(),
+            "neo": self.neo_api.breaker.stats(),
+        }
+
+    def stats(self) -> Dict:
+        """Счетчики сервиса для health-check"""
+        return {
+            "ws_connections": len(self.ws_connections),
+            "codec": {
+                "json": codec.get_codec().name,
+                "ws_msgpack_clients": sum(1 for fmt in self.ws_formats.values() if fmt == codec.FORMAT_MSGPACK),
+            },
+            "bus": self.bus.stats(),
+            "event_loop_lag_ms": self.loop_lag.stats(),
+            "circuits": self.circuits(),
+            "admission": {name: limiter.stats() for name, limiter in self.admission.items()},
+            "broadcast": self.broadcaster.stats(),
+            "subscriptions": self.subscriptions.stats(),
+            "neo": self.neo_api.stats(),
+            "conversations": self.conversations.stats(),
+            "groq_cache": self.groq_api.cache.stats() if self.groq_api.cache is not None else None,
+            "groq_routing": self.groq_api.router.stats(),
+            "groq_rate_limits": self.groq_api.governor.stats(),
+            "analytics": self.analytics.stats() if self.analytics is not None else None,
+            "analysis": {
+                "mode": self.analysis_mode,
+                **self.analysis_pipeline.stats()
+            }
+        }
 
-    async def broadcast_metrics(self, message_id: str, metrics: Dict):
-        """Отправка метрик всем подключенным клиентам"""
-        logger.info(f"Broadcasting metrics for message {message_id}")
+    async def broadcast_metrics(
+        self,
+        message_id: str,
+        metrics: Dict,
+        session_id: Optional[str] = None,
+        broadcast_all: bool = False
+    ):
+        """
+        Отправка метрик подписанным клиентам.
+
+        Метрики получают соединения, подписанные на message_id или session_id.
+        broadcast_all (или WS_BROADCAST_ALL) включает рассылку всем клиентам.
+        Кадр уходит через шину, поэтому доставляется клиентам всех воркеров.
+        """
+        logger.info("Broadcasting metrics for message %s", message_id, extra=sample('broadcast'))
         
-        if not self.ws_connections:
-            logger.warning("No WebSocket connections available")
+        if not self.bus.distributed and not self.ws_connections:
+            logger.warning("No WebSocket connections available", extra=sample('broadcast.no_clients'))
             return
 
-        message = json.dumps({
-            "type": "metrics",
+        with span('broadcast'):
+            await self._publish({
+                "type": "metrics",
+                "message_id": message_id,
+                "data": metrics
+            }, message_id, session_id, broadcast_all)
+
+    async def _publish(
+        self,
+        payload: Dict,
+        message_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        broadcast_all: bool = False
+    ) -> None:
+        """
+        Публикация кадра в шину рассылки.
+
+        В шину уходит сам объект: кодирование в формат клиента (JSON или
+        MessagePack) выполняется при доставке, один раз на формат.
+        """
+        await self.bus.publish({
+            "payload": payload,
             "message_id": message_id,
-            "data": metrics
+            "session_id": session_id,
+            "broadcast_all": broadcast_all
         })
 
-        # Отправляем метрики всем подключенным клиентам
-        disconnected = set()
-        sent_count = 0
-        for ws in self.ws_connections:
-            try:
-                await ws.send(message)
-                sent_count += 1
-                logger.info(f"Sent metrics to WebSocket client")
-            except websockets.exceptions.ConnectionClosed:
-                logger.warning("WebSocket connection closed")
-                disconnected.add(ws)
-            except Exception as e:
-                logger.error(f"Error sending metrics: {e}")
-                disconnected.add(ws)
-        
-        # Удаляем отключенные соединения
-        self.ws_connections -= disconnected
-        logger.info(f"Metrics broadcast complete. Sent to {sent_count} clients")
+    async def _on_bus_message(self, envelope: Dict) -> None:
+        """Доставка кадра из шины клиентам этого воркера"""
+        queued = await self._broadcast(
+            envelope['payload'],
+            envelope.get('message_id'),
+            envelope.get('session_id'),
+            envelope.get('broadcast_all', False)
+        )
+        logger.info("Broadcast queued for %d clients", queued, extra=sample('broadcast.queued'))
+
+    async def _broadcast(
+        self,
+        payload: Dict,
+        message_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        broadcast_all: bool = False
+    ) -> int:
+        """
+        Рассылка сообщения клиентам этого воркера.
+
+        Сообщение сериализуется один раз для каждого формата кадров среди
+        получателей и кладется в очередь каждого клиента; отправка идет
+        конкурентно, медленные клиенты не задерживают остальных.
+        """
+        if broadcast_all or self.broadcast_all:
+            targets = self.ws_connections
+        else:
+            targets = self.subscriptions.targets(message_id, session_id) & self.ws_connections
+
+        by_format: Dict[str, List] = {}
+        for websocket in targets:
+            by_format.setdefault(self.ws_formats.get(websocket, codec.FORMAT_JSON), []).append(websocket)
+        queued = 0
+        for fmt, connections in by_format.items():
+            queued += self.broadcaster.publish(codec.encode_frame(payload, fmt), connections)
+        return queued
+
+    def _forget_websocket(self, websocket) -> None:
+        """Удаление соединения из рассылки и индекса подписок"""
+        self.ws_connections.discard(websocket)
+        self.ws_formats.pop(websocket, None)
+        self.subscriptions.remove(websocket)
+
+    def _record_analysis(self, message_id: str, metrics: Dict, source: str) -> None:
+        """Сохранение результата анализа для агрегатов (/analytics/aggregates)"""
+        if self.analytics is not None:
+            self.analytics.record(message_id, metrics, source)
+
+    async def _on_analysis_result(self, message_id: str, metrics: Dict, session_id: Optional[str] = None, source: str = 'web') -> None:
+        """Результат фонового анализа: запись в журнал и рассылка"""
+        self._record_analysis(message_id, metrics, source)
+        await self.broadcast_metrics(message_id, metrics, session_id)
+
+    async def _broadcast_provisional(self, message_id: str, text: str, session_id: Optional[str] = None) -> None:
+        """
+        Рассылка локальной оценки до ответа Neo API (кадр metrics со status
+        "provisional"; окончательный кадр с тем же message_id ее заменяет).
+        Если Neo API для текста не нужен, окончательной будет сама локальная
+        оценка, и предварительный кадр не отправляется.
+        """
+        if not self.provisional_metrics or not text.strip():
+            return
+        with span('local_metrics'):
+            local = self.neo_api.analyze_local(text)
+        if self.neo_api.needs_remote(text, local):
+            await self.broadcast_metrics(message_id, local, session_id)
+
+    async def _analyze_and_broadcast(self, message_id: str, text: str, session_id: Optional[str] = None, priority: str = 'web') -> Dict:
+        """Анализ ответа через Neo API и рассылка метрик через WebSocket"""
+        try:
+            await self._broadcast_provisional(message_id, text, session_id)
+            async with self.admission['neo'].slot(priority):
+                metrics = await self.neo_api.analyze_text(text)
+            self._record_analysis(message_id, metrics, priority)
+            # Отправляем метрики через WebSocket
+            await self.broadcast_metrics(message_id, metrics, session_id)
+        except Exception as e:
+            logger.error(f"Error analyzing text: {e}")
+            # Продолжаем выполнение даже если анализ не удался
+            metrics = {"error": str(e)}
+        return metrics
+
+    async def _dispatch_analysis(self, message_id: str, text: str, session_id: Optional[str] = None, priority: str = 'web') -> Dict:
+        """
+        Запуск анализа согласно ANALYSIS_MODE.
+
+        В режиме background ответ не ждет Neo API: задача ставится в очередь,
+        а метрики приходят по WebSocket с тем же message_id (очередь
+        пайплайна ограничена сама по себе, admission к ней не применяется).
+        """
+        if self.analysis_mode == 'background':
+            await self._broadcast_provisional(message_id, text, session_id)
+            queued = await self.analysis_pipeline.submit(message_id, text, session_id=session_id, source=priority)
+            return {"status": "pending" if queued else "dropped"}
+        return await self._analyze_and_broadcast(message_id, text, session_id, priority)
+
+    async def _prepare_prompt(
+        self,
+        message: str,
+        context: Optional[List[Dict]],
+        session_id: Optional[str]
+    ) -> Tuple[List[Dict], Dict]:
+        """
+        Сборка промпта в пределах бюджета токенов.
+
+        Присланный клиентом context обрезается скользящим окном (ведущие
+        системные сообщения сохраняются). Без context история берется из
+        серверного хранилища по session_id.
+
+        Returns:
+            (сообщения для Groq API, {"tokens", "messages", "trimmed"})
+        """
+        budget = self.conversations.token_budget
+        if context:
+            history = list(context)
+            last = history[-1]
+            if not (last.get('role') == 'user' and last.get('content') == message):
+                history.append({'role': 'user', 'content': message})
+            pinned = []
+            while len(history) > 1 and history[0].get('role') == 'system':
+                pinned.append(history.pop(0))
+            messages, tokens, trimmed = trim_to_budget(history, budget, pinned)
+            return messages, {"tokens": tokens, "messages": len(messages), "trimmed": trimmed}
+
+        if session_id:
+            return await self.conversations.build_prompt(session_id, message)
+
+        messages = [{'role': 'user', 'content': message}]
+        return messages, {"tokens": message_tokens(messages[0]), "messages": 1, "trimmed": 0}
+
+    async def _remember_turn(
+        self,
+        message: str,
+        reply: str,
+        context: Optional[List[Dict]],
+        session_id: Optional[str]
+    ) -> None:
+        """Сохранение реплик в серверной истории (только без клиентского context)"""
+        if context or not session_id:
+            return
+        await self.conversations.append(session_id, [
+            {'role': 'user', 'content': message},
+            {'role': 'assistant', 'content': reply}
+        ])
+        if self.conversations.summarizer is not None:
+            task = asyncio.create_task(self.conversations.summarize(session_id))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _summarize_conversation(self, previous: Optional[str], messages: List[Dict]) -> str:
+        """Краткое содержание вытесненных реплик через Groq API"""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = (
+            "Summarize the conversation below in a few sentences, keeping facts, "
+            "names and open questions.\n"
+            + (f"Previous summary: {previous}\n" if previous else "")
+            + transcript
+        )
+        return await self.groq_api.get_response(prompt, use_cache=False)
+
+    async def chat(
+        self,
+        message: str,
+        context: Optional[list] = None,
+        session_id: Optional[str] = None,
+        use_cache: bool = True,
+        priority: str = 'web'
+    ) -> Dict:
+        """
+        Чат-пайплайн без HTTP: Groq -> Neo -> WebSocket.
+
+        Используется обработчиком /chat и ботом Telegram, когда оба
+        работают в одном процессе. priority - класс трафика для
+        ограничителей внешних API (web или telegram).
+
+        Raises:
+            AdmissionRejected: Groq API перегружен, очередь ожидания заполнена
+            RateLimited: бюджет лимитов Groq исчерпан на ближайшее время
+            Exception: При ошибке запроса к Groq API
+        """
+        if current_trace() is None:
+            start_trace('chat')
+
+        # Собираем промпт в пределах бюджета токенов и отправляем в Groq API
+        messages, prompt_info = await self._prepare_prompt(message, context, session_id)
+        async with self.admission['groq'].slot(priority):
+            with span('groq', model=self.groq_api.model):
+                completion = await self.groq_api.complete(message, messages, use_cache=use_cache)
+                annotate(attempts=completion.get('attempts', 1), cached=completion['cached'])
+        ai_response = completion['content']
+        message_id = str(hash(ai_response))
+        await self._remember_turn(message, ai_response, context, session_id)
+
+        # Анализируем через Neo API
+        metrics = await self._dispatch_analysis(message_id, ai_response, session_id, priority)
+
+        return {
+            "id": message_id,
+            "message": ai_response,
+            "status": "success",
+            "cached": completion['cached'],
+            "attempts": completion.get('attempts', 1),
+            "prompt": prompt_info,
+            "metrics": metrics
+        }
+
+    @staticmethod
+    def _json_with_timings(result: Dict, trace, include_timings: bool, status: int = 200) -> web.Response:
+        """
+        Сериализация ответа с разбивкой времени.
+
+        Заголовок Server-Timing содержит все этапы, включая сериализацию;
+        поле timings в теле (по запросу) - все этапы до сериализации.
+        """
+        if include_timings:
+            result = {**result, "timings": trace.timings()}
+        with span('serialize'):
+            body = codec.dumpb(result)
+        return web.Response(
+            body=body,
+            status=status,
+            content_type='application/json',
+            headers={'Server-Timing': trace.server_timing()}
+        )
+
+    @staticmethod
+    def _unavailable(error: Exception, retry_after: float, status: int = 503) -> web.Response:
+        """Быстрый отказ с Retry-After: 503 (перегрузка, предохранитель) или 429 (лимиты Groq)"""
+        logger.warning(f"Chat rejected: {error}")
+        return codec.json_response(
+            {"error": str(error)},
+            status=status,
+            headers={'Retry-After': str(max(1, math.ceil(retry_after)))}
+        )
 
     async def handle_chat(self, request: web.Request) -> web.Response:
+        """
+        Обработка /chat.
+
+        Ответ содержит заголовок Server-Timing (parse, groq с числом попыток,
+        neo, broadcast, serialize); "timings": true в запросе или ?timings=1
+        добавляет ту же разбивку в тело ответа.
+        """
+        trace = start_trace('chat')
         try:
-            data = await request.json()
+            with span('parse'):
+                data = await codec.read_json(request)
+            include_timings = bool(data.get('timings')) or request.query.get('timings') == '1'
             message = data.get('message')
             context = data.get('context', [])  # Получаем контекст диалога
+            session_id = data.get('session_id')  # Для адресной доставки метрик по WebSocket
+            use_cache = data.get('cache', True) is not False  # "cache": false - обход кэша ответов
 
             if not message:
-                return web.json_response(
+                return codec.json_response(
                     {"error": "No message provided"}, 
                     status=400
                 )
 
             try:
-                # Отправляем весь контекст в Groq API
-                ai_response = await self.groq_api.get_response(message, context)
-                message_id = str(hash(ai_response))
-
-                # Анализируем через Neo API
-                try:
-                    metrics = await self.neo_api.analyze_text(ai_response)
-                    # Отправляем метрики через WebSocket
-                    await self.broadcast_metrics(message_id, metrics)
-                except Exception as e:
-                    logger.error(f"Error analyzing text: {e}")
-                    # Продолжаем выполнение даже если анализ не удался
-                    metrics = {"error": str(e)}
-
-                return web.json_response({
-                    "id": message_id,
-                    "message": ai_response,
-                    "status": "success",
-                    "metrics": metrics
-                })
+                result = await self.chat(message, context, session_id, use_cache)
+                return self._json_with_timings(result, trace, include_timings)
+
+            except CircuitOpenError as e:
+                # Groq недоступен: отвечаем сразу, не дожидаясь таймаутов
+                return self._unavailable(e, e.retry_in)
+
+            except AdmissionRejected as e:
+                return self._unavailable(e, e.retry_after)
+
+            except RateLimited as e:
+                # Бюджет лимитов ключей не освободится в пределах ожидания
+                return self._unavailable(e, e.retry_after, status=429)
                 
             except Exception as e:
                 logger.error(f"Error processing message: {e}")
-                return web.json_response(
+                return codec.json_response(
                     {"error": str(e)}, 
                     status=500
                 )
                 
         except Exception as e:
             logger.error(f"Error processing chat request: {e}")
-            return web.json_response(
+            return codec.json_response(
                 {"error": str(e)}, 
                 status=500
             )
 
+    @staticmethod
+    def _sse_event(event: str, data: Dict) -> bytes:
+        """Форматирует событие Server-Sent Events"""
+        return f"event: {event}\ndata: {codec.dumps(data)}\n\n".encode('utf-8')
+
+    async def handle_chat_stream(self, request: web.Request) -> web.StreamResponse:
+        """
+        Стриминг ответа Groq API в виде Server-Sent Events.
+
+        События: start (id сообщения), token (очередной фрагмент ответа),
+        done (полный ответ и метрики) или error. При "ws_tokens": true
+        токены дополнительно рассылаются WebSocket-клиентам как
+        {"type": "token", "message_id": ..., "token": ...}.
+        """
+        trace = start_trace('chat_stream')
+        try:
+            with span('parse'):
+                data = await codec.read_json(request)
+        except Exception as e:
+            logger.error(f"Error processing chat stream request: {e}")
+            return codec.json_response({"error": str(e)}, status=500)
+
+        message = data.get('message')
+        context = data.get('context', [])
+        session_id = data.get('session_id')
+        ws_tokens = bool(data.get('ws_tokens', False))
+        include_timings = bool(data.get('timings')) or request.query.get('timings') == '1'
+
+        if not message:
+            return codec.json_response(
+                {"error": "No message provided"}, 
+                status=400
+            )
+
+        # После начала стрима статус уже не поменять: исчерпанные лимиты - сразу 429
+        governor = self.groq_api.governor
+        wait = governor.retry_after()
+        if wait > governor.max_wait:
+            return self._unavailable(RateLimited(governor.upstream, wait), wait, status=429)
+
+        # Слот Groq занимается до начала ответа, чтобы при перегрузке вернуть 503
+        limiter = self.admission['groq']
+        try:
+            with span('admission', upstream='groq'):
+                admitted_at = await limiter.acquire('web')
+        except AdmissionRejected as e:
+            return self._unavailable(e, e.retry_after)
+
+        message_id = str(uuid.uuid4())
+        parts = []
+        try:
+            response = web.StreamResponse(headers={
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Отключаем буферизацию в nginx
+            })
+            await response.prepare(request)
+            await response.write(self._sse_event('start', {"id": message_id}))
+
+            try:
+                messages, prompt_info = await self._prepare_prompt(message, context, session_id)
+                with span('groq', model=self.groq_api.model):
+                    async for token in self.groq_api.stream_response(message, messages):
+                        parts.append(token)
+                        await response.write(self._sse_event('token', {"id": message_id, "token": token}))
+                        if ws_tokens and (self.bus.distributed or self.ws_connections):
+                            await self._publish({
+                                "type": "token",
+                                "message_id": message_id,
+                                "token": token
+                            }, message_id, session_id)
+            except Exception as e:
+                logger.error(f"Error streaming message: {e}")
+                await response.write(self._sse_event('error', {"id": message_id, "error": str(e)}))
+                await response.write_eof()
+                return response
+        finally:
+            limiter.release(admitted_at)
+
+        ai_response = ''.join(parts)
+        await self._remember_turn(message, ai_response, context, session_id)
+        metrics = await self._dispatch_analysis(message_id, ai_response, session_id)
+
+        done = {
+            "id": message_id,
+            "message": ai_response,
+            "status": "success",
+            "prompt": prompt_info,
+            "metrics": metrics
+        }
+        if include_timings:
+            done["timings"] = trace.timings()
+        await response.write(self._sse_event('done', done))
+        await response.write_eof()
+        return response
+
+    async def handle_analytics(self, request: web.Request) -> web.Response:
+        """
+        Агрегаты метрик анализа: GET /analytics/aggregates.
+
+        Параметры: resolution (hour, day), since/until (unix-время или
+        ISO 8601), metric, source (web, telegram). Ответ строится из
+        предрассчитанных агрегатов, без прохода по сырым результатам.
+        """
+        if self.analytics is None:
+            return codec.json_response({"error": "Analytics store is disabled"}, status=404)
+        query = request.query
+        try:
+            result = await self.analytics.aggregate(
+                resolution=query.get('resolution', 'hour'),
+                since=parse_time(query.get('since')),
+                until=parse_time(query.get('until')),
+                metric=query.get('metric'),
+                source=query.get('source'),
+            )
+        except ValueError as e:
+            return codec.json_response({"error": str(e)}, status=400)
+        return codec.json_response(result)
+
     async def register_websocket(self, websocket: websockets.WebSocketServerProtocol):
-        """Регистрация WebSocket соединения"""
-        logger.info("New WebSocket connection established")
+        """
+        Регистрация WebSocket соединения.
+
+        Клиент управляет подписками сообщениями:
+        {"type": "subscribe", "session_id": "...", "message_ids": ["..."]}
+        {"type": "unsubscribe", "session_id": "...", "message_ids": ["..."]}
+
+        Подключение с ?format=msgpack переводит кадры сервера в бинарный
+        MessagePack (если пакет msgpack установлен); управляющие сообщения
+        клиент может слать в любом из форматов.
+        """
+        fmt = codec.negotiate_format(getattr(websocket, 'path', None))
+        logger.info("New WebSocket connection established (%s)", fmt, extra=sample('ws.connect'))
+        if fmt != codec.FORMAT_JSON:
+            self.ws_formats[websocket] = fmt
         self.ws_connections.add(websocket)
         try:
-            await websocket.wait_closed()
+            async for raw in websocket:
+                self.handle_ws_message(websocket, raw)
+        except websockets.exceptions.ConnectionClosed:
+            pass
         finally:
-            self.ws_connections.remove(websocket)
-            logger.info("WebSocket connection closed")
+            self._forget_websocket(websocket)
+            self.broadcaster.discard(websocket)
+            logger.info("WebSocket connection closed", extra=sample('ws.disconnect'))
+
+    def handle_ws_message(self, websocket, raw) -> None:
+        """Обработка управляющего сообщения от WebSocket-клиента"""
+        try:
+            data = codec.decode_frame(raw)
+            action = data.get('type')
+            session_id = data.get('session_id')
+            message_ids = data.get('message_ids') or []
+            if not isinstance(message_ids, list):
+                raise ValueError("message_ids must be a list")
+            message_ids = [str(m) for m in message_ids]
+        except Exception as e:
+            self._reply(websocket, {"type": "error", "error": f"Invalid message: {e}"})
+            return
+
+        if action == 'subscribe':
+            self.subscriptions.subscribe(websocket, session_id, message_ids)
+        elif action == 'unsubscribe':
+            self.subscriptions.unsubscribe(websocket, session_id, message_ids)
+        else:
+            self._reply(websocket, {"type": "error", "error": f"Unknown message type: {action}"})
+            return
+
+        self._reply(websocket, {
+            "type": f"{action}d",
+            "session_id": session_id,
+            "message_ids": message_ids
+        })
+
+    def _reply(self, websocket, payload: Dict) -> None:
+        """Ответ одному клиенту через его очередь отправки"""
+        fmt = self.ws_formats.get(websocket, codec.FORMAT_JSON)
+        self.broadcaster.publish(codec.encode_frame(payload, fmt), [websocket])
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler) -> web.StreamResponse:
+    """Гистограмма задержек и счетчик in-flight для HTTP-запросов"""
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    status = 500
+    started = asyncio.get_running_loop().time()
+    with prom.HTTP_INFLIGHT.track_inprogress(route=route):
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            prom.HTTP_REQUEST_DURATION.observe(
+                asyncio.get_running_loop().time() - started,
+                route=route, method=request.method, status=status
+            )
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(
+        body=prom.REGISTRY.expose().encode('utf-8'),
+        headers={'Content-Type': prom.CONTENT_TYPE}
+    )
 
 async def health_check(request: web.Request) -> web.Response:
     """Простая проверка здоровья сервиса"""
-    return web.json_response({
+    result = {
         "status": "ok",
-        "timestamp": datetime.datetime.utcnow().isoformat()
-    })
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "worker": request.app.get('worker_index', 0)
+    }
+    if 'startup' in request.app:
+        result["startup_ms"] = request.app['startup']
+    handler = request.app.get('service_handler')
+    if handler is not None:
+        result["stats"] = handler.stats()
+        # Разомкнутый предохранитель - сервис жив, но отвечает с ошибками
+        if any(c["state"] != "closed" for c in result["stats"]["circuits"].values()):
+            result["status"] = "degraded"
+    telegram_webhook = request.app.get('telegram_webhook')
+    if telegram_webhook is not None:
+        result.setdefault("stats", {})["telegram"] = telegram_webhook.stats()
+    return codec.json_response(result)
+
+async def start_service(host: str = "", port: int = 8000, ws_port: int = 8001, reuse_port: bool = False, worker_index: int = 0):
+    """
+    Запуск HTTP- и WebSocket-серверов.
 
-async def start_service(host: str = "", port: int = 8000, ws_port: int = 8001):
+    Порты открываются сразу; вебхук Telegram проверяется фоновой задачей.
+    Этапы запуска замеряются, пишутся в лог и отдаются в /health.
+    reuse_port=True включает SO_REUSEPORT: несколько воркеров слушают
+    одни и те же порты, ядро распределяет соединения между ними.
+    """
     try:
-        app = web.Application()
-        handler = ServiceHandler()
-        
-        # Initialize Telegram webhook
-        telegram_webhook = Neon_Nexus_AI_bot_webhook(
-            token=os.getenv('TELEGRAM_BOT_TOKEN'),
-            webhook_url="https://web.89281112.xyz/project9/api/neo/getmemore",
-            service_url="https://web.89281112.xyz/project9"
-        )
+        if env_bool('TRACE_LOG', False):
+            add_span_hook(log_span_hook)
 
-        # Проверяем и устанавливаем вебхук
-        telegram_webhook.check_and_setup_webhook()
-        
-        # Add routes
-        app.router.add_get('/health', health_check)
-        app.router.add_post('/chat', handler.handle_chat)
-        
-        # Add telegram routes
-        for route in telegram_webhook.get_routes():
-            app.router.add_route(route.method, route.path, route.handler)
-        
-        # Start HTTP server
+        startup = start_trace('startup')
+        with span('init'):
+            app = web.Application(middlewares=[metrics_middleware])
+            handler = ServiceHandler()
+            app['service_handler'] = handler
+            app['worker_index'] = worker_index
+
+            # Initialize Telegram webhook
+            telegram_webhook = Neon_Nexus_AI_bot_webhook(
+                token=os.getenv('TELEGRAM_BOT_TOKEN'),
+                webhook_url="https://web.89281112.xyz/project9/api/neo/getmemore",
+                service_url="https://web.89281112.xyz/project9",
+                # TELEGRAM_DISPATCH=http - через внешний URL сервиса (раздельный деплой)
+                # Апдейты бота идут в отдельном классе очередей admission
+                chat_handler=functools.partial(handler.chat, priority='telegram')
+                if os.getenv('TELEGRAM_DISPATCH', 'local') == 'local' else None,
+                redis=handler.redis
+            )
+            app['telegram_webhook'] = telegram_webhook
+
+            # Жизненный цикл HTTP-сессий
+            app.on_startup.append(handler.on_startup)
+            app.on_cleanup.append(handler.on_cleanup)
+
+            app.on_startup.append(telegram_webhook.on_startup)
+            app.on_cleanup.append(telegram_webhook.on_cleanup)
+
+            # Add routes
+            app.router.add_get('/health', health_check)
+            app.router.add_get('/metrics', metrics_endpoint)
+            app.router.add_post('/chat', handler.handle_chat)
+            app.router.add_post('/chat/stream', handler.handle_chat_stream)
+            app.router.add_get('/analytics/aggregates', handler.handle_analytics)
+
+            # Add telegram routes
+            for route in telegram_webhook.get_routes():
+                app.router.add_route(route.method, route.path, route.handler)
+
+        # on_startup-хуки: сессии, шина рассылки, воркеры анализа. Хуки
+        # запускают долгоживущие задачи, поэтому выполняются в чистом
+        # контексте: иначе задачи унаследуют трассу запуска
         runner = web.AppRunner(app)
-        await runner.setup()
-        site = web.TCPSite(runner, host, port)
-        await site.start()
-        
+        with span('app_setup'):
+            await asyncio.create_task(runner.setup(), context=contextvars.Context())
+
+        # Start HTTP server
+        with span('http_bind'):
+            site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+            await site.start()
+
         # Start WebSocket server
-        ws_server = await websockets.serve(
-            handler.register_websocket, 
-            host, 
-            ws_port
-        )
-        
-        logger.info(f"Service started - HTTP: {port}, WebSocket: {ws_port}")
+        with span('ws_bind'):
+            ws_server = await websockets.serve(
+                handler.register_websocket, 
+                host, 
+                ws_port,
+                reuse_port=reuse_port or None
+            )
+
+        # Задачи и соединения, созданные дальше, не должны наследовать трассу запуска
+        end_trace()
+
+        # Проверка вебхука не задерживает запуск (один раз на все воркеры)
+        if worker_index == 0:
+            telegram_webhook.schedule_webhook_setup()
+
+        timings = startup.timings()
+        app['startup'] = {name: entry['dur'] for name, entry in timings.items()}
+        app['startup']['total'] = round(sum(app['startup'].values()), 3)
+        phases = ', '.join(f"{name}={dur}ms" for name, dur in app['startup'].items())
+        logger.info(f"Service started - HTTP: {port}, WebSocket: {ws_port} (worker {worker_index}, pid {os.getpid()}); startup: {phases}")
         
         # Запускаем бесконечный цикл
-        await asyncio.Future()
+        try:
+            await asyncio.Future()
+        finally:
+            ws_server.close()
+            await runner.cleanup()
         
     except Exception as e:
         logger.error(f"Failed to start service: {e}")
         raise
 
+def _run_worker(index: int, host: str, port: int, ws_port: int) -> None:
+    """Точка входа процесса-воркера"""
+    try:
+        asyncio.run(start_service(host, port, ws_port, reuse_port=True, worker_index=index))
+    except KeyboardInterrupt:
+        pass
+
+def check_shared_state(workers: int) -> None:
+    """
+    Проверка общего состояния перед запуском нескольких воркеров.
+
+    Ядро раздает соединения воркерам произвольно, поэтому история
+    диалогов, кэши и рассылка метрик должны жить в Redis: иначе один и тот
+    же session_id видит разную историю в зависимости от воркера. Без
+    Redis запуск отклоняется; WORKERS_ALLOW_LOCAL_STATE=1 разрешает его с
+    предупреждением.
+    """
+    if workers <= 1:
+        return
+    if not redis_configured():
+        if not env_bool('WORKERS_ALLOW_LOCAL_STATE', False):
+            raise RuntimeError(
+                f"WORKERS={workers} requires REDIS_URL and the redis package: conversations and caches "
+                "would otherwise be per worker (set WORKERS_ALLOW_LOCAL_STATE=1 to run anyway)"
+            )
+        logger.warning(
+            "Multi-worker mode without Redis: each worker keeps its own conversations and caches, "
+            "the same session_id sees different history depending on the worker"
+        )
+    if os.getenv('METRICS_BUS', 'auto') == 'local':
+        logger.warning("Multi-worker mode without Redis bus: metrics reach only sockets of the producing worker")
+
+def run_workers(workers: int, host: str = "", port: int = 8000, ws_port: int = 8001) -> None:
+    """
+    Многопроцессный режим: workers процессов на общих портах (SO_REUSEPORT).
+
+    Упавший воркер перезапускается. Требует Redis (check_shared_state):
+    история диалогов, кэши и шина метрик общие для всех воркеров.
+    """
+    check_shared_state(workers)
+
+    context = multiprocessing.get_context('spawn')
+    stopping = False
+
+    def spawn(index: int):
+        process = context.Process(target=_run_worker, args=(index, host, port, ws_port), name=f"neonchat-worker-{index}")
+        process.start()
+        return process
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    processes = [spawn(i) for i in range(workers)]
+    logger.info(f"Started {workers} workers: {[p.pid for p in processes]}")
+    try:
+        while not stopping:
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {i} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                    processes[i] = spawn(i)
+            time.sleep(1)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        logger.info("All workers stopped")
+
 if __name__ == "__main__":
     try:
-        asyncio.run(start_service())
+        host = os.getenv('SERVICE_HOST', '')
+        port = env_int('SERVICE_PORT', 8000)
+        ws_port = env_int('WS_PORT', 8001)
+        workers = env_int('WORKERS', 1)
+        if workers > 1:
+            run_workers(workers, host, port, ws_port)
+        else:
+            asyncio.run(start_service(host, port, ws_port))
     except KeyboardInterrupt:
         logger.info("Service stopped by user")
     except Exception as e:
@@ -0,0 +1,212 @@
+import re
+import math
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from ..core.config import env_int
+
+logger = logging.getLogger(__name__)
+
+# Слово: буквы (любой алфавит) с внутренними апострофами и дефисами
+_WORD = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+# Предложение: текст до .!?… или конца строки
+_SENTENCE = re.compile(r'[^.!?…]+')
+VOWELS = 'aeiouyаеёиоуыэюя'
+
+# Граница human_likeness_score, ниже которой текст считается сгенерированным
+DEFAULT_THRESHOLD = 50.0
+
+# Решение, нужен ли вызов Neo API: (текст, локальная оценка) -> bool
+RemotePolicyFunc = Callable[[str, Dict[str, Any]], bool]
+
+
+def tokenize(texts: Sequence[str]) -> Tuple[List[str], List[int], List[int]]:
+    """
+    Слова всех текстов подряд (в нижнем регистре), число слов в каждом
+    предложении и номер текста каждого предложения.
+    """
+    words: List[str] = []
+    sentence_lengths: List[int] = []
+    sentence_text: List[int] = []
+    for index, text in enumerate(texts):
+        for segment in _SENTENCE.findall(text.lower()):
+            found = _WORD.findall(segment)
+            if found:
+                words.extend(found)
+                sentence_lengths.append(len(found))
+                sentence_text.append(index)
+    return words, sentence_lengths, sentence_text
+
+
+def syllables(word: str) -> int:
+    """Число слогов: группы гласных подряд, не меньше одного"""
+    count, previous = 0, False
+    for char in word:
+        vowel = char in VOWELS
+        if vowel and not previous:
+            count += 1
+        previous = vowel
+    return max(1, count)
+
+
+@dataclass
+class TextCounts:
+    """Счетчики одного текста пакета"""
+    words: float = 0.0
+    sentences: float = 0.0
+    syllables: float = 0.0
+    polysyllables: float = 0.0
+    unique: float = 0.0
+    length_mean: float = 0.0
+    length_std: float = 0.0
+
+
+def _counts(words: List[str], sentence_lengths: List[int], sentence_text: List[int], n: int) -> List[TextCounts]:
+    """Счетчики по текстам пакета: слова, предложения, слоги, уникальные слова, длины предложений"""
+    rows = [TextCounts() for _ in range(n)]
+    lengths: List[List[int]] = [[] for _ in range(n)]
+    seen: List[Set[str]] = [set() for _ in range(n)]
+    position = 0
+    for length, index in zip(sentence_lengths, sentence_text):
+        row = rows[index]
+        row.sentences += 1
+        lengths[index].append(length)
+        for word in words[position:position + length]:
+            count = syllables(word)
+            row.words += 1
+            row.syllables += count
+            row.polysyllables += count >= 3
+            seen[index].add(word)
+        position += length
+    for row, text_lengths, unique in zip(rows, lengths, seen):
+        row.unique = float(len(unique))
+        if text_lengths:
+            mean = sum(text_lengths) / len(text_lengths)
+            row.length_mean = mean
+            row.length_std = math.sqrt(max(sum(x * x for x in text_lengths) / len(text_lengths) - mean ** 2, 0))
+    return rows
+
+
+def _scores(c: TextCounts) -> Dict[str, float]:
+    """Метрики текста из его счетчиков"""
+    words = max(c.words, 1)
+    sentences = max(c.sentences, 1)
+    per_sentence = c.words / sentences
+    flesch = 206.835 - 1.015 * per_sentence - 84.6 * (c.syllables / words)
+    # Разброс длины предложений (sigma - mu) / (sigma + mu), приведенный к 0..1
+    spread = c.length_std + c.length_mean
+    burstiness = ((c.length_std - c.length_mean) / max(spread, 1e-9) + 1) / 2
+    unique_ratio = c.unique / words
+    # Индекс Хердана log(V) / log(N) меньше зависит от длины текста, чем V / N
+    if c.words > 1:
+        diversity = math.log(max(c.unique, 1)) / math.log(max(c.words, 2))
+    else:
+        diversity = unique_ratio
+    # Грубая предварительная оценка до ответа Neo API: тексты людей неровнее
+    # по длине предложений и разнообразнее по словарю
+    human = 100 * min(max(0.5 * burstiness + 0.5 * min(unique_ratio / 0.7, 1), 0), 1)
+    return {
+        "human_likeness_score": human,
+        "burstiness": burstiness,
+        "flesch_score": min(max(flesch / 100, 0), 1),
+        "gunning_fog_score": 0.4 * (per_sentence + 100 * c.polysyllables / words),
+        "smog_score": 1.0430 * math.sqrt(c.polysyllables * 30 / sentences) + 3.1291,
+        "avg_words_per_sentence": per_sentence,
+        "unique_word_ratio": unique_ratio,
+        "lexical_diversity": diversity,
+    }
+
+
+class LocalAnalyzer:
+    """
+    Локальные метрики текста за миллисекунды: читаемость (Flesch, Gunning
+    Fog, SMOG, слов в предложении), лексическое разнообразие и
+    burstiness (docs/METRICS_ANALYSIS.md).
+
+    Результат имеет форму ответа NeoAPI.analyze_text со status
+    "provisional": его можно разослать сразу и заменить ответом Neo API.
+    Расчет - один проход по словам на чистом Python: сервис оценивает
+    по одному тексту на ответ, и векторизация на таком объеме не окупается.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.analyzed = 0
+        self.batches = 0
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts: Sequence[str]) -> List[Dict[str, Any]]:
+        """Предварительные метрики для каждого текста пакета"""
+        n = len(texts)
+        if n == 0:
+            return []
+        words, sentence_lengths, sentence_text = tokenize(texts)
+        counts = _counts(words, sentence_lengths, sentence_text, n)
+        self.batches += 1
+        self.analyzed += n
+        return [self._result(text, c, _scores(c)) for text, c in zip(texts, counts)]
+
+    def _result(self, text: str, counts: TextCounts, scores: Dict[str, float]) -> Dict[str, Any]:
+        score = round(scores["human_likeness_score"], 2)
+        return {
+            "status": "provisional",
+            "provisional": True,
+            "text": text,
+            "is_ai_generated": score < self.threshold,
+            "human_likeness_score": score,
+            "threshold": self.threshold,
+            "metrics": {
+                "text_coherence_complexity": {
+                    "burstiness": round(scores["burstiness"], 4),
+                },
+                "readability_metrics": {
+                    "flesch_score": round(scores["flesch_score"], 4),
+                    "gunning_fog_score": round(scores["gunning_fog_score"], 4),
+                    "smog_score": round(scores["smog_score"], 4),
+                    "avg_words_per_sentence": round(scores["avg_words_per_sentence"], 4),
+                },
+                "vocabulary_lexical_diversity": {
+                    "unique_word_ratio": round(scores["unique_word_ratio"], 4),
+                    "lexical_diversity": round(scores["lexical_diversity"], 4),
+                },
+                "statistical_metrics": {
+                    "word_count": int(counts.words),
+                    "unique_word_count": int(counts.unique),
+                    "sentence_count": int(counts.sentences),
+                },
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"analyzed": self.analyzed, "batches": self.batches}
+
+
+class RemotePolicy:
+    """
+    Нужен ли вызов Neo API: тексты короче min_words слов или с числом
+    разных слов меньше min_unique_words ("ок", "да да да") оцениваются
+    только локально.
+    """
+
+    def __init__(self, min_words: int = 0, min_unique_words: int = 0) -> None:
+        self.min_words = min_words
+        self.min_unique_words = min_unique_words
+
+    @classmethod
+    def from_env(cls, prefix: str = 'NEO') -> Optional['RemotePolicy']:
+        """
+        Пороги {PREFIX}_LOCAL_MIN_WORDS и {PREFIX}_LOCAL_MIN_UNIQUE_WORDS;
+        None, если оба 0 (каждый текст уходит в Neo API).
+        """
+        policy = cls(
+            min_words=env_int(f'{prefix}_LOCAL_MIN_WORDS', 0),
+            min_unique_words=env_int(f'{prefix}_LOCAL_MIN_UNIQUE_WORDS', 0),
+        )
+        return policy if policy.min_words > 0 or policy.min_unique_words > 0 else None
+
+    def __call__(self, text: str, local: Dict[str, Any]) -> bool:
+        stats = local["metrics"]["statistical_metrics"]
+        return bool(stats["word_count"] >= self.min_words and stats["unique_word_count"] >= self.min_unique_words)
@@ -1,21 +1,102 @@
+import os
 import aiohttp
 import logging
-import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from ..core import codec
+from ..core.http import create_session, close_session
+from ..core.logs import Payload, sample
+from ..core.cache import LRUCache, TieredCache, make_key
+from ..core.coalesce import MicroBatcher, SingleFlight
+from ..core.config import env_float, env_int
+from ..core.metrics import track_upstream
+from ..core.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, UpstreamError, call_with_retries, parse_retry_after
+from ..core.tracing import annotate, span
+from .local import LocalAnalyzer, RemotePolicy, RemotePolicyFunc
 
 logger = logging.getLogger(__name__)
 
 class NeoAPI:
     API_URL = "https://api.neoapi.ai/analyze"
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(self, api_key: str, redis: Optional[Any] = None) -> None:
         if not api_key:
             raise ValueError("NEO_API_KEY is required")
         self.api_key = api_key
+        # NEO_API_BASE позволяет направить клиент на локальный стенд
+        api_base = os.getenv('NEO_API_BASE')
+        self.api_url = f"{api_base.rstrip('/')}/analyze" if api_base else self.API_URL
         self.logger = logging.getLogger(__name__)
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Кэш результатов анализа: ключ - хэш текста и параметров анализа
+        self.cache = TieredCache(
+            'neo:analysis',
+            max_size=env_int('NEO_CACHE_SIZE', 1024),
+            ttl=env_float('NEO_CACHE_TTL', 3600),
+            redis=redis,
+        )
+        # Повторы с экспоненциальной паузой и предохранитель (NEO_RETRY_*, NEO_CIRCUIT_*)
+        self.retry_policy = RetryPolicy.from_env('NEO', attempt_timeout=10.0, total_timeout=20.0)
+        self.breaker = CircuitBreaker.from_env('NEO', 'neo')
+        # Одновременные запросы одного и того же текста делят один запрос к API
+        self.coalescer = SingleFlight()
+        # Опциональное окно микро-батчинга (NEO_BATCH_WINDOW_MS > 0)
+        batch_window_ms = env_float('NEO_BATCH_WINDOW_MS', 0)
+        self.batcher: Optional[MicroBatcher] = None
+        if batch_window_ms > 0:
+            self.batcher = MicroBatcher(
+                self._request_item,
+                window=batch_window_ms / 1000,
+                max_batch=env_int('NEO_BATCH_MAX_SIZE', 32),
+                concurrency=env_int('NEO_BATCH_CONCURRENCY', 8),
+            )
+        # Локальные метрики: предварительный результат до ответа API
+        self.local = LocalAnalyzer()
+        # Тексты, которым удаленный анализ не нужен (NEO_LOCAL_MIN_WORDS, NEO_LOCAL_MIN_UNIQUE_WORDS);
+        # None - все тексты уходят в API. Можно заменить своей функцией (текст, локальный результат) -> bool
+        self.remote_policy: Optional[RemotePolicyFunc] = RemotePolicy.from_env('NEO')
+        # Оценки, уже посчитанные для предварительного кадра: analyze_text
+        # проверяет политику по ним, а не считает текст заново
+        self._local_results = LRUCache(max_size=256, ttl=60)
+        self.local_only = 0
+        self.local_reused = 0
+
+    async def start(self) -> None:
+        """Создает общую сессию с пулом соединений (вызывается при старте приложения)"""
+        await self._session()
+
+    async def close(self) -> None:
+        """Закрывает сессию (вызывается при остановке приложения)"""
+        await close_session(self.session)
+        self.session = None
+
+    async def _session(self) -> aiohttp.ClientSession:
+        """Открытая общая сессия: создается при первом обращении и после закрытия"""
+        if self.session is None or self.session.closed:
+            self.session = create_session('NEO')
+        return self.session
+
+    def analyze_local(self, text: str) -> Dict[str, Any]:
+        """Мгновенная предварительная оценка тех же метрик без обращения к API"""
+        result = self.local.analyze(text)
+        if self.remote_policy is not None:
+            self._local_results.set(text, result)
+        return result
+
+    def needs_remote(self, text: str, local: Optional[Dict[str, Any]] = None) -> bool:
+        """Нужен ли вызов Neo API по политике remote_policy"""
+        if self.remote_policy is None:
+            return True
+        return self.remote_policy(text, local if local is not None else self.local.analyze(text))
 
     async def analyze_text(self, text: str) -> Dict[str, Any]:
-        """Анализирует текст через Neo API."""
+        """
+        Анализирует текст через Neo API.
+
+        Если политика remote_policy считает текст коротким или тривиальным,
+        возвращается локальная оценка без обращения к API: status
+        "degraded", source "local" (ответ API - source "neo"). Оценка,
+        посчитанная analyze_local для этого текста, не пересчитывается.
+        """
         # Проверяем входной текст
         if not text or len(text.strip()) == 0:
             self.logger.warning("Empty text received from GROQ")
@@ -27,12 +108,19 @@ class NeoAPI:
                 "metrics": {}
             }
 
-        self.logger.info(f"Starting analysis of text: {text[:50]}...")
+        if self.remote_policy is not None:
+            local = self._local_results.get(text)
+            if local is None:
+                local = self.local.analyze(text)
+            else:
+                self._local_results.delete(text)
+                self.local_reused += 1
+            if not self.remote_policy(text, local):
+                self.local_only += 1
+                annotate(local=True)
+                return {**local, "status": "degraded", "source": "local", "provisional": False}
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        self.logger.info("Starting analysis of text: %.50s...", text, extra=sample('neo.request'))
 
         payload = {
             "text": text,
@@ -44,32 +132,63 @@ class NeoAPI:
             "language": "auto"
         }
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.API_URL, json=payload, headers=headers) as response:
+        with span('neo'):
+            cache_key = make_key(payload)
+            if self.cache.enabled:
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    self.logger.info("Neo API analysis served from cache")
+                    annotate(cached=True)
+                    return dict(cached)
+
+            result = await self.coalescer.do(cache_key, lambda: self._dispatch(payload, cache_key))
+            return dict(result)
+
+    async def _dispatch(self, payload: Dict[str, Any], cache_key: str) -> Dict[str, Any]:
+        """Отправка запроса напрямую или через окно микро-батчинга"""
+        if self.batcher is not None:
+            return await self.batcher.submit((payload, cache_key))
+        return await self._request(payload, cache_key)
+
+    async def _request_item(self, item: Any) -> Dict[str, Any]:
+        payload, cache_key = item
+        return await self._request(payload, cache_key)
+
+    async def _request(self, payload: Dict[str, Any], cache_key: str) -> Dict[str, Any]:
+        """Запрос к Neo API с повторами; успешный результат сохраняется в кэш"""
+        text = payload["text"]
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+        async def attempt() -> Dict[str, Any]:
+            session = await self._session()
+
+            with track_upstream('neo', 'analyze'):
+                async with session.post(self.api_url, json=payload, headers=headers) as response:
                     if response.status != 200:
                         error_text = await response.text()
                         self.logger.error(f"API error {response.status}: {error_text}")
-                        self.logger.error(f"Request payload: {json.dumps(payload, ensure_ascii=False)}")
-                        return {
-                            "status": "error",
-                            "error": "Neo API analysis failed",
-                            "is_ai_generated": False,  # Дефолтное значение
-                            "human_likeness_score": 0,
-                            "metrics": {}
-                        }
-
-                    data = await response.json()
-                    self.logger.info(f"Got API response: {json.dumps(data, indent=2)}")
-
-                    return {
-                        "status": "success",
-                        "text": text,
-                        "is_ai_generated": data.get("is_ai_generated", False),
-                        "human_likeness_score": data.get("human_likeness_score", 0),
-                        "metrics": data.get("metrics", {})
-                    }
+                        raise UpstreamError(
+                            f"Neo API Error: {response.status} - {error_text}",
+                            response.status,
+                            parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    return await response.json(loads=codec.loads)
 
+        try:
+            data, _ = await call_with_retries(attempt, self.retry_policy, self.breaker, upstream='neo')
+        except (UpstreamError, CircuitOpenError) as e:
+            self.logger.error(f"Neo API analysis failed: {e}")
+            self.logger.error("Request payload: %s", Payload(payload))
+            return {
+                "status": "error",
+                "error": "Neo API analysis failed",
+                "is_ai_generated": False,  # Дефолтное значение
+                "human_likeness_score": 0,
+                "metrics": {}
+            }
         except Exception as e:
             self.logger.error(f"Error analyzing text: {e}")
             return {
@@ -79,3 +198,25 @@ class NeoAPI:
                 "human_likeness_score": 0,
                 "metrics": {}
             }
+
+        self.logger.info("Got API response: %s", Payload(data), extra=sample('neo.response'))
+        result = {
+            "status": "success",
+            "source": "neo",
+            "text": text,
+            "is_ai_generated": data.get("is_ai_generated", False),
+            "human_likeness_score": data.get("human_likeness_score", 0),
+            "metrics": data.get("metrics", {})
+        }
+        if self.cache.enabled:
+            await self.cache.set(cache_key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша, объединения запросов, батчинга и локального анализа"""
+        return {
+            "cache": self.cache.stats(),
+            "coalescing": self.coalescer.stats(),
+            "batching": self.batcher.stats() if self.batcher is not None else None,
+            "local": {**self.local.stats(), "local_only": self.local_only, "reused": self.local_reused},
+        }
@@ -1,99 +1,365 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
 import logging
-import requests
 import aiohttp
 from aiohttp import web
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ..core import codec
+from ..core.http import create_session, close_session
+from ..core.config import env_float, env_int
+from ..core.keyed_queue import KeyedWorkQueue
+from ..core.logs import Payload, sample
+from ..core.metrics import UPSTREAM_ERRORS, track_upstream
+from ..core.tracing import span, start_trace
 
 logger = logging.getLogger(__name__)
 
 class Neon_Nexus_AI_bot_webhook:
-    def __init__(self, token: str, webhook_url: str, service_url: str):
+    def __init__(
+        self,
+        token: str,
+        webhook_url: str,
+        service_url: str,
+        chat_handler: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None,
+        redis: Optional[Any] = None
+    ):
         self.token = token
+        # TELEGRAM_API_BASE позволяет направить бота на локальный стенд Bot API
+        self.api_base = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org').rstrip('/')
         self.webhook_url = webhook_url
         self.service_url = service_url  # URL нашего основного сервиса
+        # Прямой вызов чат-пайплайна, если бот и сервис в одном процессе
+        self.chat_handler = chat_handler
         self.app = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Обработка апдейтов в фоне: порядок внутри chat_id, общий лимит параллельности
+        self.updates = KeyedWorkQueue(
+            self.process_update,
+            concurrency=env_int('TELEGRAM_WORKERS', 8),
+            max_pending=env_int('TELEGRAM_QUEUE_SIZE', 1000),
+        )
+        # Недавние update_id для отсечения повторной доставки; с Redis -
+        # общие для всех воркеров (Telegram повторяет доставку до суток)
+        self.dedupe_size = env_int('TELEGRAM_DEDUPE_SIZE', 4096)
+        self.dedupe_ttl = env_int('TELEGRAM_DEDUPE_TTL', 86400)
+        self._seen_updates: 'OrderedDict[int, None]' = OrderedDict()
+        self.duplicates = 0
+        # Подтвержденное состояние вебхука хранится в Redis или в файле между перезапусками
+        self.redis = redis
+        self.state_file = self._state_path()
+        self.recheck_interval = env_float('TELEGRAM_WEBHOOK_RECHECK', 86400)
+        self.webhook_state: Dict[str, Any] = {"status": "not_started"}
+        self._setup_task: Optional[asyncio.Task] = None
+
+    def api_url(self, method: str) -> str:
+        """URL метода Bot API"""
+        return f"{self.api_base}/bot{self.token}/{method}"
+
+    async def start(self) -> None:
+        """Создает общую сессию с пулом соединений"""
+        await self._session()
+
+    async def close(self) -> None:
+        """Закрывает сессию"""
+        await close_session(self.session)
+        self.session = None
+
+    async def _session(self) -> aiohttp.ClientSession:
+        """Открытая общая сессия: создается при первом обращении и после закрытия"""
+        if self.session is None or self.session.closed:
+            self.session = create_session('TELEGRAM')
+        return self.session
+
+    async def on_startup(self, app: web.Application) -> None:
+        """Хук aiohttp: открытие сессии при старте приложения"""
+        await self.start()
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        """Хук aiohttp: закрытие сессии при остановке приложения"""
+        if self._setup_task is not None and not self._setup_task.done():
+            self._setup_task.cancel()
+        await self.updates.stop()
+        await self.close()
 
     async def send_telegram_message(self, chat_id: int, text: str) -> bool:
         """Отправка сообщения в Telegram"""
         try:
-            response = requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
-                json={
-                    "chat_id": chat_id,
-                    "text": text
-                }
-            )
-            return response.status_code == 200
+            session = await self._session()
+
+            with span('telegram.send'), track_upstream('telegram', 'sendMessage'):
+                async with session.post(
+                    self.api_url('sendMessage'),
+                    json={
+                        "chat_id": chat_id,
+                        "text": text
+                    }
+                ) as response:
+                    if response.status != 200:
+                        UPSTREAM_ERRORS.inc(upstream='telegram', status=str(response.status))
+                    return response.status == 200
         except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream='telegram', status='exception')
             logger.error(f"Ошибка отправки сообщения: {str(e)}")
             return False
 
     async def process_message(self, text: str) -> str:
-        """Обработка сообщения через основной сер��ис"""
+        """Обработка сообщения через основной сервис"""
+        if self.chat_handler is not None:
+            return await self._process_local(text)
+        return await self._process_http(text)
+
+    async def _process_local(self, text: str) -> str:
+        """Вызов чат-пайплайна в том же процессе, без HTTP"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.service_url}/api/neo/chat",
-                    json={"message": text}
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('message', 'No response from service')
-                    else:
-                        logger.error(f"Service error: {response.status}")
-                        return "Neural interface malfunction"
+            data = await self.chat_handler(text)
+            return data.get('message', 'No response from service')
+        except Exception as e:
+            logger.error(f"Service error: {str(e)}")
+            return "Neural interface malfunction"
+
+    async def _process_http(self, text: str) -> str:
+        """Запрос к сервису по HTTP (раздельный деплой)"""
+        try:
+            session = await self._session()
+
+            async with session.post(
+                f"{self.service_url}/api/neo/chat",
+                json={"message": text}
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get('message', 'No response from service')
+                else:
+                    logger.error(f"Service error: {response.status}")
+                    return "Neural interface malfunction"
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
             return "Neural interface connection error"
 
+    def _is_duplicate(self, update_id: Optional[int]) -> bool:
+        """Проверка повторной доставки апдейта"""
+        if update_id is None:
+            return False
+        if update_id in self._seen_updates:
+            self._seen_updates.move_to_end(update_id)
+            return True
+        return False
+
+    def _remember(self, update_id: Optional[int]) -> None:
+        if update_id is None:
+            return
+        self._seen_updates[update_id] = None
+        while len(self._seen_updates) > self.dedupe_size:
+            self._seen_updates.popitem(last=False)
+
+    def _update_key(self, update_id: int) -> str:
+        return f"telegram:update:{self._token_hash()}:{update_id}"
+
+    async def _claim_update(self, update_id: Optional[int]) -> bool:
+        """
+        Отметка апдейта как принятого; False - повторная доставка. С Redis
+        update_id занимается атомарно (SET NX EX), и повтор, пришедший в
+        другой воркер, тоже отсекается. При ошибке Redis проверка остается
+        в памяти процесса.
+        """
+        if update_id is None:
+            return True
+        if self._is_duplicate(update_id):
+            return False
+        if self.redis is None:
+            return True
+        try:
+            claimed = await self.redis.set(self._update_key(update_id), b'1', nx=True, ex=self.dedupe_ttl)
+        except Exception as e:
+            logger.warning(f"Redis недоступен для проверки повторов: {e}")
+            return True
+        if not claimed:
+            self._remember(update_id)
+            return False
+        return True
+
+    async def _release_update(self, update_id: Optional[int]) -> None:
+        """Снятие отметки с непринятого апдейта, чтобы повторная доставка обработалась"""
+        if update_id is None or self.redis is None:
+            return
+        try:
+            await self.redis.delete(self._update_key(update_id))
+        except Exception as e:
+            logger.warning(f"Не удалось снять отметку update {update_id}: {e}")
+
+    async def process_update(self, update: Dict[str, Any]) -> None:
+        """Обработка апдейта воркером: ответ сервиса и отправка в чат"""
+        message = update['message']
+        chat_id = message['chat']['id']
+        text = message['text']
+
+        logger.info("Обработка сообщения от chat_id %s: %s", chat_id, Payload(text), extra=sample('telegram.message'))
+
+        start_trace('telegram')
+        with span('telegram.update', update_id=update.get('update_id')):
+            # Обрабатываем сообщение через основной сервис
+            response_text = await self.process_message(text)
+            await self.send_telegram_message(chat_id, response_text)
+
     async def handle_webhook(self, request: web.Request) -> web.Response:
-        """Обработчик вебхука от Telegram"""
+        """
+        Обработчик вебхука от Telegram.
+
+        Апдейт ставится в очередь, ответ 200 отправляется сразу, чтобы
+        Telegram не повторял доставку медленных апдейтов. Повторы
+        отсекаются по update_id. При переполнении очереди возвращается
+        503, и Telegram доставит апдейт позже.
+
+        Порядок апдейтов одного чата соблюдается внутри воркера (очередь
+        по chat_id). При нескольких воркерах апдейты чата могут попасть в
+        разные процессы и обрабатываться параллельно.
+        """
         try:
-            update = await request.json()
-            logger.info(f"Получен webhook update: {update}")
-            
+            update = await codec.read_json(request)
+            update_id = update.get('update_id')
+            logger.info("Получен webhook update: %s", update_id, extra=sample('telegram.update'))
+
+            if not await self._claim_update(update_id):
+                self.duplicates += 1
+                logger.info("Повторная доставка update %s, пропускаем", update_id, extra=sample('telegram.duplicate'))
+                return web.Response(status=200)
+
             # Проверяем наличие сообщения
             if 'message' in update and 'text' in update['message']:
-                message = update['message']
-                chat_id = message['chat']['id']
-                text = message['text']
-                
-                logger.info(f"Обработка сообщения от chat_id {chat_id}: {text}")
-                
-                # Обрабатываем сообщение через основной сервис
-                response_text = await self.process_message(text)
-                await self.send_telegram_message(chat_id, response_text)
-                
+                chat_id = update['message']['chat']['id']
+                if not self.updates.submit(chat_id, update):
+                    logger.warning(f"Очередь апдейтов переполнена, update {update_id} отклонен")
+                    await self._release_update(update_id)
+                    return web.Response(status=503)
+
+            self._remember(update_id)
             return web.Response(status=200)
             
         except Exception as e:
             logger.error(f"Ошибка обработки вебхука: {str(e)}")
             return web.Response(status=500)
 
-    def check_and_setup_webhook(self) -> None:
-        """Проверка и настройка вебхука при запуске"""
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики очереди апдейтов и состояние вебхука"""
+        return {
+            "updates": self.updates.stats(),
+            "duplicates": self.duplicates,
+            "webhook": self.webhook_state,
+        }
+
+    def _token_hash(self) -> str:
+        """Идентификатор бота для ключей Redis; сам токен в ключи не попадает"""
+        return hashlib.sha256(str(self.token).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _state_path() -> Optional[str]:
+        """
+        Файл состояния вебхука по TELEGRAM_WEBHOOK_STATE; без переменной
+        файл не ведется. Относительный путь отсчитывается от
+        TELEGRAM_DATA_DIR (по умолчанию - рабочий каталог).
+        """
+        path = os.getenv('TELEGRAM_WEBHOOK_STATE', '')
+        if not path:
+            return None
+        return os.path.abspath(os.path.join(os.getenv('TELEGRAM_DATA_DIR', ''), path))
+
+    def _state_key(self) -> str:
+        """Ключ состояния вебхука"""
+        return f"telegram:webhook:{self._token_hash()}"
+
+    async def _load_webhook_state(self) -> Optional[Dict[str, Any]]:
+        """Последнее подтвержденное состояние вебхука (Redis или файл)"""
         try:
-            response = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getWebhookInfo"
-            )
-            webhook_info = response.json()
-            
-            current_url = webhook_info.get('result', {}).get('url', '')
-            
-            if not current_url or current_url != self.webhook_url:
-                logger.info(f"Настройка вебхука на {self.webhook_url}")
-                response = requests.post(
-                    f"https://api.telegram.org/bot{self.token}/setWebhook",
-                    data={"url": self.webhook_url}
-                )
-                if response.status_code == 200:
-                    logger.info("Вебхук успешно настроен")
-                else:
-                    logger.error(f"Ошибка настройки вебхука: {response.text}")
+            if self.redis is not None:
+                raw = await self.redis.get(self._state_key())
+            elif self.state_file is not None and os.path.exists(self.state_file):
+                with open(self.state_file, encoding='utf-8') as f:
+                    raw = f.read()
             else:
+                return None
+            if not raw:
+                return None
+            state = json.loads(raw)
+            return state if state.get('key') == self._state_key() else None
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать состояние вебхука: {e}")
+            return None
+
+    async def _save_webhook_state(self) -> None:
+        state = json.dumps({"key": self._state_key(), "url": self.webhook_url, "confirmed_at": time.time()})
+        try:
+            if self.redis is not None:
+                await self.redis.set(self._state_key(), state)
+            elif self.state_file is not None:
+                os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+                with open(self.state_file, 'w', encoding='utf-8') as f:
+                    f.write(state)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить состояние вебхука: {e}")
+
+    async def check_and_setup_webhook(self) -> str:
+        """
+        Проверка и настройка вебхука через Bot API.
+
+        Если этот URL уже подтверждался не дольше TELEGRAM_WEBHOOK_RECHECK
+        секунд назад, обращения к Telegram нет.
+
+        Returns:
+            cached, unchanged, set или failed
+        """
+        cached = await self._load_webhook_state()
+        if cached and cached.get('url') == self.webhook_url \
+                and time.time() - cached.get('confirmed_at', 0) < self.recheck_interval:
+            logger.info("Вебхук подтвержден ранее, проверка пропущена")
+            return 'cached'
+
+        session = await self._session()
+
+        try:
+            async with session.get(self.api_url('getWebhookInfo')) as response:
+                webhook_info = await response.json()
+
+            current_url = webhook_info.get('result', {}).get('url', '')
+
+            if current_url == self.webhook_url:
                 logger.info("Вебхук уже настроен корректно")
-                
+                await self._save_webhook_state()
+                return 'unchanged'
+
+            logger.info(f"Настройка вебхука на {self.webhook_url}")
+            async with session.post(self.api_url('setWebhook'), data={"url": self.webhook_url}) as response:
+                if response.status == 200:
+                    logger.info("Вебхук успешно настроен")
+                    await self._save_webhook_state()
+                    return 'set'
+                logger.error(f"Ошибка настройки вебхука: {await response.text()}")
+                return 'failed'
+
         except Exception as e:
             logger.error(f"Ошибка при проверке/настройке вебхука: {str(e)}")
+            return 'failed'
+
+    async def _setup_webhook_in_background(self, timeout: float) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            status = await asyncio.wait_for(self.check_and_setup_webhook(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Настройка вебхука не уложилась в {timeout}s")
+            status = 'timeout'
+        duration_ms = round((loop.time() - started) * 1000, 1)
+        self.webhook_state = {"status": status, "duration_ms": duration_ms}
+        logger.info(f"Webhook setup: {status} in {duration_ms}ms")
+
+    def schedule_webhook_setup(self) -> None:
+        """Настройка вебхука в фоне: запуск сервиса ее не ждет (TELEGRAM_SETUP_TIMEOUT)"""
+        self.webhook_state = {"status": "pending"}
+        timeout = env_float('TELEGRAM_SETUP_TIMEOUT', 10.0)
+        self._setup_task = asyncio.get_running_loop().create_task(self._setup_webhook_in_background(timeout))
 
     def get_routes(self) -> list:
         """Возвращает список роутов для интеграции в основное приложение"""
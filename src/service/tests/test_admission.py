@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from src.service.core.admission import AdmissionLimiter, AdmissionRejected, PriorityClass, create_limiters
+
+def make_limiter(limit: int = 1, queue: int = 10, max_wait: float = 1.0) -> AdmissionLimiter:
+    return AdmissionLimiter('test', limit, [
+        PriorityClass('web', queue, max_wait),
+        PriorityClass('telegram', queue, max_wait),
+    ])
+
+class TestAdmissionLimiter:
+    """Тесты ограничителя параллельных вызовов"""
+
+    async def test_limits_concurrency(self) -> None:
+        limiter = make_limiter(limit=2)
+        running, peak = 0, 0
+
+        async def call() -> None:
+            nonlocal running, peak
+            async with limiter.slot('web'):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        assert peak == 2
+        assert limiter.stats()["active"] == 0
+        assert limiter.stats()["classes"]["web"]["admitted"] == 6
+
+    async def test_sheds_when_queue_full(self) -> None:
+        limiter = make_limiter(limit=1, queue=1)
+        await limiter.acquire('web')
+        waiting = asyncio.create_task(limiter.acquire('web'))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await limiter.acquire('web')
+        assert exc_info.value.reason == 'queue_full'
+        assert exc_info.value.retry_after >= 1
+
+        limiter.release()
+        await waiting
+        assert limiter.active == 1
+
+    async def test_max_wait(self) -> None:
+        limiter = make_limiter(limit=1, max_wait=0.02)
+        await limiter.acquire('web')
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await limiter.acquire('web')
+        assert exc_info.value.reason == 'timeout'
+        assert limiter.stats()["classes"]["web"] == {"waiting": 0, "admitted": 1, "rejected": 0, "timed_out": 1}
+
+    async def test_priority_order(self) -> None:
+        limiter = make_limiter(limit=1)
+        order = []
+        await limiter.acquire('web')
+
+        async def call(priority: str) -> None:
+            async with limiter.slot(priority):
+                order.append(priority)
+
+        tasks = [asyncio.create_task(call('telegram')), asyncio.create_task(call('web'))]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ['web', 'telegram']
+
+    async def test_cancelled_waiter_frees_queue(self) -> None:
+        limiter = make_limiter(limit=1)
+        await limiter.acquire('web')
+        waiting = asyncio.create_task(limiter.acquire('telegram'))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        limiter.release()
+        assert limiter.stats()["active"] == 0
+        assert limiter.stats()["classes"]["telegram"]["waiting"] == 0
+
+    def test_create_limiters_from_env(self, monkeypatch) -> None:
+        monkeypatch.setenv('ADMISSION_GROQ_LIMIT', '4')
+        monkeypatch.setenv('ADMISSION_TELEGRAM_QUEUE', '7')
+        limiters = create_limiters({'groq': 32, 'neo': 64}, priority='telegram,web')
+        assert limiters['groq'].limit == 4
+        assert limiters['neo'].limit == 64
+        assert list(limiters['groq'].classes) == ['telegram', 'web']
+        assert limiters['groq'].classes['telegram'].max_queue == 7
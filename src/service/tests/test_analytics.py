@@ -0,0 +1,159 @@
+import sqlite3
+import pytest
+from aiohttp import web
+from typing import Any
+from src.service.core.analytics import AnalyticsStore, extract_metrics, histogram_bin, parse_time
+from src.service.main import ServiceHandler
+
+HOUR = 3600
+# 2024-01-01T00:00:00Z
+BASE = 1704067200
+
+def result(score: float, perplexity: float, ai: bool = False) -> dict:
+    return {
+        "status": "success",
+        "is_ai_generated": ai,
+        "human_likeness_score": score,
+        "metrics": {"perplexity": perplexity, "readability": {"flesch": 50}, "sentences": [{"tokens": 5}]},
+    }
+
+class TestAnalyticsStore:
+    """Журнал результатов анализа и агрегаты по корзинам времени"""
+
+    def test_extract_metrics(self) -> None:
+        assert extract_metrics(result(42, 7.5, ai=True)) == {
+            "human_likeness_score": 42.0,
+            "is_ai_generated": 1.0,
+            "perplexity": 7.5,
+            "readability.flesch": 50.0,
+        }
+        assert extract_metrics({"metrics": {"a": 1, "b": 2, "c": 3}}, max_metrics=2) == {"a": 1.0, "b": 2.0}
+
+    def test_histogram_bin(self) -> None:
+        assert histogram_bin(37, 10) == 30
+        assert histogram_bin(5.5) == 4
+        assert histogram_bin(-0.3) == -0.25
+        assert histogram_bin(0) == 0
+
+    def test_parse_time(self) -> None:
+        assert parse_time('1704067200') == BASE
+        assert parse_time('2024-01-01T01:00:00') == BASE + HOUR
+        assert parse_time('2024-01-01T01:00:00Z') == BASE + HOUR
+        assert parse_time(None) is None
+
+    async def test_rollups(self, tmp_path) -> None:
+        store = AnalyticsStore(str(tmp_path / 'analytics.db'))
+        try:
+            store.record('m1', result(20, 4), 'web', ts=BASE + 10)
+            store.record('m2', result(40, 8), 'telegram', ts=BASE + 20)
+            store.record('m3', result(90, 1), 'web', ts=BASE + HOUR + 5)
+            # Ошибки анализа сохраняются, но в агрегаты не попадают
+            store.record('m4', {"status": "error", "human_likeness_score": 0, "metrics": {}}, 'web', ts=BASE + 30)
+
+            report = await store.aggregate('hour', since=BASE, until=BASE + HOUR, metric='human_likeness_score')
+            buckets = report['metrics']['human_likeness_score']['buckets']
+            assert [(b['count'], b['mean'], b['min'], b['max']) for b in buckets] == [(2, 30.0, 20, 40), (1, 90.0, 90, 90)]
+            assert buckets[0]['histogram'] == [[20.0, 1], [40.0, 1]]
+            total = report['metrics']['human_likeness_score']['total']
+            assert total['count'] == 3 and total['mean'] == 50.0
+
+            web_only = await store.aggregate('day', since=BASE, until=BASE, source='web')
+            assert web_only['metrics']['perplexity']['total']['count'] == 2
+            assert web_only['metrics']['perplexity']['buckets'][0]['start'] == '2024-01-01T00:00:00+00:00'
+            assert store.stats()['written'] == 4
+        finally:
+            await store.stop()
+
+    async def test_rollups_accumulate_across_restarts(self, tmp_path) -> None:
+        path = str(tmp_path / 'analytics.db')
+        for score in (10, 30):
+            store = AnalyticsStore(path, resolutions=['hour'])
+            await store.start()
+            store.record('m', result(score, 1), ts=BASE)
+            await store.stop()
+
+        store = AnalyticsStore(path, resolutions=['hour'])
+        try:
+            report = await store.aggregate('hour', since=BASE, until=BASE, metric='human_likeness_score')
+            assert report['metrics']['human_likeness_score']['total']['mean'] == 20.0
+        finally:
+            await store.stop()
+        with sqlite3.connect(path) as conn:
+            assert conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0] == 2
+
+    async def test_degraded_results_kept_out_of_rollups(self, tmp_path) -> None:
+        path = str(tmp_path / 'analytics.db')
+        store = AnalyticsStore(path, resolutions=['hour'])
+        await store.start()
+        try:
+            store.record('neo', result(80, 1), ts=BASE)
+            store.record('local', {**result(20, 1), "status": "degraded", "source": "local"}, ts=BASE)
+            store.record('failed', {"status": "error", "error": "down", "human_likeness_score": 0}, ts=BASE)
+            await store.flush()
+            report = await store.aggregate('hour', since=BASE, until=BASE, metric='human_likeness_score')
+            assert report['metrics']['human_likeness_score']['total']['count'] == 1
+            assert report['metrics']['human_likeness_score']['total']['mean'] == 80.0
+            assert store.stats()['excluded'] == 2
+        finally:
+            await store.stop()
+        with sqlite3.connect(path) as conn:
+            statuses = sorted(row[0] for row in conn.execute('SELECT status FROM analyses'))
+        assert statuses == ['degraded', 'error', 'success']
+
+    async def test_aggregate_validation(self, tmp_path) -> None:
+        store = AnalyticsStore(str(tmp_path / 'analytics.db'), resolutions=['hour'])
+        try:
+            with pytest.raises(ValueError, match='resolution'):
+                await store.aggregate('day')
+            with pytest.raises(ValueError, match='Too many buckets'):
+                await store.aggregate('hour', since=0, until=BASE)
+            with pytest.raises(ValueError, match='later'):
+                await store.aggregate('hour', since=BASE + HOUR, until=BASE)
+        finally:
+            await store.stop()
+
+    def test_from_env_is_opt_in(self, monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+        monkeypatch.delenv('ANALYTICS_DB', raising=False)
+        assert AnalyticsStore.from_env() is None
+
+        monkeypatch.setenv('ANALYTICS_DB', 'analytics.db')
+        monkeypatch.setenv('ANALYTICS_DATA_DIR', str(tmp_path / 'data'))
+        assert AnalyticsStore.from_env().path == str(tmp_path / 'data' / 'analytics.db')
+
+    async def test_creates_data_dir(self, tmp_path) -> None:
+        store = AnalyticsStore(str(tmp_path / 'data' / 'analytics.db'))
+        await store.start()
+        await store.stop()
+        assert (tmp_path / 'data' / 'analytics.db').exists()
+
+    def test_buffer_overflow_drops(self) -> None:
+        store = AnalyticsStore(':memory:', buffer_size=1)
+        assert store.record('m1', result(1, 1))
+        assert not store.record('m2', result(1, 1))
+        assert store.stats()['dropped'] == 1
+
+    async def test_endpoint(self, aiohttp_client: Any, monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+        monkeypatch.setenv('ANALYTICS_DB', str(tmp_path / 'analytics.db'))
+        handler = ServiceHandler()
+
+        async def fake_analyze(text):
+            return result(60, 3)
+
+        handler.neo_api.analyze_text = fake_analyze
+        await handler._analyze_and_broadcast('m1', 'text', priority='telegram')
+
+        app = web.Application()
+        app.router.add_get('/analytics/aggregates', handler.handle_analytics)
+        app.on_cleanup.append(lambda app: handler.analytics.stop())
+        client = await aiohttp_client(app)
+
+        resp = await client.get('/analytics/aggregates', params={'metric': 'human_likeness_score', 'source': 'telegram'})
+        assert resp.status == 200
+        data = await resp.json()
+        assert data['metrics']['human_likeness_score']['total']['mean'] == 60.0
+
+        resp = await client.get('/analytics/aggregates', params={'source': 'web'})
+        assert (await resp.json())['metrics'] == {}
+
+        resp = await client.get('/analytics/aggregates', params={'resolution': 'week'})
+        assert resp.status == 400
@@ -0,0 +1,82 @@
+import pytest
+import aiohttp
+import websockets
+from aiohttp import web
+from src.service.main import ServiceHandler, health_check
+from src.service.telegram.main import Neon_Nexus_AI_bot_webhook
+from src.service.bench.fakes import FakeUpstreams, LatencyModel, UpstreamProfile
+from src.service.bench.main import LoadConfig, LoadDriver
+
+@pytest.fixture
+async def fakes():
+    fakes = FakeUpstreams(
+        groq=UpstreamProfile(latency=LatencyModel('fixed', 5)),
+        neo=UpstreamProfile(latency=LatencyModel('uniform', 5)),
+        reply_words=3,
+    )
+    await fakes.start()
+    yield fakes
+    await fakes.stop()
+
+class TestBenchHarness:
+    """Стенд фейковых API и нагрузочный драйвер"""
+
+    def test_latency_model_parse(self) -> None:
+        model = LatencyModel.parse('lognormal:200:0.3')
+        assert (model.kind, model.mean, model.spread) == ('lognormal', 0.2, 0.3)
+        assert LatencyModel.parse('fixed:50').sample() == 0.05
+        with pytest.raises(ValueError):
+            LatencyModel.parse('gaussian:10')
+
+    async def test_fault_injection(self, fakes: FakeUpstreams) -> None:
+        fakes.profiles['groq'] = UpstreamProfile(rate_limit_rate=1.0, retry_after=2)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{fakes.base_url}/openai/v1/chat/completions", json={"messages": []}) as response:
+                assert response.status == 429
+                assert response.headers['Retry-After'] == '2'
+        assert fakes.stats()['groq'] == {"requests": 1, "statuses": {429: 1}}
+
+    async def test_driver_against_fakes(self, fakes: FakeUpstreams, monkeypatch) -> None:
+        """Полный прогон: /chat, вебхук и WebSocket-подписчик без внешних API"""
+        for key, value in fakes.env().items():
+            monkeypatch.setenv(key, value)
+        handler = ServiceHandler()
+        bot = Neon_Nexus_AI_bot_webhook('bench', 'https://bench/hook', 'https://bench', chat_handler=handler.chat)
+        app = web.Application()
+        app['service_handler'] = handler
+        app.on_startup.extend([handler.on_startup, bot.on_startup])
+        app.on_cleanup.extend([handler.on_cleanup, bot.on_cleanup])
+        app.router.add_get('/health', health_check)
+        app.router.add_post('/chat', handler.handle_chat)
+        for route in bot.get_routes():
+            app.router.add_route(route.method, route.path, route.handler)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        ws_server = await websockets.serve(handler.register_websocket, '127.0.0.1', 0)
+        ws_port = ws_server.sockets[0].getsockname()[1]
+        try:
+            config = LoadConfig(
+                target=f"http://127.0.0.1:{port}",
+                ws_url=f"ws://127.0.0.1:{ws_port}",
+                requests=6,
+                concurrency=2,
+                webhook_concurrency=1,
+                ws_subscribers=1,
+            )
+            report = await LoadDriver(config, fakes).run()
+        finally:
+            ws_server.close()
+            await runner.cleanup()
+
+        assert report['chat']['requests'] == 6
+        assert report['chat']['errors'] == 0
+        assert report['chat']['latency_ms']['p99'] > 0
+        assert report['webhook']['statuses'] == {'200': 6}
+        assert report['webhook']['delivery']['delivered'] == 6
+        assert report['websocket']['frames']['metrics'] == 6
+        assert report['service_loop_lag_ms']['count'] >= 0
+        assert report['upstreams']['groq']['requests'] == 12
@@ -0,0 +1,91 @@
+import json
+import asyncio
+import pytest
+from src.service.core.bus import LocalBus, RedisBus, create_bus
+from src.service.main import ServiceHandler, check_shared_state
+
+class FakeWebSocket:
+    """Заглушка WebSocket-клиента, запоминающая отправленные сообщения"""
+
+    def __init__(self) -> None:
+        self.sent: list = []
+
+    async def send(self, message: str) -> None:
+        self.sent.append(json.loads(message))
+
+class BrokenRedis:
+    async def publish(self, channel, message):
+        raise ConnectionError("redis down")
+
+async def wait_for(predicate, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+class TestBus:
+    """Тесты шины рассылки"""
+
+    async def test_local_bus_delivers_inline(self) -> None:
+        received = []
+
+        async def handler(envelope):
+            received.append(envelope)
+
+        bus = create_bus(handler, redis=None)
+        assert isinstance(bus, LocalBus) and not bus.distributed
+        await bus.publish({"message": "x"})
+        assert received == [{"message": "x"}]
+
+    async def test_redis_publish_failure_delivers_locally(self) -> None:
+        received = []
+
+        async def handler(envelope):
+            received.append(envelope)
+
+        bus = RedisBus(handler, BrokenRedis())
+        await bus.publish({"message": "x"})
+        assert received == [{"message": "x"}]
+        assert bus.stats()["errors"] == 1
+
+    async def test_metrics_cross_workers(self) -> None:
+        """Метрики, посчитанные в одном воркере, доходят до сокета в другом"""
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        producer, consumer = ServiceHandler(), ServiceHandler()
+        for handler in (producer, consumer):
+            handler.bus = RedisBus(handler._on_bus_message, fakeredis.FakeAsyncRedis(server=server), poll_timeout=0.05)
+            await handler.bus.start()
+
+        ws = FakeWebSocket()
+        consumer.ws_connections.add(ws)
+        consumer.handle_ws_message(ws, json.dumps({"type": "subscribe", "session_id": "alice"}))
+        try:
+            await producer.broadcast_metrics("m1", {"score": 1}, session_id="alice")
+            await wait_for(lambda: len(ws.sent) == 2)
+        finally:
+            for handler in (producer, consumer):
+                await handler.bus.stop()
+                await handler.broadcaster.close()
+
+        assert ws.sent[-1] == {"type": "metrics", "message_id": "m1", "data": {"score": 1}}
+        assert producer.bus.stats()["published"] == 1
+        assert consumer.bus.stats()["received"] == 1
+
+class TestWorkerState:
+    """Проверка общего состояния для нескольких воркеров"""
+
+    def test_workers_without_redis_refused(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv('REDIS_URL', raising=False)
+        check_shared_state(1)
+        with pytest.raises(RuntimeError, match='REDIS_URL'):
+            check_shared_state(2)
+
+        monkeypatch.setenv('WORKERS_ALLOW_LOCAL_STATE', '1')
+        check_shared_state(2)
+
+    def test_workers_with_redis_allowed(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        pytest.importorskip('redis')
+        monkeypatch.setenv('REDIS_URL', 'redis://localhost:6379/0')
+        check_shared_state(4)
@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import patch
+from src.service.core.cache import LRUCache, TieredCache, make_key
+
+class FakeRedis:
+    """Заглушка асинхронного Redis"""
+
+    def __init__(self) -> None:
+        self.data: dict = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+class BrokenRedis:
+    async def get(self, key):
+        raise ConnectionError("redis down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("redis down")
+
+class TestLRUCache:
+    """Тесты in-process LRU"""
+
+    def test_eviction(self) -> None:
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl(self) -> None:
+        cache = LRUCache(ttl=10)
+        with patch('src.service.core.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with patch('src.service.core.cache.time.monotonic', return_value=111.0):
+            assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_make_key_is_canonical(self) -> None:
+        assert make_key({"a": 1, "b": 2}) == make_key({"b": 2, "a": 1})
+        assert make_key({"a": 1}) != make_key({"a": 2})
+
+class TestTieredCache:
+    """Тесты двухуровневого кэша"""
+
+    async def test_redis_hit_warms_local(self) -> None:
+        redis = FakeRedis()
+        writer = TieredCache("test", redis=redis)
+        await writer.set("k", {"v": 1})
+
+        reader = TieredCache("test", redis=redis)
+        assert await reader.get("k") == {"v": 1}
+        assert reader.stats()["redis"]["hits"] == 1
+        assert await reader.get("k") == {"v": 1}
+        assert reader.stats()["local"]["hits"] == 1
+
+    async def test_redis_errors_are_misses(self) -> None:
+        cache = TieredCache("test", max_size=0, redis=BrokenRedis())
+        await cache.set("k", 1)
+        assert await cache.get("k") is None
+        assert cache.stats()["redis"]["errors"] == 2
+
+    async def test_undecodable_redis_value_is_miss(self) -> None:
+        redis = FakeRedis()
+        redis.data["test:k"] = b"\x80\x04\x95garbage"
+        cache = TieredCache("test", redis=redis)
+
+        assert await cache.get("k") is None
+        assert "test:k" not in redis.data
+        stats = cache.stats()["redis"]
+        assert stats["decode_errors"] == 1 and stats["misses"] == 1 and stats["hits"] == 0
+
+        await cache.set("k", {"v": 1})
+        assert await TieredCache("test", redis=redis).get("k") == {"v": 1}
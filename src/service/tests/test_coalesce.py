@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from src.service.core.coalesce import MicroBatcher, SingleFlight
+
+class TestSingleFlight:
+    """Тесты объединения одновременных запросов"""
+
+    async def test_concurrent_callers_share_request(self) -> None:
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"value": 42}
+
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+        assert calls == [1]
+        assert all(r == {"value": 42} for r in results)
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+    async def test_error_propagates_to_all(self) -> None:
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def test_cancelled_follower_does_not_cancel_leader(self) -> None:
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        flight = SingleFlight()
+        leader = asyncio.create_task(flight.do("key", fetch))
+        follower = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower.cancel()
+
+        assert await leader == "done"
+
+class TestMicroBatcher:
+    """Тесты микро-батчинга"""
+
+    async def test_items_grouped_and_concurrency_bounded(self) -> None:
+        active = 0
+        peak = 0
+
+        async def handle(item):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return item * 2
+
+        batcher = MicroBatcher(handle, window=0.01, concurrency=2)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+
+        assert results == [0, 2, 4, 6, 8, 10]
+        assert peak == 2
+        assert batcher.stats()["batches"] == 1
+        assert batcher.stats()["largest_batch"] == 6
+
+    async def test_max_batch_flushes_early(self) -> None:
+        async def handle(item):
+            return item
+
+        batcher = MicroBatcher(handle, window=10, max_batch=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit(1), batcher.submit(2)), timeout=1
+        )
+        assert results == [1, 2]
@@ -0,0 +1,91 @@
+import json
+import asyncio
+import pytest
+from src.service.core import codec
+from src.service.main import ServiceHandler
+from src.service.bench.codec import metrics_payload, run
+
+class RecordingWebSocket:
+    """Заглушка WebSocket-клиента: хранит кадры как есть (str или bytes)"""
+
+    def __init__(self, path: str = '/') -> None:
+        self.path = path
+        self.sent: list = []
+        self.closed = asyncio.Event()
+
+    async def send(self, message) -> None:
+        self.sent.append(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.closed.wait()
+        raise StopAsyncIteration
+
+class TestCodec:
+    """Подключаемый кодек JSON и формат кадров WebSocket"""
+
+    @pytest.mark.parametrize('name', sorted(codec.CODECS))
+    def test_roundtrip(self, name: str) -> None:
+        impl = codec.create_codec(name)
+        payload = metrics_payload(5)
+        assert impl.loads(impl.dumpb(payload)) == payload
+        assert impl.loads(impl.dumps(payload)) == payload
+        # Ключи-числа приводятся к строкам, как в stdlib
+        assert impl.loads(impl.dumps({1: 'a'})) == {'1': 'a'}
+
+    def test_unknown_codec_falls_back_to_stdlib(self) -> None:
+        assert codec.create_codec('simdjson').name == 'json'
+        expected = 'orjson' if codec.orjson is not None else 'json'
+        assert codec.create_codec('auto').name == expected
+
+    def test_negotiate_format(self) -> None:
+        assert codec.negotiate_format(None) == codec.FORMAT_JSON
+        assert codec.negotiate_format('/?format=xml') == codec.FORMAT_JSON
+        expected = codec.FORMAT_MSGPACK if codec.msgpack is not None else codec.FORMAT_JSON
+        assert codec.negotiate_format('/ws?session=1&format=msgpack') == expected
+
+    def test_json_response(self) -> None:
+        response = codec.json_response({"ok": "да"}, status=201, headers={'X-Test': '1'})
+        assert response.status == 201
+        assert response.content_type == 'application/json'
+        assert json.loads(response.body) == {"ok": "да"}
+
+    async def test_broadcast_encodes_once_per_format(self) -> None:
+        msgpack = pytest.importorskip('msgpack')
+        handler = ServiceHandler()
+        text_client = RecordingWebSocket('/')
+        binary_client = RecordingWebSocket('/?format=msgpack')
+        connections = [asyncio.create_task(handler.register_websocket(ws)) for ws in (text_client, binary_client)]
+        await asyncio.sleep(0)
+
+        await handler.broadcast_metrics('m1', {"score": 1}, broadcast_all=True)
+        await handler.broadcaster.flush()
+
+        assert json.loads(text_client.sent[0])['data'] == {"score": 1}
+        assert msgpack.unpackb(binary_client.sent[0], raw=False)['data'] == {"score": 1}
+        assert handler.stats()['codec']['ws_msgpack_clients'] == 1
+
+        for ws in (text_client, binary_client):
+            ws.closed.set()
+        await asyncio.gather(*connections)
+        assert handler.ws_formats == {}
+        await handler.broadcaster.close()
+
+    async def test_control_messages_accept_both_formats(self) -> None:
+        handler = ServiceHandler()
+        ws = RecordingWebSocket()
+        handler.handle_ws_message(ws, json.dumps({"type": "subscribe", "session_id": "s"}))
+        if codec.msgpack is not None:
+            frame = codec.msgpack.packb({"type": "subscribe", "message_ids": ["m1"]})
+            handler.handle_ws_message(ws, frame)
+        assert ws in handler.subscriptions.targets(None, "s")
+        await handler.broadcaster.close()
+
+    def test_benchmark_report(self) -> None:
+        report = run(sentences=3, iterations=2)
+        rows = report['payloads']['metrics']
+        assert rows['json']['encode_speedup'] == 1.0
+        assert set(rows) >= {'json'}
+        assert all(row['bytes'] > 0 for row in rows.values())
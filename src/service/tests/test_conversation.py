@@ -0,0 +1,114 @@
+import pytest
+from src.service.core.conversation import ConversationStore, estimate_tokens, trim_to_budget
+
+def msg(role: str, content: str) -> dict:
+    return {'role': role, 'content': content}
+
+class TestTrimToBudget:
+    """Тесты скользящего окна по бюджету токенов"""
+
+    def test_keeps_newest_messages(self) -> None:
+        history = [msg('user', 'x' * 40) for _ in range(10)]  # по 14 токенов
+        messages, tokens, trimmed = trim_to_budget(history, budget=50)
+
+        assert len(messages) == 3
+        assert trimmed == 7
+        assert tokens <= 50
+
+    def test_pinned_always_included(self) -> None:
+        system = msg('system', 'be nice')
+        history = [msg('user', 'a' * 400), msg('user', 'question')]
+        messages, _, trimmed = trim_to_budget(history, budget=20, pinned=[system])
+
+        assert messages == [system, msg('user', 'question')]
+        assert trimmed == 1
+
+    def test_last_message_kept_over_budget(self) -> None:
+        messages, _, _ = trim_to_budget([msg('user', 'a' * 1000)], budget=10)
+        assert len(messages) == 1
+
+    def test_estimate_tokens(self) -> None:
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+
+class TestConversationStore:
+    """Тесты серверного хранилища диалогов"""
+
+    async def test_history_used_for_prompt(self) -> None:
+        store = ConversationStore(system_prompt="sys")
+        await store.append("s1", [msg('user', 'hi'), msg('assistant', 'hello')])
+
+        messages, info = await store.build_prompt("s1", "how are you?")
+
+        assert messages == [
+            msg('system', 'sys'), msg('user', 'hi'), msg('assistant', 'hello'), msg('user', 'how are you?')
+        ]
+        assert info["messages"] == 4
+        assert info["trimmed"] == 0
+
+    async def test_summary_replaces_trimmed_messages(self) -> None:
+        seen = []
+
+        async def summarizer(previous, messages):
+            seen.append(messages)
+            return "they talked about cats"
+
+        store = ConversationStore(token_budget=40, summarizer=summarizer)
+        for i in range(4):
+            await store.append("s1", [msg('user', f'q{i}' * 10), msg('assistant', f'a{i}' * 10)])
+
+        assert await store.summarize("s1")
+        state = await store.load("s1")
+        assert state["summary"] == "they talked about cats"
+        assert len(state["messages"]) + len(seen[0]) == 8
+
+        messages, _ = await store.build_prompt("s1", "next")
+        assert messages[0]['content'].endswith("they talked about cats")
+
+class TestSharedConversationStore:
+    """Хранилище диалогов нескольких воркеров с общим Redis"""
+
+    @pytest.fixture
+    def stores(self):
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        return [ConversationStore(redis=fakeredis.FakeAsyncRedis(server=server)) for _ in range(2)]
+
+    async def test_appends_from_two_workers_are_kept(self, stores) -> None:
+        a, b = stores
+        await a.append("s1", [msg('user', 'a1'), msg('assistant', 'r1')])
+        assert (await b.load("s1"))["messages"] == [msg('user', 'a1'), msg('assistant', 'r1')]
+
+        await b.append("s1", [msg('user', 'b1'), msg('assistant', 'r2')])
+        await a.append("s1", [msg('user', 'a2'), msg('assistant', 'r3')])
+
+        contents = [m['content'] for m in (await b.load("s1"))["messages"]]
+        assert contents == ['a1', 'r1', 'b1', 'r2', 'a2', 'r3']
+        assert (await a.load("s1")) == (await b.load("s1"))
+
+    async def test_max_messages_trimmed_atomically(self, stores) -> None:
+        a, _ = stores
+        a.max_messages = 3
+        for i in range(5):
+            await a.append("s1", [msg('user', f'q{i}')])
+        assert [m['content'] for m in (await a.load("s1"))["messages"]] == ['q2', 'q3', 'q4']
+
+    async def test_summary_keeps_concurrent_append(self, stores) -> None:
+        a, b = stores
+
+        async def summarizer(previous, messages):
+            # Другой воркер дописывает реплику, пока строится краткое содержание
+            await b.append("s1", [msg('user', 'late')])
+            return "summary"
+
+        a.token_budget = 40
+        a.summarizer = summarizer
+        for i in range(4):
+            await a.append("s1", [msg('user', f'q{i}' * 10), msg('assistant', f'a{i}' * 10)])
+
+        assert await a.summarize("s1")
+        state = await b.load("s1")
+        assert state["summary"] == "summary"
+        assert state["messages"][-1] == msg('user', 'late')
+        assert a.stats()["backend"] == "redis"
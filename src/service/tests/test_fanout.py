@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from src.service.core.fanout import Broadcaster
+
+class FakeWebSocket:
+    """Заглушка WebSocket-клиента с настраиваемой задержкой отправки"""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.sent: list = []
+        self.closed = False
+
+    async def send(self, message: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self) -> None:
+        self.closed = True
+
+class TestBroadcaster:
+    """Тесты конкурентной рассылки"""
+
+    async def test_slow_client_does_not_block_others(self) -> None:
+        """Медленный клиент не задерживает доставку быстрым"""
+        fast = [FakeWebSocket() for _ in range(3)]
+        slow = FakeWebSocket(delay=10)
+        broadcaster = Broadcaster(send_timeout=0.2)
+        try:
+            assert broadcaster.publish("frame", fast + [slow]) == 4
+            await asyncio.wait_for(
+                asyncio.gather(*(broadcaster.channels[ws].queue.join() for ws in fast)),
+                timeout=0.1
+            )
+            assert all(ws.sent == ["frame"] for ws in fast)
+        finally:
+            await broadcaster.close()
+
+    async def test_send_timeout_disconnects(self) -> None:
+        """Клиент, не принявший кадр за send_timeout, отключается"""
+        disconnected = []
+        slow = FakeWebSocket(delay=10)
+        broadcaster = Broadcaster(send_timeout=0.05, on_disconnect=disconnected.append)
+        try:
+            broadcaster.publish("frame", [slow])
+            await broadcaster.flush()
+            await asyncio.sleep(0)
+            assert disconnected == [slow]
+            assert slow.closed
+            assert broadcaster.stats()["send_timeouts"] == 1
+        finally:
+            await broadcaster.close()
+
+    async def test_drop_oldest_coalesces_frames(self) -> None:
+        """При переполнении очереди старые кадры вытесняются новыми"""
+        ws = FakeWebSocket(delay=0.01)
+        broadcaster = Broadcaster(queue_size=2, policy='drop_oldest')
+        try:
+            for i in range(5):
+                broadcaster.publish(f"frame-{i}", [ws])
+            await broadcaster.flush()
+        finally:
+            await broadcaster.close()
+
+        assert ws.sent[-1] == "frame-4"
+        assert len(ws.sent) < 5
+        assert broadcaster.stats()["frames_dropped"] > 0
+
+    async def test_disconnect_policy_drops_client(self) -> None:
+        """Политика disconnect отключает клиента с переполненной очередью"""
+        ws = FakeWebSocket(delay=10)
+        connections = {ws}
+        broadcaster = Broadcaster(queue_size=1, policy='disconnect', on_disconnect=connections.discard)
+        try:
+            results = [broadcaster.publish(f"frame-{i}", connections) for i in range(3)]
+        finally:
+            await broadcaster.close()
+
+        assert results == [1, 0, 0]
+        assert not connections
+        assert broadcaster.stats()["clients_dropped"] == 1
+
+    async def test_message_shared_between_clients(self) -> None:
+        """Один и тот же объект сообщения отправляется всем клиентам"""
+        clients = [FakeWebSocket() for _ in range(3)]
+        message = '{"type": "metrics"}'
+        broadcaster = Broadcaster()
+        try:
+            broadcaster.publish(message, clients)
+            await broadcaster.flush()
+        finally:
+            await broadcaster.close()
+
+        assert all(ws.sent[0] is message for ws in clients)
+        assert broadcaster.stats()["frames_sent"] == 3
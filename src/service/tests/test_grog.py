@@ -1,7 +1,8 @@
 import os
 import pytest
 import logging
-from unittest.mock import patch, MagicMock
+import asyncio
+from aioresponses import aioresponses, CallbackResult
 from src.service.grog.main import GroqAPI
 
 logger = logging.getLogger(__name__)
@@ -25,16 +26,12 @@ def mock_groq_response():
         }]
     }
 
+GROQ_URL = 'https://api.groq.com/openai/v1/chat/completions'
+
 @pytest.fixture
-def mock_requests():
-    """Фикстура для мока requests"""
-    with patch('requests.post') as mock:
-        response = MagicMock()
-        response.status_code = 200
-        response.json.return_value = {
-            'choices': [{'message': {'content': 'Test response'}}]
-        }
-        mock.return_value = response
+def mock_http():
+    """Фикстура для мока aiohttp-запросов"""
+    with aioresponses() as mock:
         yield mock
 
 class TestGroqAPI:
@@ -52,19 +49,130 @@ class TestGroqAPI:
             GroqAPI("")
 
     @pytest.mark.asyncio
-    async def test_get_response_mock(self, groq_api_key, mock_requests):
+    async def test_get_response_mock(self, groq_api_key, mock_http):
         """Тест получения ответа с моком"""
+        mock_http.post(GROQ_URL, payload={
+            'choices': [{'message': {'content': 'Test response'}}]
+        })
         api = GroqAPI(groq_api_key)
-        response = await api.get_response("Test message")
+        try:
+            response = await api.get_response("Test message")
+        finally:
+            await api.close()
         
         assert response == "Test response"
-        mock_requests.assert_called_once()
+        calls = [c for calls in mock_http.requests.values() for c in calls]
+        assert len(calls) == 1
         
         # Проверяем параметры запроса
-        call_kwargs = mock_requests.call_args[1]
+        call_kwargs = calls[0].kwargs
         assert 'messages' in call_kwargs['json']
         assert call_kwargs['json']['messages'][0]['content'] == "Test message"
 
+    @pytest.mark.asyncio
+    async def test_session_reused(self, groq_api_key, mock_http):
+        """Тест что запросы используют одну долгоживущую сессию"""
+        mock_http.post(GROQ_URL, payload={
+            'choices': [{'message': {'content': 'Test response'}}]
+        }, repeat=True)
+        api = GroqAPI(groq_api_key)
+        await api.start()
+        session = api.session
+        try:
+            await api.get_response("first")
+            await api.get_response("second")
+            assert api.session is session
+        finally:
+            await api.close()
+        assert api.session is None
+
+    @pytest.mark.asyncio
+    async def test_retry_after_429(self, groq_api_key, mock_http):
+        """429 повторяется после паузы из Retry-After, 401 - нет"""
+        mock_http.post(GROQ_URL, status=429, body="Rate limit", headers={'Retry-After': '0.05'})
+        mock_http.post(GROQ_URL, payload={
+            'choices': [{'message': {'content': 'Test response'}}]
+        })
+        api = GroqAPI(groq_api_key)
+        try:
+            result = await api.complete("Test message")
+        finally:
+            await api.close()
+
+        assert result["content"] == "Test response"
+        assert result["attempts"] == 2
+        assert api.breaker.stats()["state"] == "closed"
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_overlap(self, groq_api_key, mock_http):
+        """Тест что одновременные запросы не блокируют event loop"""
+        async def slow_reply(url, **kwargs):
+            await asyncio.sleep(0.2)
+            return CallbackResult(payload={
+                'choices': [{'message': {'content': 'Test response'}}]
+            })
+
+        mock_http.post(GROQ_URL, callback=slow_reply, repeat=True)
+        api = GroqAPI(groq_api_key)
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await asyncio.gather(*(api.get_response(f"m{i}") for i in range(5)))
+            elapsed = loop.time() - started
+        finally:
+            await api.close()
+
+        assert results == ["Test response"] * 5
+        assert elapsed < 0.6
+
+    @pytest.mark.asyncio
+    async def test_completion_cache(self, groq_api_key, mock_http, monkeypatch):
+        """Тест кэша точных совпадений и его обхода"""
+        monkeypatch.setenv('GROQ_CACHE_ENABLED', '1')
+        mock_http.post(GROQ_URL, payload={
+            'choices': [{'message': {'content': 'Cached answer'}}]
+        }, repeat=True)
+
+        api = GroqAPI(groq_api_key)
+        try:
+            first = await api.complete("Same question")
+            second = await api.complete("Same question")
+            other = await api.complete("Other question")
+            bypass = await api.complete("Same question", use_cache=False)
+        finally:
+            await api.close()
+
+        assert first == {"content": "Cached answer", "cached": False, "attempts": 1}
+        assert second == {"content": "Cached answer", "cached": True, "attempts": 0}
+        assert other["cached"] is False
+        assert bypass["cached"] is False
+        calls = [c for calls in mock_http.requests.values() for c in calls]
+        assert len(calls) == 3
+
+    def test_cache_disabled_by_default(self, groq_api_key, monkeypatch):
+        """Кэш ответов включается только явно"""
+        monkeypatch.delenv('GROQ_CACHE_ENABLED', raising=False)
+        assert GroqAPI(groq_api_key).cache is None
+
+    @pytest.mark.asyncio
+    async def test_stream_response_mock(self, groq_api_key, mock_http):
+        """Тест стриминга ответа (stream: true) с моком SSE"""
+        chunks = ["Hel", "lo", "!"]
+        body = "".join(
+            f'data: {{"choices": [{{"delta": {{"content": "{c}"}}}}]}}\n\n' for c in chunks
+        ) + "data: [DONE]\n\n"
+        mock_http.post(GROQ_URL, body=body, content_type='text/event-stream')
+
+        api = GroqAPI(groq_api_key)
+        try:
+            tokens = [t async for t in api.stream_response("Test message")]
+        finally:
+            await api.close()
+
+        assert tokens == chunks
+        calls = [c for calls in mock_http.requests.values() for c in calls]
+        assert calls[0].kwargs['json']['stream'] is True
+
     @pytest.mark.integration
     @pytest.mark.asyncio
     async def test_real_api_integration(self, groq_api_key):
@@ -80,15 +188,19 @@ class TestGroqAPI:
         logger.info(f"Received response from Groq API: {response[:100]}...")
 
     @pytest.mark.asyncio
-    async def test_error_handling(self, groq_api_key, mock_requests):
+    async def test_error_handling(self, groq_api_key, mock_http):
         """Тест обработки ошибок"""
-        mock_requests.return_value.status_code = 401
-        mock_requests.return_value.text = "Unauthorized"
+        mock_http.post(GROQ_URL, status=401, body="Unauthorized", repeat=True)
         
         api = GroqAPI(groq_api_key)
-        with pytest.raises(Exception) as exc_info:
-            await api.get_response("Test message")
+        try:
+            with pytest.raises(Exception) as exc_info:
+                await api.get_response("Test message")
+        finally:
+            await api.close()
         assert "Groq API Error: 401" in str(exc_info.value)
+        # Ошибка авторизации не повторяется
+        assert sum(len(c) for c in mock_http.requests.values()) == 1
 
     @pytest.mark.asyncio
     async def test_specific_question(self, groq_api_key):
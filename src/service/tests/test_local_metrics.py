@@ -0,0 +1,124 @@
+import json
+import asyncio
+import pytest
+from aioresponses import aioresponses
+from src.service.neoapi.local import LocalAnalyzer, RemotePolicy, syllables
+from src.service.neoapi.main import NeoAPI
+from src.service.main import ServiceHandler
+from src.service.bench.textmetrics import run, sample_texts
+
+TEXT = "The cat sat. The cat ran away quickly! Did it come back?"
+
+class RecordingWebSocket:
+    """Заглушка WebSocket-клиента: хранит отправленные кадры"""
+
+    def __init__(self) -> None:
+        self.path = '/'
+        self.sent: list = []
+        self.closed = asyncio.Event()
+
+    async def send(self, message) -> None:
+        self.sent.append(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.closed.wait()
+        raise StopAsyncIteration
+
+class TestLocalMetrics:
+    """Локальные предварительные метрики и политика вызова Neo API"""
+
+    def test_metrics_shape_and_values(self) -> None:
+        result = LocalAnalyzer().analyze(TEXT)
+        assert result['status'] == 'provisional' and result['provisional'] is True
+        assert result['text'] == TEXT
+        assert 0 <= result['human_likeness_score'] <= 100
+        assert result['is_ai_generated'] == (result['human_likeness_score'] < 50)
+        metrics = result['metrics']
+        assert metrics['statistical_metrics'] == {'word_count': 12, 'unique_word_count': 10, 'sentence_count': 3}
+        assert metrics['readability_metrics']['avg_words_per_sentence'] == 4.0
+        assert metrics['vocabulary_lexical_diversity']['unique_word_ratio'] == round(10 / 12, 4)
+        assert 0 <= metrics['readability_metrics']['flesch_score'] <= 1
+        assert 0 <= metrics['text_coherence_complexity']['burstiness'] <= 1
+
+    def test_syllables(self) -> None:
+        assert syllables('cat') == 1
+        assert syllables('quickly') == 2
+        assert syllables('замечательная') == 5
+        assert syllables('ш') == 1
+
+    def test_empty_text(self) -> None:
+        stats = LocalAnalyzer().analyze('... 123 !')['metrics']['statistical_metrics']
+        assert stats == {'word_count': 0, 'unique_word_count': 0, 'sentence_count': 0}
+
+    def test_batch_matches_single(self) -> None:
+        analyzer = LocalAnalyzer()
+        texts = sample_texts(5) + ['', 'Привет, мир.']
+        assert analyzer.analyze_batch(texts) == [analyzer.analyze(text) for text in texts]
+        assert analyzer.analyze_batch([]) == []
+
+    def test_remote_policy(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        assert RemotePolicy.from_env('NEO') is None
+        monkeypatch.setenv('NEO_LOCAL_MIN_WORDS', '5')
+        monkeypatch.setenv('NEO_LOCAL_MIN_UNIQUE_WORDS', '3')
+        policy = RemotePolicy.from_env('NEO')
+        analyzer = LocalAnalyzer()
+        assert not policy('ok thanks', analyzer.analyze('ok thanks'))
+        assert not policy('yes yes yes yes yes', analyzer.analyze('yes yes yes yes yes'))
+        assert policy(TEXT, analyzer.analyze(TEXT))
+
+    async def test_neo_skips_remote_for_trivial_text(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('NEO_LOCAL_MIN_WORDS', '5')
+        api = NeoAPI('test-key')
+        try:
+            with aioresponses() as mock:
+                mock.post(NeoAPI.API_URL, payload={"human_likeness_score": 77.0})
+                short = await api.analyze_text('Sure, done.')
+                full = await api.analyze_text(TEXT)
+                calls = sum(len(c) for c in mock.requests.values())
+        finally:
+            await api.close()
+        assert short['status'] == 'degraded' and short['source'] == 'local' and short['provisional'] is False
+        assert short['metrics']['statistical_metrics']['word_count'] == 2
+        assert full['human_likeness_score'] == 77.0 and full['source'] == 'neo'
+        assert calls == 1
+        assert api.stats()['local']['local_only'] == 1
+
+    async def test_neo_reuses_precomputed_local_result(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('NEO_LOCAL_MIN_WORDS', '5')
+        api = NeoAPI('test-key')
+        local = api.analyze_local('Sure, done.')
+        result = await api.analyze_text('Sure, done.')
+        await api.close()
+        assert result['metrics'] == local['metrics']
+        stats = api.stats()['local']
+        assert stats['analyzed'] == 1 and stats['reused'] == 1
+
+    async def test_provisional_broadcast_before_final(self) -> None:
+        handler = ServiceHandler()
+        client = RecordingWebSocket()
+        connection = asyncio.create_task(handler.register_websocket(client))
+        await asyncio.sleep(0)
+        handler.handle_ws_message(client, json.dumps({"type": "subscribe", "session_id": "s"}))
+
+        async def fake_analyze(text):
+            return {"status": "success", "human_likeness_score": 80.0, "metrics": {}}
+
+        handler.neo_api.analyze_text = fake_analyze
+        await handler._analyze_and_broadcast('m1', TEXT, session_id='s')
+        await handler.broadcaster.flush()
+
+        frames = [json.loads(frame) for frame in client.sent if json.loads(frame)['type'] == 'metrics']
+        assert [frame['data']['status'] for frame in frames] == ['provisional', 'success']
+        assert {frame['message_id'] for frame in frames} == {'m1'}
+
+        client.closed.set()
+        await connection
+        await handler.broadcaster.close()
+
+    def test_benchmark_report(self) -> None:
+        report = run(texts=8, sentences=2, batches=(1, 4), repeat=1)
+        assert set(report['batches']) == {'1', '4'}
+        assert all(row['us_per_text'] > 0 for row in report['batches'].values())
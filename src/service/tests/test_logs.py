@@ -0,0 +1,96 @@
+import json
+import queue
+import logging
+import logging.handlers
+import pytest
+from src.service.core import logs
+from src.service.core.logs import DeferredQueueHandler, JsonFormatter, Payload, SamplingFilter, TruncatingFormatter, sample
+from src.service.bench.logs import run
+
+def make_record(msg: str, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+class Formatted:
+    """Аргумент лога, считающий вызовы __str__"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def __str__(self) -> str:
+        self.calls += 1
+        return 'formatted'
+
+class TestLogging:
+    """Очередь лога, семплирование частых строк и обрезка"""
+
+    def test_sampling_filter_limits_keyed_records(self) -> None:
+        sampling = SamplingFilter(rate=0.001, burst=2)
+        passed = [sampling.filter(make_record('hot', **sample('k'))) for _ in range(5)]
+        assert passed == [True, True, False, False, False]
+        assert sampling.stats() == {'k': 3}
+        # Записи без ключа не ограничиваются
+        assert all(sampling.filter(make_record('plain')) for _ in range(5))
+
+    def test_suppressed_count_reported(self) -> None:
+        sampling = SamplingFilter(rate=0.001, burst=1)
+        sampling.filter(make_record('hot', **sample('k')))
+        sampling.filter(make_record('hot', **sample('k')))
+        sampling._buckets['k'][0] = 1  # как будто прошла секунда
+        record = make_record('hot', **sample('k'))
+        assert sampling.filter(record)
+        assert TruncatingFormatter('%(message)s').format(record) == 'hot (+1 suppressed)'
+
+    def test_truncation(self) -> None:
+        formatter = TruncatingFormatter('%(message)s', max_length=10)
+        assert formatter.format(make_record('%s', 'x' * 25)) == 'x' * 10 + '... [25 chars]'
+        assert str(Payload({"text": "y" * 50}, limit=8)) == '{"text":... [61 chars]'
+
+    def test_json_formatter_includes_extra(self) -> None:
+        entry = json.loads(JsonFormatter().format(make_record('hello %s', 'world', user_id=7)))
+        assert entry['message'] == 'hello world'
+        assert entry['user_id'] == 7
+        assert entry['level'] == 'INFO'
+
+    def test_deferred_handler_formats_in_listener(self) -> None:
+        log_queue: queue.Queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        arg = Formatted()
+        handler.handle(make_record('value: %s', arg))
+        # В очереди запись без форматирования: __str__ аргумента не вызывался
+        assert arg.calls == 0
+        record = log_queue.get_nowait()
+        assert record.getMessage() == 'value: formatted'
+
+    def test_deferred_handler_drops_when_full(self) -> None:
+        handler = DeferredQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+        assert handler.dropped == 1
+
+    def test_configure_logging(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+        monkeypatch.setenv('LOG_MAX_LENGTH', '100')
+        try:
+            assert logs.configure_logging() is None  # обработчики уже есть (pytest)
+            root.handlers = []
+            listener = logs.configure_logging()
+            assert isinstance(listener, logging.handlers.QueueListener)
+            assert isinstance(root.handlers[0], DeferredQueueHandler)
+            assert root.level == logging.WARNING
+            assert logs._max_length == 100
+        finally:
+            logs.shutdown_logging()
+            root.handlers[:] = saved_handlers
+            root.setLevel(saved_level)
+            logs._max_length = 2000
+
+    def test_benchmark_report(self) -> None:
+        report = run(iterations=20, sentences=2, rate=1)
+        scenarios = report['scenarios']
+        assert set(scenarios) == {'sync', 'sync_lazy', 'queue', 'queue_sampled'}
+        # Семплирование сокращает объем записанного
+        assert scenarios['queue_sampled']['bytes_written'] < scenarios['queue']['bytes_written']
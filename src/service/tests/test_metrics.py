@@ -0,0 +1,44 @@
+import pytest
+from src.service.core.metrics import Counter, Gauge, Histogram, Registry
+
+class TestPrometheusRegistry:
+    """Тесты текстового формата Prometheus"""
+
+    def test_counter_and_gauge(self) -> None:
+        registry = Registry()
+        errors = Counter('test_errors_total', 'Errors', ['status'], registry=registry)
+        connections = Gauge('test_connections', 'Connections', registry=registry)
+        errors.inc(status='503')
+        errors.inc(2, status='503')
+        connections.set_function(lambda: 7)
+
+        text = registry.expose()
+        assert '# TYPE test_errors_total counter' in text
+        assert 'test_errors_total{status="503"} 3' in text
+        assert 'test_connections 7' in text
+
+    def test_histogram_buckets(self) -> None:
+        registry = Registry()
+        latency = Histogram('test_latency_seconds', 'Latency', ['upstream'], buckets=(0.1, 1.0), registry=registry)
+        latency.observe(0.05, upstream='groq')
+        latency.observe(0.5, upstream='groq')
+        latency.observe(5, upstream='groq')
+
+        text = registry.expose()
+        assert 'test_latency_seconds_bucket{upstream="groq",le="0.1"} 1' in text
+        assert 'test_latency_seconds_bucket{upstream="groq",le="1"} 2' in text
+        assert 'test_latency_seconds_bucket{upstream="groq",le="+Inf"} 3' in text
+        assert 'test_latency_seconds_count{upstream="groq"} 3' in text
+
+    def test_inprogress_gauge(self) -> None:
+        registry = Registry()
+        inflight = Gauge('test_inflight', 'In flight', ['upstream'], registry=registry)
+        with inflight.track_inprogress(upstream='neo'):
+            assert inflight.value(upstream='neo') == 1
+        assert inflight.value(upstream='neo') == 0
+
+    def test_label_mismatch(self) -> None:
+        registry = Registry()
+        errors = Counter('test_errors_total', 'Errors', ['status'], registry=registry)
+        with pytest.raises(ValueError):
+            errors.inc(code='500')
@@ -0,0 +1,180 @@
+import asyncio
+import pytest
+from aioresponses import aioresponses
+from src.service.core.resilience import UpstreamError
+from src.service.grog.main import GroqAPI
+from src.service.grog.router import ModelRouter, RouteTarget
+
+def make_router(*latencies, **kwargs) -> ModelRouter:
+    """Маршрутизатор с целями m0, m1, ...; latencies - прогретые задержки, сек"""
+    targets = []
+    for i, latency in enumerate(latencies):
+        target = RouteTarget(f'm{i}', 'http://fake/v1')
+        if latency is not None:
+            target.latencies.extend([latency] * 20)
+            target.last_used = float('inf')  # статистика свежая, без пробных запросов
+        targets.append(target)
+    return ModelRouter(targets, **kwargs)
+
+class TestModelRouter:
+    """Выбор модели по задержке, исключение перегруженных и хеджирование"""
+
+    def test_choose_prefers_fast_and_healthy(self) -> None:
+        router = make_router(0.3, 0.1)
+        assert router.choose().name == 'm1'
+        # Частые ошибки перевешивают меньшую задержку
+        router.targets[1].error_rate = 0.9
+        assert router.choose().name == 'm0'
+        # Цель без замеров получает пробный запрос
+        assert make_router(0.1, None).choose().name == 'm1'
+
+    def test_cooldown_after_rate_limit(self) -> None:
+        router = make_router(0.1, 0.5)
+        router.targets[0].record_failure(UpstreamError("busy", 429, retry_after=30))
+        assert router.choose().name == 'm1'
+        router.targets[1].record_failure(UpstreamError("busy", 503, retry_after=5))
+        # Все на паузе - цель, освобождающаяся раньше
+        assert router.choose().name == 'm1'
+
+    def test_from_env(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('GROQ_MODELS', 'llama@http://a/v1, llama@http://b/v1/, mixtral')
+        router = ModelRouter.from_env('GROQ', 'default', 'http://default/v1')
+        assert [t.name for t in router.targets] == ['llama@http://a/v1', 'llama@http://b/v1', 'mixtral']
+        assert [t.base_url for t in router.targets] == ['http://a/v1', 'http://b/v1', 'http://default/v1']
+        monkeypatch.delenv('GROQ_MODELS')
+        assert ModelRouter.from_env('GROQ', 'default', 'http://default/v1').primary.model == 'default'
+
+    async def test_hedge_returns_first_answer(self) -> None:
+        router = make_router(0.01, 0.01, hedge=True, hedge_min_delay=0.01, hedge_budget=1.0)
+        cancelled = []
+
+        async def send(target: RouteTarget) -> str:
+            if target.name == 'm0':
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(target.name)
+                    raise
+            return target.name
+
+        assert await router.execute(send) == 'm1'
+        assert cancelled == ['m0']
+        assert (router.hedged, router.hedge_wins) == (1, 1)
+        assert router.targets[0].inflight == 0
+
+    async def test_hedge_respects_budget(self) -> None:
+        router = make_router(0.01, hedge=True, hedge_min_delay=0.01, hedge_budget=0.0)
+        calls = []
+
+        async def send(target: RouteTarget) -> str:
+            calls.append(target.name)
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        assert await router.execute(send) == 'ok'
+        assert calls == ['m0'] and router.hedged == 0
+
+    async def test_hedge_skipped_without_budget(self) -> None:
+        router = make_router(0.01, 0.01, hedge=True, hedge_min_delay=0.01, hedge_budget=1.0)
+        calls = []
+
+        async def send(target: RouteTarget) -> str:
+            calls.append(target.name)
+            await asyncio.sleep(0.05)
+            return target.name
+
+        assert await router.execute(send, can_hedge=lambda: False) == 'm0'
+        assert calls == ['m0']
+        assert (router.hedged, router.hedges_skipped) == (0, 1)
+
+    async def test_hedge_failure_raises_primary_error(self) -> None:
+        router = make_router(0.01, 0.01, hedge=True, hedge_min_delay=0.01, hedge_budget=1.0)
+
+        async def send(target: RouteTarget) -> str:
+            await asyncio.sleep(0.05 if target.name == 'm0' else 0)
+            raise UpstreamError(f"{target.name} failed", 500)
+
+        with pytest.raises(UpstreamError, match='m0 failed'):
+            await router.execute(send)
+        assert all(t.errors == 1 for t in router.targets)
+
+    async def test_groq_fails_over_to_next_model(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('GROQ_MODELS', 'busy@http://busy/v1,spare@http://spare/v1')
+        monkeypatch.setenv('GROQ_RETRY_BASE_DELAY', '0')
+        api = GroqAPI('test-key')
+        try:
+            with aioresponses() as mock:
+                mock.post('http://busy/v1/chat/completions', status=429, headers={'Retry-After': '0'})
+                mock.post('http://spare/v1/chat/completions', payload={'choices': [{'message': {'content': 'ok'}}]})
+                result = await api.complete('hi')
+                requests = {str(url): calls[0].kwargs['json']['model'] for (_, url), calls in mock.requests.items()}
+        finally:
+            await api.close()
+        assert result['content'] == 'ok' and result['attempts'] == 2
+        assert requests == {'http://busy/v1/chat/completions': 'busy', 'http://spare/v1/chat/completions': 'spare'}
+        assert api.router.stats()['targets']['busy']['errors'] == 1
+
+    async def test_groq_stream_reports_to_router(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('GROQ_MODELS', 'busy@http://busy/v1,spare@http://spare/v1')
+        monkeypatch.setenv('GROQ_RETRY_BASE_DELAY', '0')
+        body = 'data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n'
+        api = GroqAPI('test-key')
+        api.router.targets[1].error_rate = 0.5
+        try:
+            with aioresponses() as mock:
+                mock.post('http://busy/v1/chat/completions', status=503, headers={'Retry-After': '0'})
+                mock.post('http://spare/v1/chat/completions', body=body, content_type='text/event-stream')
+                tokens = [t async for t in api.stream_response('hi')]
+        finally:
+            await api.close()
+        assert tokens == ['hi']
+        busy, spare = api.router.targets
+        assert busy.errors == 1 and busy.inflight == 0
+        assert spare.requests == 1 and spare.inflight == 0
+        assert len(spare.first_token) == 1 and spare.error_rate < 0.5
+        # Время до первого токена не смешивается с задержкой полных ответов
+        assert not spare.latencies
+        assert api.router.stats()['targets']['spare']['first_token_p50_ms'] is not None
+
+    def test_cache_key_covers_model_pool(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        messages = [{'role': 'user', 'content': 'hi'}]
+        monkeypatch.setenv('GROQ_MODELS', 'a,b')
+        pooled = GroqAPI('test-key').cache_key(messages)
+        monkeypatch.setenv('GROQ_MODELS', 'a')
+        assert GroqAPI('test-key').cache_key(messages) != pooled
+
+    async def test_groq_hedge_takes_its_own_rate_ticket(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('GROQ_MODELS', 'slow@http://slow/v1,fast@http://fast/v1')
+        monkeypatch.setenv('GROQ_HEDGE', '1')
+        monkeypatch.setenv('GROQ_HEDGE_MIN_DELAY', '0.01')
+        monkeypatch.setenv('GROQ_HEDGE_BUDGET', '1')
+        api = GroqAPI('test-key')
+        for target in api.router.targets:
+            target.latencies.extend([0.01] * 20)
+            target.last_used = float('inf')
+        tickets = []
+        acquire = api.governor.acquire
+
+        async def counting_acquire(tokens: int = 0):
+            ticket = await acquire(tokens)
+            tickets.append(ticket)
+            return ticket
+
+        monkeypatch.setattr(api.governor, 'acquire', counting_acquire)
+
+        async def slow(url, **kwargs):
+            await asyncio.sleep(0.5)
+
+        payload = {'choices': [{'message': {'content': 'ok'}}]}
+        try:
+            with aioresponses() as mock:
+                mock.post('http://slow/v1/chat/completions', callback=slow, payload=payload)
+                mock.post('http://fast/v1/chat/completions', payload=payload)
+                result = await api.complete('hi', use_cache=False)
+        finally:
+            await api.close()
+        assert result['content'] == 'ok'
+        assert api.router.hedged == 1
+        assert len(tickets) == 2 and all(t.done for t in tickets)
+        budget = api.governor.budgets[0]
+        assert budget.requests.reserved == 0 and budget.tokens.reserved == 0
@@ -2,6 +2,8 @@ import os
 import pytest
 import logging
 import json
+import asyncio
+from aioresponses import aioresponses
 from src.service.neoapi.main import NeoAPI
 
 logger = logging.getLogger(__name__)
@@ -27,6 +29,95 @@ class TestNeoAPI:
         with pytest.raises(ValueError):
             NeoAPI("")
 
+    @pytest.mark.asyncio
+    async def test_analyze_text_shared_session(self, neo_api_key: str) -> None:
+        """Повторные вызовы используют одну сессию с пулом соединений"""
+        api = NeoAPI(neo_api_key)
+        await api.start()
+        session = api.session
+        try:
+            with aioresponses() as mock:
+                mock.post(NeoAPI.API_URL, payload={
+                    "is_ai_generated": True,
+                    "human_likeness_score": 32.0,
+                    "metrics": {"readability_metrics": {}}
+                }, repeat=True)
+                first = await api.analyze_text("first text")
+                second = await api.analyze_text("second text")
+            assert api.session is session
+        finally:
+            await api.close()
+
+        assert first["status"] == "success"
+        assert second["human_likeness_score"] == 32.0
+        assert api.session is None
+
+    @pytest.mark.asyncio
+    async def test_analyze_text_cached(self, neo_api_key: str) -> None:
+        """Повторный анализ того же текста не обращается к API"""
+        api = NeoAPI(neo_api_key)
+        try:
+            with aioresponses() as mock:
+                mock.post(NeoAPI.API_URL, payload={
+                    "is_ai_generated": False,
+                    "human_likeness_score": 80.0,
+                    "metrics": {}
+                })
+                first = await api.analyze_text("same text")
+                # Второй ответ не замокан: запрос к API привел бы к ошибке
+                second = await api.analyze_text("same text")
+        finally:
+            await api.close()
+
+        assert first == second
+        assert second["status"] == "success"
+        assert api.cache.stats()["local"]["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_analyze_text_coalesced(self, neo_api_key: str) -> None:
+        """Одновременный анализ одного текста - один запрос к API"""
+        api = NeoAPI(neo_api_key)
+        api.cache.local.max_size = 0  # проверяем именно объединение, без кэша
+        try:
+            with aioresponses() as mock:
+                mock.post(NeoAPI.API_URL, payload={
+                    "is_ai_generated": True,
+                    "human_likeness_score": 10.0,
+                    "metrics": {}
+                })
+                results = await asyncio.gather(*(api.analyze_text("burst") for _ in range(3)))
+                assert sum(len(c) for c in mock.requests.values()) == 1
+        finally:
+            await api.close()
+
+        assert all(r["status"] == "success" for r in results)
+        assert api.stats()["coalescing"]["coalesced"] == 2
+
+    @pytest.mark.asyncio
+    async def test_analyze_text_retries_and_opens_circuit(self, neo_api_key: str, monkeypatch) -> None:
+        """503 повторяется; после серии сбоев запросы отклоняются без обращения к API"""
+        monkeypatch.setenv('NEO_RETRY_BASE_DELAY', '0')
+        monkeypatch.setenv('NEO_CIRCUIT_THRESHOLD', '2')
+        api = NeoAPI(neo_api_key)
+        try:
+            with aioresponses() as mock:
+                mock.post(NeoAPI.API_URL, status=503)
+                mock.post(NeoAPI.API_URL, payload={"human_likeness_score": 55.0})
+                recovered = await api.analyze_text("flaky")
+
+                mock.post(NeoAPI.API_URL, status=503, repeat=True)
+                failed = await api.analyze_text("down")
+                calls = sum(len(c) for c in mock.requests.values())
+                rejected = await api.analyze_text("still down")
+                assert sum(len(c) for c in mock.requests.values()) == calls
+        finally:
+            await api.close()
+
+        assert recovered["human_likeness_score"] == 55.0
+        assert failed["status"] == "error"
+        assert rejected["error"] == "Neo API analysis failed"
+        assert api.breaker.stats()["state"] == "open"
+
     @pytest.mark.integration
     @pytest.mark.asyncio
     async def test_analyze_text_integration(self, neo_api_key: str) -> None:
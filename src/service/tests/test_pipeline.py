@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from src.service.core.pipeline import AnalysisPipeline
+from src.service.core.tracing import current_trace, end_trace, span, start_trace
+
+class TestAnalysisPipeline:
+    """Тесты фонового конвейера анализа"""
+
+    async def test_results_delivered_by_message_id(self) -> None:
+        """Результат анализа передается с исходным message_id"""
+        results = {}
+
+        async def analyze(text):
+            return {"length": len(text)}
+
+        async def on_result(message_id, metrics):
+            results[message_id] = metrics
+
+        pipeline = AnalysisPipeline(analyze, on_result, workers=2, queue_size=10)
+        try:
+            assert await pipeline.submit("a", "abc")
+            assert await pipeline.submit("b", "abcdef")
+            await pipeline.join()
+        finally:
+            await pipeline.stop()
+
+        assert results == {"a": {"length": 3}, "b": {"length": 6}}
+        assert pipeline.stats()["processed"] == 2
+
+    async def test_drop_when_queue_full(self) -> None:
+        """При заполненной очереди задачи отбрасываются и считаются"""
+        release = asyncio.Event()
+
+        async def analyze(text):
+            await release.wait()
+            return {}
+
+        async def on_result(message_id, metrics):
+            pass
+
+        pipeline = AnalysisPipeline(analyze, on_result, workers=1, queue_size=1)
+        try:
+            await pipeline.submit("1", "x")
+            await asyncio.sleep(0)  # воркер забирает первую задачу
+            assert await pipeline.submit("2", "x")
+            assert not await pipeline.submit("3", "x")
+
+            stats = pipeline.stats()
+            assert stats["dropped"] == 1
+            assert stats["queue_depth"] == 1
+
+            release.set()
+            await pipeline.join()
+        finally:
+            await pipeline.stop()
+
+    async def test_failed_analysis_counted(self) -> None:
+        """Ошибка анализа не останавливает воркер"""
+        async def analyze(text):
+            raise RuntimeError("boom")
+
+        async def on_result(message_id, metrics):
+            pass
+
+        pipeline = AnalysisPipeline(analyze, on_result, workers=1)
+        try:
+            await pipeline.submit("1", "x")
+            await pipeline.join()
+        finally:
+            await pipeline.stop()
+
+        assert pipeline.stats()["failed"] == 1
+
+    async def test_jobs_do_not_grow_startup_trace(self) -> None:
+        """Воркеры, запущенные внутри трассы запуска, не копят в ней спаны задач"""
+        traces = set()
+
+        async def analyze(text):
+            with span('neo'):
+                traces.add(current_trace().trace_id)
+            return {}
+
+        async def on_result(message_id, metrics):
+            with span('broadcast'):
+                pass
+
+        startup = start_trace('startup')
+        pipeline = AnalysisPipeline(analyze, on_result, workers=2, queue_size=100)
+        await pipeline.start()
+        before = len(startup.spans)
+        try:
+            for i in range(50):
+                await pipeline.submit(str(i), "text")
+            await pipeline.join()
+        finally:
+            await pipeline.stop()
+            end_trace()
+
+        assert pipeline.stats()["processed"] == 50
+        assert len(startup.spans) == before
+        assert len(traces) == 50 and startup.trace_id not in traces
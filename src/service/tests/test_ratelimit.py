@@ -0,0 +1,114 @@
+import time
+import pytest
+from aioresponses import aioresponses
+from src.service.core.ratelimit import RateLimitGovernor, parse_duration
+from src.service.core.resilience import RateLimited, RetryPolicy, call_with_retries
+from src.service.grog.main import GroqAPI
+
+GROQ_URL = 'https://api.groq.com/openai/v1/chat/completions'
+
+def limit_headers(remaining_requests: int, remaining_tokens: int, reset: str = '10s') -> dict:
+    return {
+        'x-ratelimit-limit-requests': '100',
+        'x-ratelimit-remaining-requests': str(remaining_requests),
+        'x-ratelimit-reset-requests': reset,
+        'x-ratelimit-limit-tokens': '10000',
+        'x-ratelimit-remaining-tokens': str(remaining_tokens),
+        'x-ratelimit-reset-tokens': reset,
+    }
+
+class TestRateLimitGovernor:
+    """Темп вызовов по заголовкам x-ratelimit-* и выбор ключа"""
+
+    def test_parse_duration(self) -> None:
+        assert parse_duration('2m59.56s') == pytest.approx(179.56)
+        assert parse_duration('7.66s') == pytest.approx(7.66)
+        assert parse_duration('120ms') == pytest.approx(0.12)
+        assert parse_duration('1h2m') == 3720
+        assert parse_duration('3') == 3
+        assert parse_duration('soon') is None and parse_duration(None) is None
+
+    async def test_unlimited_until_headers_seen(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=0)
+        ticket = await governor.acquire(500)
+        assert ticket.key == 'k1' and governor.retry_after() == 0
+        governor.release(ticket)
+        governor.release(ticket)  # повторное освобождение не меняет резерв
+        assert governor.budgets[0].tokens.reserved == 0
+
+    async def test_rejects_when_budget_exhausted(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=0.5, pace_below=0)
+        governor.update(await governor.acquire(10), limit_headers(5, 50, reset='30s'))
+        # Токенов меньше, чем нужно, до сброса окна - дальше max_wait
+        with pytest.raises(RateLimited) as info:
+            await governor.acquire(100)
+        assert 29 < info.value.retry_after <= 30
+        assert governor.stats()['rejected'] == 1
+        # Небольшой запрос укладывается в остаток
+        assert (await governor.acquire(10)).key == 'k1'
+
+    async def test_reservations_count_against_budget(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=0, pace_below=0)
+        governor.update(await governor.acquire(1), limit_headers(2, 10000))
+        first = await governor.acquire(1)
+        await governor.acquire(1)
+        # Оба оставшихся запроса в работе - третий не отправляется
+        with pytest.raises(RateLimited):
+            await governor.acquire(1)
+        governor.release(first)
+        assert (await governor.acquire(1)).key == 'k1'
+
+    async def test_waits_for_short_reset(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=1.0)
+        governor.update(await governor.acquire(1), limit_headers(0, 10000, reset='50ms'))
+        started = time.monotonic()
+        await governor.acquire(1)
+        assert time.monotonic() - started >= 0.04
+        assert governor.stats()['waited'] >= 1
+
+    async def test_paces_near_limit(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=5, pace_below=0.5)
+        # 4 запроса из 100 на 0.2 с - интервал около 0.05 с между вызовами
+        governor.update(await governor.acquire(1), limit_headers(4, 10000, reset='200ms'))
+        await governor.acquire(1)
+        assert governor.retry_after(1) > 0.02
+
+    async def test_spreads_across_keys(self) -> None:
+        governor = RateLimitGovernor(['k1', 'k2', 'k1'], max_wait=0)
+        assert [b.key for b in governor.budgets] == ['k1', 'k2']
+        governor.update(await governor.acquire(1), limit_headers(0, 10000, reset='60s'))
+        assert (await governor.acquire(1)).key == 'k2'
+
+    async def test_429_exhausts_key(self) -> None:
+        governor = RateLimitGovernor(['k1'], max_wait=0)
+        governor.update(await governor.acquire(1), {}, status=429, retry_after=20)
+        assert 19 < governor.retry_after() <= 20
+
+    async def test_rate_limited_not_retried(self) -> None:
+        calls = []
+
+        async def operation():
+            calls.append(1)
+            raise RateLimited('groq', 10)
+
+        with pytest.raises(RateLimited):
+            await call_with_retries(operation, RetryPolicy(base_delay=0), upstream='groq')
+        assert len(calls) == 1
+
+    async def test_groq_reads_headers_and_rotates_keys(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('GROQ_API_KEYS', 'second-key')
+        monkeypatch.setenv('GROQ_RATE_MAX_WAIT', '0')
+        api = GroqAPI('first-key')
+        try:
+            with aioresponses() as mock:
+                payload = {'choices': [{'message': {'content': 'ok'}}]}
+                mock.post(GROQ_URL, payload=payload, headers=limit_headers(0, 9000, reset='1m'))
+                mock.post(GROQ_URL, payload=payload, headers=limit_headers(50, 9000))
+                await api.complete('first', use_cache=False)
+                await api.complete('second', use_cache=False)
+                keys = [call.kwargs['headers']['Authorization'] for call in next(iter(mock.requests.values()))]
+        finally:
+            await api.close()
+        assert keys == ['Bearer first-key', 'Bearer second-key']
+        stats = api.governor.stats()['keys']
+        assert [row['requests']['remaining'] for row in stats.values()] == [0, 50]
@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from src.service.core.resilience import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy, UpstreamError, call_with_retries, parse_retry_after
+)
+
+def failing(errors: list):
+    """Операция, бросающая ошибки из списка по очереди, затем возвращающая ok"""
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return operation, calls
+
+class TestRetries:
+    """Тесты повторов с паузами и дедлайнами"""
+
+    def test_parse_retry_after(self) -> None:
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after("soon") is None
+
+    def test_backoff_is_capped(self) -> None:
+        policy = RetryPolicy(base_delay=1, max_delay=4, multiplier=2)
+        assert all(0 <= policy.backoff(10) <= 4 for _ in range(100))
+
+    async def test_honours_retry_after(self, monkeypatch) -> None:
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+
+        monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+        operation, calls = failing([UpstreamError("rate limited", 429, retry_after=2.5)])
+        result, attempts = await call_with_retries(operation, RetryPolicy(base_delay=0.01), upstream='test')
+
+        assert (result, attempts) == ("ok", 2)
+        assert delays == [2.5]
+
+    async def test_non_retryable_raises_immediately(self) -> None:
+        operation, calls = failing([UpstreamError("bad key", 401)])
+        with pytest.raises(UpstreamError):
+            await call_with_retries(operation, RetryPolicy(base_delay=0), upstream='test')
+        assert len(calls) == 1
+
+    async def test_gives_up_when_retry_exceeds_deadline(self) -> None:
+        operation, calls = failing([UpstreamError("busy", 503, retry_after=10)])
+        with pytest.raises(UpstreamError):
+            await call_with_retries(operation, RetryPolicy(total_timeout=1), upstream='test')
+        assert len(calls) == 1
+
+    async def test_attempt_timeout(self) -> None:
+        calls = []
+
+        async def hanging():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return "ok"
+
+        policy = RetryPolicy(base_delay=0, attempt_timeout=0.05, total_timeout=2)
+        assert await call_with_retries(hanging, policy, upstream='test') == ("ok", 2)
+
+class TestCircuitBreaker:
+    """Тесты предохранителя"""
+
+    async def test_opens_and_fails_fast(self) -> None:
+        breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=60)
+        operation, calls = failing([UpstreamError("down", 503)] * 5)
+        with pytest.raises(UpstreamError):
+            await call_with_retries(operation, RetryPolicy(max_attempts=2, base_delay=0), breaker, upstream='test')
+
+        assert breaker.stats()["state"] == "open"
+        with pytest.raises(CircuitOpenError):
+            await call_with_retries(operation, RetryPolicy(base_delay=0), breaker, upstream='test')
+        assert len(calls) == 2
+        assert breaker.stats()["rejected"] == 1
+
+    async def test_half_open_probe_closes(self) -> None:
+        breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        operation, calls = failing([])
+        assert await call_with_retries(operation, RetryPolicy(), breaker, upstream='test') == ("ok", 1)
+        assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "trips": 1, "rejected": 0}
+
+    async def test_rate_limit_does_not_trip(self) -> None:
+        breaker = CircuitBreaker('test', failure_threshold=1)
+        operation, calls = failing([UpstreamError("slow down", 429, retry_after=0)])
+        await call_with_retries(operation, RetryPolicy(base_delay=0), breaker, upstream='test')
+        assert breaker.state == "closed"
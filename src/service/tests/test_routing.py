@@ -0,0 +1,29 @@
+from src.service.core.routing import SubscriptionIndex
+
+class TestSubscriptionIndex:
+    """Тесты индекса подписок WebSocket"""
+
+    def test_targets_by_session_and_message(self) -> None:
+        index = SubscriptionIndex()
+        index.subscribe("ws1", session_id="s1")
+        index.subscribe("ws2", message_ids=["m1"])
+
+        assert index.targets("m1", "s1") == {"ws1", "ws2"}
+        assert index.targets("m2", "s2") == set()
+
+    def test_remove_cleans_index(self) -> None:
+        index = SubscriptionIndex()
+        index.subscribe("ws1", session_id="s1", message_ids=["m1"])
+        index.remove("ws1")
+
+        assert index.targets("m1", "s1") == set()
+        assert index.stats() == {"sessions": 0, "message_ids": 0}
+
+    def test_message_subscriptions_bounded(self) -> None:
+        """Старые подписки на message_id вытесняются новыми"""
+        index = SubscriptionIndex(max_message_ids=2)
+        index.subscribe("ws1", message_ids=["m1", "m2", "m3"])
+
+        assert index.targets("m1") == set()
+        assert index.targets("m3") == {"ws1"}
+        assert index.stats()["message_ids"] == 2
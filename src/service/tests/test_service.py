@@ -1,3 +1,6 @@
+import json
+import time
+import asyncio
 import pytest
 from aiohttp import web
 from typing import AsyncGenerator, Any
@@ -9,19 +12,42 @@ service_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(service_dir))
 
 # Теперь импортируем из пакета service
-from service.main import ServiceHandler, health_check
+from service.main import ServiceHandler, health_check, metrics_endpoint, metrics_middleware
 
 @pytest.fixture
-async def app() -> web.Application:
+def handler() -> ServiceHandler:
+    """Фикстура обработчика сервиса"""
+    return ServiceHandler()
+
+@pytest.fixture
+async def app(handler: ServiceHandler) -> web.Application:
     """Фикстура для создания тестового приложения"""
-    app = web.Application()
-    handler = ServiceHandler()
+    app = web.Application(middlewares=[metrics_middleware])
 
     app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_endpoint)
     app.router.add_post('/chat', handler.handle_chat)
+    app.router.add_post('/chat/stream', handler.handle_chat_stream)
 
     return app
 
+class FakeWebSocket:
+    """Заглушка WebSocket-клиента, запоминающая отправленные сообщения"""
+
+    def __init__(self) -> None:
+        self.sent: list = []
+
+    async def send(self, message: str) -> None:
+        self.sent.append(json.loads(message))
+
+def parse_sse(body: str) -> list:
+    """Разбирает тело ответа Server-Sent Events в список (event, data)"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
 @pytest.fixture
 async def client(aiohttp_client: Any, app: web.Application) -> AsyncGenerator:
     """Фикстура для создания тестового клиента"""
@@ -37,6 +63,19 @@ class TestServiceUnit:
         data = await resp.json()
         assert data['status'] == 'ok'
 
+    async def test_metrics_endpoint(self, client: Any, handler: ServiceHandler) -> None:
+        """Проверка что /metrics отдает метрики в формате Prometheus"""
+        handler.ws_connections.add(FakeWebSocket())
+        await client.post('/chat', json={'message': ''})
+
+        resp = await client.get('/metrics')
+        assert resp.status == 200
+        assert resp.headers['Content-Type'].startswith('text/plain')
+        text = await resp.text()
+        assert 'neonchat_websocket_connections 1' in text
+        assert 'neonchat_http_request_duration_seconds_count{route="/chat",method="POST",status="400"}' in text
+        assert '# TYPE neonchat_upstream_request_duration_seconds histogram' in text
+
     async def test_chat_validation(self, client: Any) -> None:
         """Проверка базовой валидации входных данных"""
         # Пустое сообщение
@@ -47,5 +86,223 @@ class TestServiceUnit:
         resp = await client.post('/chat', json={'wrong_field': 'test'})
         assert resp.status == 400
 
+    async def test_chat_stream(self, client: Any, handler: ServiceHandler) -> None:
+        """Проверка что /chat/stream отдает токены по мере генерации"""
+        async def fake_stream(message, context=None):
+            for token in ["Hello", ", ", "world"]:
+                yield token
+
+        async def fake_analyze(text):
+            return {"status": "success", "human_likeness_score": 50}
+
+        handler.groq_api.stream_response = fake_stream
+        handler.neo_api.analyze_text = fake_analyze
+        ws = FakeWebSocket()
+        handler.ws_connections.add(ws)
+        handler.subscriptions.subscribe(ws, session_id='s1')
+
+        resp = await client.post('/chat/stream', json={'message': 'hi', 'ws_tokens': True, 'session_id': 's1'})
+        assert resp.status == 200
+        assert resp.headers['Content-Type'].startswith('text/event-stream')
+
+        events = parse_sse(await resp.text())
+        assert [e for e, _ in events] == ['start', 'token', 'token', 'token', 'done']
+        message_id = events[0][1]['id']
+        assert events[-1][1]['message'] == "Hello, world"
+        assert events[-1][1]['metrics']['human_likeness_score'] == 50
+
+        await handler.broadcaster.flush()
+        tokens = [m['token'] for m in ws.sent if m['type'] == 'token']
+        assert tokens == ["Hello", ", ", "world"]
+        assert ws.sent[-1]['type'] == 'metrics'
+        assert ws.sent[-1]['message_id'] == message_id
+
+    async def test_chat_background_analysis(self, client: Any, handler: ServiceHandler) -> None:
+        """В режиме background ответ возвращается до завершения анализа"""
+        async def fake_complete(message, context=None, use_cache=True):
+            return {"content": "AI answer", "cached": False}
+
+        analysis_started = []
+
+        async def fake_analyze(text):
+            analysis_started.append(text)
+            return {"status": "success", "human_likeness_score": 42}
+
+        handler.analysis_mode = 'background'
+        handler.groq_api.complete = fake_complete
+        handler.neo_api.analyze_text = fake_analyze
+        ws = FakeWebSocket()
+        handler.ws_connections.add(ws)
+        handler.subscriptions.subscribe(ws, session_id='s1')
+
+        try:
+            resp = await client.post('/chat', json={'message': 'hi', 'session_id': 's1'})
+            assert resp.status == 200
+            data = await resp.json()
+            assert data['metrics'] == {"status": "pending"}
+            assert data['cached'] is False
+
+            await handler.analysis_pipeline.join()
+            await handler.broadcaster.flush()
+        finally:
+            await handler.analysis_pipeline.stop()
+
+        assert analysis_started == ["AI answer"]
+        assert ws.sent[-1]['type'] == 'metrics'
+        assert ws.sent[-1]['message_id'] == data['id']
+        assert ws.sent[-1]['data']['human_likeness_score'] == 42
+        assert handler.stats()['analysis']['processed'] == 1
+
+    async def test_metrics_routed_to_subscribers(self, handler: ServiceHandler) -> None:
+        """Метрики получают только подписанные клиенты"""
+        alice, bob, idle = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        handler.ws_connections.update({alice, bob, idle})
+
+        handler.handle_ws_message(alice, json.dumps({"type": "subscribe", "session_id": "alice"}))
+        handler.handle_ws_message(bob, json.dumps({"type": "subscribe", "message_ids": ["m2"]}))
+
+        await handler.broadcast_metrics("m1", {"score": 1}, session_id="alice")
+        await handler.broadcast_metrics("m2", {"score": 2}, session_id="carol")
+        await handler.broadcaster.flush()
+
+        assert [m['type'] for m in alice.sent] == ['subscribed', 'metrics']
+        assert alice.sent[-1]['message_id'] == "m1"
+        assert [m['type'] for m in bob.sent] == ['subscribed', 'metrics']
+        assert bob.sent[-1]['message_id'] == "m2"
+        assert idle.sent == []
+
+        # Глобальная рассылка - только явно
+        await handler.broadcast_metrics("m3", {"score": 3}, broadcast_all=True)
+        await handler.broadcaster.flush()
+        assert all(ws.sent[-1]['message_id'] == "m3" for ws in (alice, bob, idle))
+        await handler.broadcaster.close()
+
+    async def test_ws_unsubscribe_and_errors(self, handler: ServiceHandler) -> None:
+        """Отписка и ответ на некорректное сообщение"""
+        ws = FakeWebSocket()
+        handler.ws_connections.add(ws)
+
+        handler.handle_ws_message(ws, json.dumps({"type": "subscribe", "session_id": "s"}))
+        handler.handle_ws_message(ws, json.dumps({"type": "unsubscribe", "session_id": "s"}))
+        handler.handle_ws_message(ws, "not json")
+        await handler.broadcast_metrics("m1", {}, session_id="s")
+        await handler.broadcaster.flush()
+        await handler.broadcaster.close()
+
+        assert [m['type'] for m in ws.sent] == ['subscribed', 'unsubscribed', 'error']
+
+    async def test_chat_server_side_session(self, client: Any, handler: ServiceHandler) -> None:
+        """Клиент присылает только session_id, история собирается на сервере"""
+        prompts = []
+
+        async def fake_complete(message, context=None, use_cache=True):
+            prompts.append(context)
+            return {"content": f"reply to {message}", "cached": False}
+
+        async def fake_analyze(text):
+            return {"status": "success"}
+
+        handler.groq_api.complete = fake_complete
+        handler.neo_api.analyze_text = fake_analyze
+
+        await client.post('/chat', json={'message': 'first', 'session_id': 'conv'})
+        resp = await client.post('/chat', json={'message': 'second', 'session_id': 'conv'})
+        data = await resp.json()
+
+        assert prompts[1] == [
+            {'role': 'user', 'content': 'first'},
+            {'role': 'assistant', 'content': 'reply to first'},
+            {'role': 'user', 'content': 'second'}
+        ]
+        assert data['prompt']['messages'] == 3
+        assert data['prompt']['tokens'] > 0
+
+    async def test_chat_context_appends_message(self, client: Any, handler: ServiceHandler) -> None:
+        """Новое сообщение добавляется к присланному context"""
+        prompts = []
+
+        async def fake_complete(message, context=None, use_cache=True):
+            prompts.append(context)
+            return {"content": "ok", "cached": False}
+
+        async def fake_analyze(text):
+            return {"status": "success"}
+
+        handler.groq_api.complete = fake_complete
+        handler.neo_api.analyze_text = fake_analyze
+
+        context = [{'role': 'system', 'content': 'sys'}, {'role': 'user', 'content': 'old'}]
+        await client.post('/chat', json={'message': 'new', 'context': context})
+
+        assert prompts[0][0] == {'role': 'system', 'content': 'sys'}
+        assert prompts[0][-1] == {'role': 'user', 'content': 'new'}
+
+    async def test_chat_server_timing(self, client: Any, handler: ServiceHandler) -> None:
+        """Заголовок Server-Timing и поле timings по запросу"""
+        async def fake_complete(message, context=None, use_cache=True):
+            return {"content": "ok", "cached": False, "attempts": 2}
+
+        async def fake_analyze(text):
+            return {"status": "success"}
+
+        handler.groq_api.complete = fake_complete
+        handler.neo_api.analyze_text = fake_analyze
+
+        resp = await client.post('/chat', json={'message': 'hi'})
+        assert resp.status == 200
+        header = resp.headers['Server-Timing']
+        assert 'parse;dur=' in header
+        assert 'groq;dur=' in header and 'attempts=2' in header
+        assert 'timings' not in await resp.json()
+
+        resp = await client.post('/chat?timings=1', json={'message': 'hi'})
+        data = await resp.json()
+        assert data['timings']['groq']['attempts'] == 2
+        assert data['timings']['parse']['dur'] >= 0
+
+    async def test_chat_sheds_load(self, client: Any, handler: ServiceHandler) -> None:
+        """При заполненной очереди Groq /chat сразу отвечает 503 с Retry-After"""
+        release = asyncio.Event()
+
+        async def slow_complete(message, context=None, use_cache=True):
+            await release.wait()
+            return {"content": "ok", "cached": False}
+
+        async def fake_analyze(text):
+            return {"status": "success"}
+
+        handler.groq_api.complete = slow_complete
+        handler.neo_api.analyze_text = fake_analyze
+        handler.admission['groq'].limit = 1
+        handler.admission['groq'].classes['web'].max_queue = 0
+
+        first = asyncio.create_task(client.post('/chat', json={'message': 'slow'}))
+        while handler.admission['groq'].active == 0:
+            await asyncio.sleep(0.01)
+        resp = await client.post('/chat', json={'message': 'shed'})
+        assert resp.status == 503
+        assert int(resp.headers['Retry-After']) >= 1
+
+        release.set()
+        assert (await first).status == 200
+
+    async def test_chat_rate_limited(self, client: Any, handler: ServiceHandler) -> None:
+        """Исчерпанный бюджет лимитов Groq: /chat и /chat/stream отвечают 429 с Retry-After"""
+        budget = handler.groq_api.governor.budgets[0]
+        budget.requests.update(limit=30, remaining=0, reset=60, now=time.monotonic())
+
+        resp = await client.post('/chat', json={'message': 'hi'})
+        assert resp.status == 429
+        assert int(resp.headers['Retry-After']) >= 59
+
+        resp = await client.post('/chat/stream', json={'message': 'hi'})
+        assert resp.status == 429
+        assert handler.stats()['groq_rate_limits']['rejected'] >= 1
+
+    async def test_chat_stream_validation(self, client: Any) -> None:
+        """Проверка валидации входных данных для стриминга"""
+        resp = await client.post('/chat/stream', json={'message': ''})
+        assert resp.status == 400
+
 if __name__ == '__main__':
     pytest.main(['-v', __file__])
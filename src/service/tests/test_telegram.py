@@ -1,7 +1,10 @@
+import json
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from aiohttp import web
-from telegram.main import Neon_Nexus_AI_bot_webhook
+from aioresponses import aioresponses
+from src.service.telegram.main import Neon_Nexus_AI_bot_webhook
 
 @pytest.fixture
 def telegram_webhook():
@@ -11,43 +14,192 @@ def telegram_webhook():
         service_url="https://test.com"
     )
 
-@pytest.mark.asyncio
-async def test_webhook_handler_success(telegram_webhook):
-    telegram_webhook.process_message = MagicMock(return_value="Test response")
-    telegram_webhook.send_telegram_message = MagicMock(return_value=True)
-    
+def make_update(update_id: int, chat_id: int, text: str) -> MagicMock:
+    """Запрос вебхука с апдейтом Telegram"""
     mock_request = MagicMock()
-    mock_request.json = MagicMock(return_value={
-        "update_id": 123,
+    mock_request.read = AsyncMock(return_value=json.dumps({
+        "update_id": update_id,
         "message": {
-            "message_id": 456,
-            "text": "test message",
-            "chat": {"id": 789}
+            "message_id": update_id * 10,
+            "text": text,
+            "chat": {"id": chat_id}
         }
-    })
+    }).encode('utf-8'))
+    return mock_request
+
+@pytest.mark.asyncio
+async def test_webhook_handler_success(telegram_webhook):
+    telegram_webhook.process_message = AsyncMock(return_value="Test response")
+    telegram_webhook.send_telegram_message = AsyncMock(return_value=True)
     
-    response = await telegram_webhook.handle_webhook(mock_request)
+    response = await telegram_webhook.handle_webhook(make_update(123, 789, "test message"))
     assert response.status == 200
     
+    await telegram_webhook.updates.join()
     telegram_webhook.process_message.assert_called_once_with("test message")
     telegram_webhook.send_telegram_message.assert_called_once_with(789, "Test response")
 
+@pytest.mark.asyncio
+async def test_webhook_acks_before_processing(telegram_webhook):
+    """Вебхук отвечает 200 до завершения обработки"""
+    release = asyncio.Event()
+
+    async def slow_process(text):
+        await release.wait()
+        return "late"
+
+    telegram_webhook.process_message = slow_process
+    telegram_webhook.send_telegram_message = AsyncMock(return_value=True)
+
+    response = await asyncio.wait_for(
+        telegram_webhook.handle_webhook(make_update(1, 789, "slow")), timeout=0.5
+    )
+    assert response.status == 200
+    telegram_webhook.send_telegram_message.assert_not_called()
+
+    release.set()
+    await telegram_webhook.updates.join()
+    telegram_webhook.send_telegram_message.assert_called_once_with(789, "late")
+
+@pytest.mark.asyncio
+async def test_webhook_dedupe_and_chat_ordering(telegram_webhook):
+    """Повторы update_id отбрасываются, порядок внутри чата сохраняется"""
+    processed = []
+
+    async def process(text):
+        await asyncio.sleep(0.01 if text == "a1" else 0)
+        processed.append(text)
+        return text
+
+    telegram_webhook.process_message = process
+    telegram_webhook.send_telegram_message = AsyncMock(return_value=True)
+
+    for update_id, chat_id, text in [(1, 1, "a1"), (2, 1, "a2"), (1, 1, "a1"), (3, 2, "b1")]:
+        response = await telegram_webhook.handle_webhook(make_update(update_id, chat_id, text))
+        assert response.status == 200
+    await telegram_webhook.updates.join()
+
+    assert processed.index("a1") < processed.index("a2")
+    assert sorted(processed) == ["a1", "a2", "b1"]
+    assert telegram_webhook.stats()["duplicates"] == 1
+
 @pytest.mark.asyncio
 async def test_webhook_handler_error(telegram_webhook):
     mock_request = MagicMock()
-    mock_request.json = MagicMock(side_effect=Exception("Invalid JSON"))
+    mock_request.read = AsyncMock(return_value=b"{not json")
     
     response = await telegram_webhook.handle_webhook(mock_request)
     assert response.status == 500
 
-def test_check_and_setup_webhook(telegram_webhook):
-    with patch('requests.get') as mock_get, \
-         patch('requests.post') as mock_post:
-        
-        mock_get.return_value.json.return_value = {
-            'result': {'url': ''}
-        }
-        mock_post.return_value.status_code = 200
-        
-        telegram_webhook.check_and_setup_webhook()
-        mock_post.assert_called_once()
+@pytest.mark.asyncio
+async def test_check_and_setup_webhook(telegram_webhook, tmp_path):
+    telegram_webhook.state_file = str(tmp_path / "webhook.json")
+    with aioresponses() as mock:
+        mock.get(telegram_webhook.api_url('getWebhookInfo'), payload={'result': {'url': ''}})
+        mock.post(telegram_webhook.api_url('setWebhook'), payload={'ok': True})
+        assert await telegram_webhook.check_and_setup_webhook() == 'set'
+
+        # Подтвержденное состояние сохранено: повторный запуск не обращается к Telegram
+        assert await telegram_webhook.check_and_setup_webhook() == 'cached'
+        assert sum(len(c) for c in mock.requests.values()) == 2
+    await telegram_webhook.close()
+
+@pytest.mark.asyncio
+async def test_webhook_setup_in_background(telegram_webhook, tmp_path):
+    """Запуск не ждет Telegram; зависший API ограничен таймаутом"""
+    telegram_webhook.state_file = str(tmp_path / "webhook.json")
+    release = asyncio.Event()
+
+    async def hanging_setup():
+        await release.wait()
+        return 'set'
+
+    telegram_webhook.check_and_setup_webhook = hanging_setup
+    with patch.dict('os.environ', {'TELEGRAM_SETUP_TIMEOUT': '0.05'}):
+        telegram_webhook.schedule_webhook_setup()
+    assert telegram_webhook.stats()['webhook'] == {"status": "pending"}
+
+    await telegram_webhook._setup_task
+    assert telegram_webhook.stats()['webhook']['status'] == 'timeout'
+
+@pytest.mark.asyncio
+async def test_process_message_local_dispatch():
+    """При наличии chat_handler сообщение обрабатывается без HTTP"""
+    chat_handler = AsyncMock(return_value={"message": "Local response"})
+    webhook = Neon_Nexus_AI_bot_webhook(
+        token="test_token",
+        webhook_url="https://test.com/webhook",
+        service_url="https://unreachable.invalid",
+        chat_handler=chat_handler
+    )
+
+    assert await webhook.process_message("hello") == "Local response"
+    chat_handler.assert_awaited_once_with("hello")
+    assert webhook.session is None
+
+@pytest.mark.asyncio
+async def test_process_message_local_dispatch_error():
+    """Ошибка пайплайна не роняет обработку апдейта"""
+    webhook = Neon_Nexus_AI_bot_webhook(
+        token="test_token",
+        webhook_url="https://test.com/webhook",
+        service_url="https://test.com",
+        chat_handler=AsyncMock(side_effect=Exception("Groq down"))
+    )
+
+    assert await webhook.process_message("hello") == "Neural interface malfunction"
+
+@pytest.mark.asyncio
+async def test_webhook_dedupe_shared_between_workers():
+    """С Redis повтор, доставленный в другой воркер, тоже отбрасывается"""
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    workers = [
+        Neon_Nexus_AI_bot_webhook(
+            token="test_token",
+            webhook_url="https://test.com/webhook",
+            service_url="https://test.com",
+            redis=fakeredis.FakeAsyncRedis(server=server)
+        )
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.process_message = AsyncMock(return_value="ok")
+        worker.send_telegram_message = AsyncMock(return_value=True)
+
+    # Переполненная очередь: отметка снимается, повторная доставка обрабатывается
+    with patch.object(workers[0].updates, 'submit', return_value=False):
+        assert (await workers[0].handle_webhook(make_update(7, 1, "hi"))).status == 503
+
+    assert (await workers[0].handle_webhook(make_update(7, 1, "hi"))).status == 200
+    assert (await workers[1].handle_webhook(make_update(7, 1, "hi"))).status == 200
+    for worker in workers:
+        await worker.updates.join()
+
+    assert workers[0].process_message.await_count == 1
+    workers[1].process_message.assert_not_called()
+    assert workers[1].stats()["duplicates"] == 1
+
+@pytest.mark.asyncio
+async def test_webhook_state_file_under_data_dir(tmp_path, monkeypatch):
+    """Файл состояния ведется только по TELEGRAM_WEBHOOK_STATE, относительно TELEGRAM_DATA_DIR"""
+    monkeypatch.chdir(tmp_path)
+
+    def make():
+        return Neon_Nexus_AI_bot_webhook(
+            token="test_token",
+            webhook_url="https://test.com/webhook",
+            service_url="https://test.com"
+        )
+
+    webhook = make()
+    assert webhook.state_file is None
+    await webhook._save_webhook_state()
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setenv('TELEGRAM_WEBHOOK_STATE', 'webhook.json')
+    monkeypatch.setenv('TELEGRAM_DATA_DIR', str(tmp_path / 'data'))
+    webhook = make()
+    assert webhook.state_file == str(tmp_path / 'data' / 'webhook.json')
+    await webhook._save_webhook_state()
+    assert (await make()._load_webhook_state())['url'] == "https://test.com/webhook"
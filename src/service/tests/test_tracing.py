@@ -0,0 +1,63 @@
+import pytest
+import asyncio
+from src.service.core.tracing import add_span_hook, annotate, end_trace, remove_span_hook, span, start_trace
+
+class TestTracing:
+    """Тесты спанов и заголовка Server-Timing"""
+
+    def test_nested_spans_and_server_timing(self) -> None:
+        trace = start_trace('test')
+        with span('groq', model='m') as outer:
+            annotate(attempts=2)
+            with span('neo') as inner:
+                pass
+
+        assert inner.parent_id == outer.span_id
+        timings = trace.timings()
+        assert timings['groq']['attempts'] == 2
+        assert timings['groq']['model'] == 'm'
+        assert 'neo' in timings
+
+        header = trace.server_timing()
+        assert header.startswith('groq;dur=')
+        assert 'desc="model=m attempts=2"' in header
+        assert ', neo;dur=' in header
+
+    def test_hooks_receive_finished_spans(self) -> None:
+        finished = []
+
+        def failing_hook(s) -> None:
+            raise RuntimeError("exporter down")
+
+        add_span_hook(finished.append)
+        add_span_hook(failing_hook)
+        try:
+            start_trace('test')
+            with pytest.raises(ValueError):
+                with span('parse'):
+                    raise ValueError("bad json")
+        finally:
+            remove_span_hook(finished.append)
+            remove_span_hook(failing_hook)
+
+        assert [s.name for s in finished] == ['parse']
+        assert finished[0].error == 'ValueError: bad json'
+        assert finished[0].end is not None
+
+    async def test_ended_trace_not_extended_by_inherited_tasks(self) -> None:
+        trace = start_trace('startup')
+        release = asyncio.Event()
+
+        async def background():
+            await release.wait()
+            with span('job') as job:
+                pass
+            return job
+
+        task = asyncio.create_task(background())
+        end_trace()
+        release.set()
+        job = await task
+
+        assert trace.finished and trace.spans == []
+        assert job.trace_id is None